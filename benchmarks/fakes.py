@@ -0,0 +1,303 @@
+import itertools
+import json
+import threading
+import time
+from collections import namedtuple
+
+# In-process stand-ins for the consumer's external services. They mimic only
+# the calls this repo makes, and can add a fixed latency per call so
+# network-bound stages behave realistically in benchmarks.
+
+FakeTopicPartition = namedtuple("FakeTopicPartition", ["topic", "partition"])
+FakeMessage = namedtuple("FakeMessage", ["topic", "partition", "offset", "value", "headers"])
+FakeRecordMetadata = namedtuple("FakeRecordMetadata", ["topic", "partition", "offset"])
+FakeIndexDescription = namedtuple("FakeIndexDescription", ["name", "dimension", "metric"])
+
+class FakeKafkaBroker:
+    """Topics as in-memory partition logs of raw bytes, shared by fake producers and consumers"""
+
+    def __init__(self, partitions=3):
+        self.partitions = partitions
+        self.logs = {}
+        self._lock = threading.Lock()
+
+    def topic_partitions(self, topic):
+        with self._lock:
+            for p in range(self.partitions):
+                self.logs.setdefault(FakeTopicPartition(topic, p), [])
+        return [FakeTopicPartition(topic, p) for p in range(self.partitions)]
+
+    def append(self, topic, value, key=None, headers=None, partition=None):
+        tps = self.topic_partitions(topic)
+        with self._lock:
+            if partition is None:
+                # Round-robin unkeyed messages, like the default partitioner
+                partition = hash(key) % len(tps) if key is not None else sum(len(self.logs[tp]) for tp in tps) % len(tps)
+            log = self.logs[tps[partition]]
+            message = FakeMessage(topic, partition, len(log), value, list(headers or []))
+            log.append(message)
+            return message
+
+class _FakeFuture:
+    def __init__(self, metadata):
+        self._metadata = metadata
+
+    def get(self, timeout=None):
+        return self._metadata
+
+class FakeKafkaProducer:
+    def __init__(self, broker):
+        self.broker = broker
+
+    def send(self, topic, value=None, key=None, headers=None, partition=None):
+        message = self.broker.append(topic, value, key=key, headers=headers, partition=partition)
+        return _FakeFuture(FakeRecordMetadata(topic, message.partition, message.offset))
+
+    def flush(self, timeout=None):
+        pass
+
+    def close(self, timeout=None):
+        pass
+
+def _json_value(raw):
+    return json.loads(raw.decode("utf-8"))
+
+class FakeKafkaConsumer:
+    """
+    Consumes from a FakeKafkaBroker. Given payloads, it pre-loads them
+    round-robin across the topic's partitions.
+    """
+
+    def __init__(self, topic, payloads=(), partitions=3, max_poll_records=50, broker=None, value_deserializer=_json_value):
+        self.broker = broker or FakeKafkaBroker(partitions)
+        self.max_poll_records = max_poll_records
+        self.value_deserializer = value_deserializer
+        for payload in payloads:
+            self.broker.append(topic, json.dumps(payload).encode("utf-8"))
+        self._topics = []
+        self._position = {}
+        self._paused = set()
+        self.committed = {}
+        self.subscribe([topic])
+
+    def subscribe(self, topics, listener=None):
+        self._topics = list(topics)
+        for topic in self._topics:
+            for tp in self.broker.topic_partitions(topic):
+                self._position.setdefault(tp, self.committed.get(tp, 0))
+
+    def assignment(self):
+        return set(self._position)
+
+    def subscription(self):
+        return set(self._topics)
+
+    def poll(self, timeout_ms=0, max_records=None):
+        limit = max_records or self.max_poll_records
+        batch = {}
+        for tp in sorted(self._position):
+            if tp in self._paused or limit <= 0:
+                continue
+            start = self._position[tp]
+            messages = self.broker.logs[tp][start:start + limit]
+            if messages:
+                batch[tp] = [m._replace(value=self.value_deserializer(m.value)) for m in messages]
+                self._position[tp] += len(messages)
+                limit -= len(messages)
+        if not batch:
+            time.sleep(min(timeout_ms, 10) / 1000)
+        return batch
+
+    def seek(self, tp, offset):
+        self._position[tp] = offset
+
+    def pause(self, *partitions):
+        self._paused.update(partitions)
+
+    def resume(self, *partitions):
+        self._paused.difference_update(partitions)
+
+    def paused(self):
+        return set(self._paused)
+
+    def end_offsets(self, partitions):
+        return {tp: len(self.broker.logs.get(tp, [])) for tp in partitions}
+
+    def highwater(self, tp):
+        return len(self.broker.logs.get(tp, []))
+
+    def position(self, tp):
+        return self._position[tp]
+
+    def commit(self, offsets=None):
+        for tp, meta in (offsets or {}).items():
+            self.committed[tp] = getattr(meta, "offset", meta)
+
+    def drained(self):
+        """True once every message has been committed"""
+        return all(self.committed.get(tp, 0) >= len(self.broker.logs[tp]) for tp in self._position)
+
+    def close(self):
+        pass
+
+class FakeGCS:
+    """Object store backed by a dict, exposing the gcs.downloader functions the pipeline uses"""
+
+    def __init__(self, objects=None, latency=0.0):
+        self.objects = dict(objects or {})
+        self.latency = latency
+        self.bytes_downloaded = 0
+        self._generations = itertools.count(1)
+        self._meta = {name: next(self._generations) for name in self.objects}
+
+    def put(self, name, data):
+        self.objects[name] = data
+        self._meta[name] = next(self._generations)
+
+    def download_pdf_bytes(self, bucket_name, file_name, chunk_size=None, generation=None):
+        time.sleep(self.latency)
+        data = self.objects[file_name]
+        self.bytes_downloaded += len(data)
+        return data
+
+    def download_pdf_from_gcs(self, bucket_name, file_name, local_path):
+        with open(local_path, "wb") as f:
+            f.write(self.download_pdf_bytes(bucket_name, file_name))
+
+    def get_object_fingerprint(self, bucket_name, file_name):
+        time.sleep(self.latency)
+        if file_name not in self.objects:
+            return None, None
+        return self._meta[file_name], None
+
+    def list_objects(self, bucket_name, prefix=None, page_size=1000):
+        for name in sorted(self.objects):
+            if not prefix or name.startswith(prefix):
+                yield name, self._meta[name], None
+
+class FakeDocumentStore:
+    """Replaces the Postgres writes: assigns document ids and remembers fingerprints"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.documents = {}
+        self.fingerprints = {}
+        self.embedded = set()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def run_with_connection(self, fn, retries=0):
+        return fn(None)
+
+    def is_already_ingested(self, db_connection, fingerprint):
+        key = (fingerprint["bucket"], fingerprint["object_name"])
+        stored = self.fingerprints.get(key)
+        return stored is not None and stored[0] == fingerprint["generation"] and key + (stored[0],) in self.embedded
+
+    def mark_embedded(self, db_connection, fingerprints):
+        with self._lock:
+            for fingerprint in fingerprints:
+                self.embedded.add((fingerprint["bucket"], fingerprint["object_name"], fingerprint["generation"]))
+
+    def store_in_database(self, db_connection, document_data, file_name, fingerprint=None):
+        time.sleep(self.latency)
+        with self._lock:
+            key = (fingerprint["bucket"], fingerprint["object_name"]) if fingerprint else None
+            document_id = self.fingerprints[key][1] if key in self.fingerprints else next(self._ids)
+            self.documents[document_id] = document_data
+            if key:
+                fingerprint["replaced"] = key in self.fingerprints
+                self.fingerprints[key] = (fingerprint["generation"], document_id)
+        return document_id
+
+    def store_documents(self, db_connection, documents):
+        time.sleep(self.latency)
+        ids = []
+        for document_data, file_name, fingerprint in documents:
+            with self._lock:
+                key = (fingerprint["bucket"], fingerprint["object_name"]) if fingerprint else None
+                document_id = self.fingerprints[key][1] if key in self.fingerprints else next(self._ids)
+                self.documents[document_id] = document_data
+                if key:
+                    fingerprint["replaced"] = key in self.fingerprints
+                    self.fingerprints[key] = (fingerprint["generation"], document_id)
+            ids.append(document_id)
+        return ids
+
+class FakeIndex:
+    def __init__(self, store, latency):
+        self._store = store
+        self._latency = latency
+
+    def upsert(self, vectors, namespace=None):
+        time.sleep(self._latency)
+        with self._store.lock:
+            for vector in vectors:
+                self._store.vectors[vector["id"]] = vector
+            self._store.upsert_requests += 1
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids=None, namespace=None):
+        with self._store.lock:
+            for vector_id in ids or []:
+                self._store.vectors.pop(vector_id, None)
+
+    def list(self, prefix=None, namespace=None, limit=100):
+        """Pages of vector ids, like a serverless index"""
+        with self._store.lock:
+            ids = sorted(vector_id for vector_id in self._store.vectors if vector_id.startswith(prefix or ""))
+        for start in range(0, len(ids), limit):
+            yield ids[start:start + limit]
+
+    def describe_index_stats(self):
+        time.sleep(self._latency)
+        return {"total_vector_count": len(self._store.vectors)}
+
+class _IndexList(list):
+    def names(self):
+        return list(self)
+
+class FakePinecone:
+    """
+    Drop-in for the pinecone.Pinecone class. All instances share class-level
+    state, so vectors written through one client are visible to the next.
+    """
+    vectors = {}
+    indexes = {}
+    upsert_requests = 0
+    latency = 0.0
+    lock = threading.Lock()
+
+    def __init__(self, api_key=None, **kwargs):
+        pass
+
+    @classmethod
+    def reset(cls, latency=0.0):
+        cls.vectors = {}
+        cls.indexes = {}
+        cls.upsert_requests = 0
+        cls.latency = latency
+
+    def list_indexes(self):
+        return _IndexList(self.indexes)
+
+    def create_index(self, name, dimension, metric="cosine", spec=None):
+        type(self).indexes[name] = dimension
+
+    def describe_index(self, name):
+        return FakeIndexDescription(name, self.indexes[name], "cosine")
+
+    def Index(self, name):
+        return FakeIndex(type(self), self.latency)
+
+class FakeEmbeddingLatency:
+    """Wraps an embedding backend and adds per-request latency"""
+
+    def __init__(self, backend, latency=0.0):
+        self.backend = backend
+        self.model = backend.model
+        self.latency = latency
+
+    def embed_batch(self, texts):
+        time.sleep(self.latency)
+        return self.backend.embed_batch(texts)
@@ -0,0 +1,301 @@
+"""
+Offline throughput benchmarks for the consumer pipeline.
+
+    python -m benchmarks.runner stages --docs 50 --comments 40
+    python -m benchmarks.runner e2e --docs 200 --pipeline staged --save baseline.json
+    python -m benchmarks.runner e2e --docs 200 --pipeline batched --compare baseline.json
+
+Kafka, GCS, OpenAI and Pinecone are replaced by the in-process fakes in
+benchmarks.fakes; Postgres is faked too unless --postgres is given, in
+which case the DB_* settings must point at a local instance with the
+trace schema. --vector-store local writes to a LocalVectorStore in a
+temporary directory instead of the fake Pinecone.
+"""
+import os
+
+# Settings are read at import time, so defaults for the fakes go in first
+os.environ.setdefault("PINECONE_API_KEY", "bench")
+os.environ.setdefault("PINECONE_INDEX", "bench-index")
+os.environ.setdefault("PINECONE_ENVIRONMENT", "us-east-1-aws")
+os.environ.setdefault("PDF_DOWNLOAD_MODE", "memory")
+os.environ.setdefault("EMBEDDING_BACKEND", "fake")
+os.environ.setdefault("KAFKA_TOPIC_NAME", "bench-topic")
+
+import argparse
+import json
+import logging
+import queue
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from benchmarks.fakes import (
+    FakeKafkaConsumer, FakeGCS, FakeDocumentStore, FakePinecone, FakeEmbeddingLatency
+)
+from benchmarks.synthetic_pdf import generate_corpus
+from config.settings import PINECONE_INDEX, PIPELINE_QUEUE_SIZE
+from config.settings import PIPELINE_BATCH_SIZE, PIPELINE_BATCH_WINDOW_SECONDS, PIPELINE_BATCH_WORKERS
+from embedding.embedder import FakeEmbeddingBackend, set_embedding_backend, embed_texts
+from embedding.chunker import chunk_document_data
+from embedding.profile import get_embedding_profile
+import embedding.pinecone_uploader as pinecone_uploader
+import embedding.vector_store as vector_store
+from parser.pdf_text_extractor import extract_text_from_pdf_bytes
+from parser.trace_cleaner import process_pdf_text, extract_metadata_from_filename
+from parser.worker_pool import shutdown_parse_pool
+from monitoring.profiling import get_profiler, traced
+from pipeline.offsets import OffsetTracker
+from pipeline.staged import StagedPipeline
+from pipeline.batching import MicroBatcher
+import pipeline.stages as stages
+
+logger = logging.getLogger('kafka-pdf-consumer')
+
+STAGE_FUNCTIONS = ["fingerprint_stage", "download_stage", "extract_parse_stage", "store_stage", "embed_stage", "run_batch"]
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def summarize(durations):
+    return {
+        "count": len(durations),
+        "p50_ms": round(percentile(durations, 50) * 1000, 2),
+        "p99_ms": round(percentile(durations, 99) * 1000, 2),
+        "total_s": round(sum(durations), 3),
+    }
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+def install_fakes(args, gcs, store):
+    stages.download_pdf_bytes = gcs.download_pdf_bytes
+    stages.download_pdf_from_gcs = gcs.download_pdf_from_gcs
+    stages.get_object_fingerprint = gcs.get_object_fingerprint
+    if not args.postgres:
+        stages.run_with_connection = store.run_with_connection
+        stages.store_in_database = store.store_in_database
+        stages.store_documents = store.store_documents
+        stages.is_already_ingested = store.is_already_ingested
+        stages.mark_embedded = store.mark_embedded
+
+    FakePinecone.reset(latency=args.upsert_latency)
+    FakePinecone.indexes[PINECONE_INDEX] = get_embedding_profile().dimensions
+    pinecone_uploader.Pinecone = FakePinecone
+    vector_store.VECTOR_STORE_BACKEND = args.vector_store
+    if args.vector_store == "local":
+        vector_store.LOCAL_VECTOR_STORE_PATH = tempfile.mkdtemp(prefix="bench-vectors-")
+    backend = FakeEmbeddingBackend(dimension=get_embedding_profile().dimensions)
+    set_embedding_backend(FakeEmbeddingLatency(backend, latency=args.embed_latency))
+
+def install_stage_timers(timings):
+    for name in STAGE_FUNCTIONS:
+        fn = getattr(stages, name)
+
+        def timed(job, _fn=fn, _name=name):
+            started = time.perf_counter()
+            try:
+                return _fn(job)
+            finally:
+                timings[_name.replace("_stage", "")].append(time.perf_counter() - started)
+
+        setattr(stages, name, timed)
+
+def build_corpus(args):
+    started = time.perf_counter()
+    corpus = generate_corpus(args.docs, args.comments, args.words, seed=args.seed)
+    size = sum(len(data) for _, data in corpus)
+    print(f"Generated {len(corpus)} PDFs ({size / 1024 / 1024:.1f} MB) in {time.perf_counter() - started:.1f}s")
+    return corpus
+
+def run_stages(args, corpus):
+    """Time each stage in isolation on the calling thread"""
+    timings = defaultdict(list)
+    started = time.perf_counter()
+    for file_name, pdf_bytes in corpus:
+        t = time.perf_counter()
+        text = extract_text_from_pdf_bytes(pdf_bytes)
+        timings["extract"].append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        parsed = process_pdf_text(text)
+        parsed["course_info"].update(extract_metadata_from_filename(file_name))
+        timings["parse"].append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        chunks = chunk_document_data({
+            "document_id": len(timings["chunk"]) + 1,
+            "document_name": file_name,
+            "full_text": parsed["full_text"],
+            "comments": parsed["comments"],
+            "ratings": parsed["ratings"],
+            "professor": parsed["course_info"].get("instructor", "Unknown"),
+        })
+        timings["chunk"].append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        embed_texts([c["text"] for c in chunks])
+        timings["embed"].append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        vector_store.upload_chunks(chunks)
+        timings["embed_upsert"].append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "docs": len(corpus),
+        "seconds": round(elapsed, 3),
+        "docs_per_sec": round(len(corpus) / elapsed, 2),
+        "stages": {name: summarize(values) for name, values in timings.items()},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def run_e2e(args, corpus):
+    """Drive the real pipeline from a fake Kafka topic until every offset is committed"""
+    timings = defaultdict(list)
+    install_stage_timers(timings)
+
+    consumer = FakeKafkaConsumer("bench-topic", [{"bucket": "bench", "file": name} for name, _ in corpus])
+    tracker = OffsetTracker()
+    completed = queue.Queue()
+    submitted_at = {}
+    latencies = []
+
+    def on_complete(job, error):
+        stages.cleanup_job(job)
+        get_profiler().finish(job.pop("trace", None), error)
+        latencies.append(time.perf_counter() - submitted_at[(job["tp"], job["offset"])])
+        completed.put((job["tp"], job["offset"]))
+
+    pipeline = None
+    batcher = None
+    if args.pipeline == "batched":
+        batcher = MicroBatcher(
+            traced("store_embed_batch", stages.run_batch), on_complete,
+            max_size=PIPELINE_BATCH_SIZE, max_wait=PIPELINE_BATCH_WINDOW_SECONDS,
+            workers=PIPELINE_BATCH_WORKERS, queue_size=PIPELINE_QUEUE_SIZE
+        )
+        batcher.start()
+
+        def on_parsed(job, error):
+            if error is not None or job.get("skipped"):
+                on_complete(job, error)
+            else:
+                batcher.submit(job)
+
+        pipeline = StagedPipeline(stages.build_stages(batched=True), on_complete=on_parsed, queue_size=PIPELINE_QUEUE_SIZE)
+        pipeline.start()
+    elif args.pipeline == "staged":
+        pipeline = StagedPipeline(stages.build_stages(), on_complete=on_complete, queue_size=PIPELINE_QUEUE_SIZE)
+        pipeline.start()
+
+    started = time.perf_counter()
+    while not consumer.drained():
+        while not completed.empty():
+            tracker.mark_done(*completed.get())
+        consumer.commit(tracker.pop_committable())
+
+        for tp, messages in consumer.poll(timeout_ms=100).items():
+            for message in messages:
+                tracker.add(tp, message.offset)
+                job = stages.make_job(message.value, None, tp.partition, message.offset)
+                job["tp"], job["offset"] = tp, message.offset
+                submitted_at[(tp, message.offset)] = time.perf_counter()
+                job["trace"] = get_profiler().start(job["file_name"])
+                if pipeline is not None:
+                    pipeline.submit(job)
+                else:
+                    error = None
+                    try:
+                        stages.run_job(job)
+                    except Exception as e:
+                        logger.error(f"❌ Error processing file {job['file_name']}: {e}")
+                        error = e
+                    on_complete(job, error)
+    elapsed = time.perf_counter() - started
+
+    if pipeline is not None:
+        pipeline.shutdown()
+    if batcher is not None:
+        batcher.shutdown()
+    shutdown_parse_pool()
+
+    return {
+        "docs": len(corpus),
+        "pipeline": args.pipeline,
+        "seconds": round(elapsed, 3),
+        "docs_per_sec": round(len(corpus) / elapsed, 2),
+        "latency": summarize(latencies),
+        "stages": {name: summarize(values) for name, values in timings.items()},
+        "vectors": len(FakePinecone.vectors) if args.vector_store == "pinecone" else len(vector_store.get_vector_store()),
+        "upsert_requests": FakePinecone.upsert_requests,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def compare(result, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path}:")
+    for key in ("docs_per_sec", "seconds"):
+        before, after = baseline.get(key), result.get(key)
+        if before:
+            print(f"  {key}: {before} -> {after} ({(after - before) / before * 100:+.1f}%)")
+    for name, stats in result["stages"].items():
+        before = baseline.get("stages", {}).get(name, {}).get("p50_ms")
+        if before:
+            print(f"  {name} p50: {before}ms -> {stats['p50_ms']}ms ({(stats['p50_ms'] - before) / before * 100:+.1f}%)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the TRACE consumer pipeline")
+    parser.add_argument("mode", choices=["stages", "e2e"])
+    parser.add_argument("--docs", type=int, default=50)
+    parser.add_argument("--comments", type=int, default=20, help="comments per open-ended question")
+    parser.add_argument("--words", type=int, default=25, help="maximum words per comment")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pipeline", choices=["sequential", "staged", "batched"], default="staged")
+    parser.add_argument("--gcs-latency", type=float, default=0.05, help="seconds per GCS call")
+    parser.add_argument("--db-latency", type=float, default=0.01, help="seconds per fake DB write")
+    parser.add_argument("--embed-latency", type=float, default=0.2, help="seconds per embeddings request")
+    parser.add_argument("--upsert-latency", type=float, default=0.05, help="seconds per Pinecone call")
+    parser.add_argument("--vector-store", choices=["pinecone", "local"], default="pinecone")
+    parser.add_argument("--profile", type=float, metavar="RATE", help="turn profiling on, sampling this fraction of messages")
+    parser.add_argument("--postgres", action="store_true", help="write to the Postgres in DB_CONFIG")
+    parser.add_argument("--save", help="write results as JSON")
+    parser.add_argument("--compare", help="compare against a saved JSON result")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, handlers=[logging.StreamHandler(sys.stderr)])
+
+    corpus = build_corpus(args)
+    gcs = FakeGCS(corpus, latency=args.gcs_latency)
+    store = FakeDocumentStore(latency=args.db_latency)
+    install_fakes(args, gcs, store)
+    if args.profile is not None:
+        profiler = get_profiler()
+        profiler.enabled, profiler.sample_rate = True, args.profile
+
+    try:
+        result = run_stages(args, corpus) if args.mode == "stages" else run_e2e(args, corpus)
+    finally:
+        vector_store.close_vector_stores()
+        if args.vector_store == "local":
+            shutil.rmtree(vector_store.LOCAL_VECTOR_STORE_PATH, ignore_errors=True)
+    print(json.dumps(result, indent=2))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        compare(result, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import random
+import textwrap
+from parser.trace_cleaner import PREDEFINED_QUESTIONS
+
+FIRST_NAMES = ["Alex", "Jordan", "Priya", "Wei", "Maria", "Samuel", "Aisha", "Kenji"]
+LAST_NAMES = ["Smith", "Patel", "Chen", "Garcia", "Okafor", "Nguyen", "Miller", "Rossi"]
+COURSES = [
+    ("CSYE", "7125", "Advanced Cloud Computing"),
+    ("INFO", "6150", "Web Design and User Experience"),
+    ("CS", "5200", "Database Management Systems"),
+    ("DAMG", "6210", "Data Management and Database Design"),
+]
+RATING_SECTIONS = {
+    "Course Related Questions": [
+        "The syllabus was accurate and helpful in delineating expectations",
+        "Required and additional course materials were helpful",
+        "Online course materials were organized to help me navigate",
+    ],
+    "Learning Related Questions": [
+        "I learned a lot in this course",
+        "The course helped me to develop new skills",
+    ],
+    "Instructor Related Questions": [
+        "The instructor came to class prepared to teach",
+        "The instructor clearly communicated ideas and information",
+        "The instructor treated students with respect",
+    ],
+}
+WORDS = (
+    "lectures assignments clear helpful examples project feedback office hours pace "
+    "difficult interesting labs cloud kubernetes terraform exams grading slides "
+    "engaging practical responsive organized workload deadlines teamwork real world"
+).split()
+
+def synthetic_file_name(rng, index):
+    """A name that extract_metadata_from_filename() accepts"""
+    last, first = rng.choice(LAST_NAMES), rng.choice(FIRST_NAMES)
+    subject, number, _ = rng.choice(COURSES)
+    semester = rng.choice(["Spring", "Fall"])
+    year = rng.choice(range(2019, 2026))
+    return f"{last}_{first}_{100000 + index}_{semester}-{year}_{subject}{number}_Course-Evaluation.pdf"
+
+def synthetic_report_lines(rng, comments_per_question=20, words_per_comment=25):
+    subject, number, title = rng.choice(COURSES)
+    semester = rng.choice(["Spring", "Fall"])
+    enrollment = rng.randint(20, 120)
+    responses = rng.randint(5, enrollment)
+
+    lines = [
+        "Student TRACE Evaluation Report",
+        f"{subject} {number} {title} ({semester} {rng.randint(2019, 2025)})",
+        f"Instructor: {rng.choice(LAST_NAMES)}, {rng.choice(FIRST_NAMES)}",
+        f"Subject: {subject}",
+        f"Catalog & Section: {number} {rng.randint(1, 9):02d}",
+        f"Enrollment: {enrollment}",
+        f"Responses Incl Declines: {responses}",
+        f"Declines: {rng.randint(0, 3)}",
+    ]
+    for section, questions in RATING_SECTIONS.items():
+        lines.append(section)
+        lines.append("Question Number of Responses Response Rate Course Mean Dept. Mean Univ. Mean")
+        for question in questions:
+            means = " ".join(f"{rng.uniform(3.0, 5.0):.2f}" for _ in range(3))
+            lines.append(f"{question} {responses} {round(100 * responses / enrollment)}% {means}")
+        lines.append("Note: 5: Strongly agree; 1: Strongly disagree")
+
+    for question in PREDEFINED_QUESTIONS:
+        lines.append(f"Q: {question}")
+        for n in range(1, comments_per_question + 1):
+            words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, words_per_comment)))
+            lines.append(f"{n} {words.capitalize()}.")
+    return lines
+
+def synthetic_report_text(seed=0, comments_per_question=20, words_per_comment=25):
+    """The text PyMuPDF would extract, for parser-only benchmarks"""
+    rng = random.Random(seed)
+    return "\n".join(synthetic_report_lines(rng, comments_per_question, words_per_comment)) + "\n"
+
+def synthetic_report_pdf(seed=0, comments_per_question=20, words_per_comment=25):
+    """Render a synthetic TRACE report to PDF bytes"""
+    import fitz
+
+    rng = random.Random(seed)
+    lines = synthetic_report_lines(rng, comments_per_question, words_per_comment)
+
+    doc = fitz.open()
+    line_height, margin, max_chars = 11, 40, 110
+    page, y = None, None
+    for line in lines:
+        # Wrap long comments the way a real export would
+        for piece in textwrap.wrap(line, max_chars):
+            if page is None or y > page.rect.height - margin:
+                page = doc.new_page()
+                y = margin
+            page.insert_text((margin, y), piece, fontsize=8)
+            y += line_height
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+def generate_corpus(count, comments_per_question=20, words_per_comment=25, seed=0):
+    """Return [(file_name, pdf_bytes)] for count synthetic reports"""
+    rng = random.Random(seed)
+    return [
+        (synthetic_file_name(rng, i), synthetic_report_pdf(seed + i, comments_per_question, words_per_comment))
+        for i in range(count)
+    ]
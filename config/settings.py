@@ -22,4 +22,142 @@ PINECONE_INDEX = os.environ.get("PINECONE_INDEX")
 KAFKA_BOOTSTRAP_SERVERS = os.environ.get("KAFKA_BOOTSTRAP_SERVERS")
 KAFKA_TOPIC_NAME = os.environ.get("KAFKA_TOPIC_NAME")
 LOCAL_PDF_DIR = os.environ.get("LOCAL_PDF_DIR")
-KAFKA_GROUP_ID = os.environ.get("KAFKA_GROUP_ID")
\ No newline at end of file
+KAFKA_GROUP_ID = os.environ.get("KAFKA_GROUP_ID")
+# Pipeline mode: "sequential" processes one message at a time, "staged" runs
+# download/parse/store/embed as concurrent stages with bounded queues between
+# them, "batched" is staged up to parsing and then stores and embeds parsed
+# documents in micro-batches of up to PIPELINE_BATCH_SIZE documents, or
+# whatever has arrived within PIPELINE_BATCH_WINDOW_SECONDS
+PIPELINE_MODE = os.environ.get("PIPELINE_MODE", "sequential")
+PIPELINE_DOWNLOAD_WORKERS = int(os.environ.get("PIPELINE_DOWNLOAD_WORKERS", "4"))
+PIPELINE_PARSE_WORKERS = int(os.environ.get("PIPELINE_PARSE_WORKERS", str(os.cpu_count() or 1)))
+PIPELINE_DB_WORKERS = int(os.environ.get("PIPELINE_DB_WORKERS", "2"))
+PIPELINE_EMBED_WORKERS = int(os.environ.get("PIPELINE_EMBED_WORKERS", "4"))
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", "16"))
+PIPELINE_MAX_IN_FLIGHT = int(os.environ.get("PIPELINE_MAX_IN_FLIGHT", "64"))
+PIPELINE_BATCH_SIZE = int(os.environ.get("PIPELINE_BATCH_SIZE", "32"))
+PIPELINE_BATCH_WINDOW_SECONDS = float(os.environ.get("PIPELINE_BATCH_WINDOW_SECONDS", "1.0"))
+PIPELINE_BATCH_WORKERS = int(os.environ.get("PIPELINE_BATCH_WORKERS", "2"))
+KAFKA_MAX_POLL_RECORDS = int(os.environ.get("KAFKA_MAX_POLL_RECORDS", "50"))
+
+# "memory" downloads PDFs into a bytes buffer and parses them without a temp
+# file; "file" keeps the old download-to-LOCAL_PDF_DIR behaviour
+PDF_DOWNLOAD_MODE = os.environ.get("PDF_DOWNLOAD_MODE", "memory")
+GCS_DOWNLOAD_CHUNK_BYTES = int(os.environ.get("GCS_DOWNLOAD_CHUNK_BYTES", str(8 * 1024 * 1024)))
+
+# Embeddings: "openai" calls the API, "fake" uses a deterministic local embedder
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "openai")
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "text-embedding-3-small")
+# OpenAI accepts up to 2048 inputs and 300k tokens per embeddings request
+EMBEDDING_MAX_BATCH_INPUTS = int(os.environ.get("EMBEDDING_MAX_BATCH_INPUTS", "2048"))
+EMBEDDING_MAX_BATCH_TOKENS = int(os.environ.get("EMBEDDING_MAX_BATCH_TOKENS", "250000"))
+# Embedding profile (see embedding.profile). EMBEDDING_DIMENSIONS shortens
+# text-embedding-3 vectors (e.g. 256 or 512; 0 keeps the model's size) and
+# the Pinecone index must be created with the same size. Values sent to
+# Pinecone are rounded to EMBEDDING_WIRE_PRECISION ("full", or "round7" /
+# "round4" decimal places) to shrink upsert payloads; Pinecone still
+# stores them as float32
+EMBEDDING_DIMENSIONS = int(os.environ.get("EMBEDDING_DIMENSIONS", "0"))
+EMBEDDING_WIRE_PRECISION = os.environ.get("EMBEDDING_WIRE_PRECISION", "full")
+
+# Local embedding cache (SQLite file); leave EMBEDDING_CACHE_PATH unset to disable.
+# Vectors are kept as float32, or float16 / int8 to fit more in the same space
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+EMBEDDING_CACHE_PRECISION = os.environ.get("EMBEDDING_CACHE_PRECISION", "float32")
+
+# Skip messages whose bucket/object/generation (or MD5) was already ingested
+SKIP_INGESTED_DOCUMENTS = os.environ.get("SKIP_INGESTED_DOCUMENTS", "true").lower() == "true"
+
+# Postgres connection pool shared by all pipeline workers
+DB_POOL_MIN_CONNECTIONS = int(os.environ.get("DB_POOL_MIN_CONNECTIONS", "1"))
+DB_POOL_MAX_CONNECTIONS = int(os.environ.get("DB_POOL_MAX_CONNECTIONS", "8"))
+DB_RECONNECT_RETRIES = int(os.environ.get("DB_RECONNECT_RETRIES", "3"))
+# Row count above which inserts switch from execute_values to COPY FROM STDIN
+DB_COPY_THRESHOLD = int(os.environ.get("DB_COPY_THRESHOLD", "500"))
+
+# "process" runs PDF extraction + parsing in PIPELINE_PARSE_WORKERS worker
+# processes; "inline" runs it on the calling thread
+PARSE_WORKER_MODE = os.environ.get("PARSE_WORKER_MODE", "process")
+PARSE_WORKER_MAX_JOBS = int(os.environ.get("PARSE_WORKER_MAX_JOBS", "50"))
+PARSE_JOB_TIMEOUT_SECONDS = float(os.environ.get("PARSE_JOB_TIMEOUT_SECONDS", "120"))
+
+# Per-document memory bounds: reports whose extracted text is longer than
+# PDF_MAX_TEXT_CHARS are rejected, and parse workers get an address-space
+# limit (0 disables it) so one runaway PDF fails its job instead of OOM-killing the pod
+PDF_MAX_TEXT_CHARS = int(os.environ.get("PDF_MAX_TEXT_CHARS", "20000000"))
+PARSE_WORKER_MEMORY_LIMIT_MB = int(os.environ.get("PARSE_WORKER_MEMORY_LIMIT_MB", "0"))
+
+# Raw extracted text is kept zlib-compressed (trace.document_raw_text) so a
+# parser change can be rolled out with python -m pipeline.reprocess instead
+# of downloading and extracting every PDF again
+RAW_TEXT_STORE_ENABLED = os.environ.get("RAW_TEXT_STORE_ENABLED", "true").lower() == "true"
+RAW_TEXT_COMPRESSION_LEVEL = int(os.environ.get("RAW_TEXT_COMPRESSION_LEVEL", "6"))
+
+# Prometheus-style metrics endpoint (0 disables it)
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9100"))
+METRICS_LAG_INTERVAL_SECONDS = float(os.environ.get("METRICS_LAG_INTERVAL_SECONDS", "5"))
+
+# /healthz fails once neither the poll loop nor any pipeline stage has made
+# progress for this long, so it must exceed the slowest single stage (a parse
+# can take PARSE_JOB_TIMEOUT_SECONDS); /readyz (same port) turns 200 once
+# every client has connected
+LIVENESS_TIMEOUT_SECONDS = float(os.environ.get("LIVENESS_TIMEOUT_SECONDS", "300"))
+
+# Profiling mode (also toggled at runtime with SIGUSR2): every message gets
+# per-stage timings and is logged when slower than PROFILE_SLOW_MESSAGE_SECONDS;
+# PROFILE_SAMPLE_RATE of them are also run under cProfile (and tracemalloc
+# when PROFILE_TRACEMALLOC is on), with the results written to PROFILE_DIR
+PROFILE_ENABLED = os.environ.get("PROFILE_ENABLED", "false").lower() == "true"
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0.05"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_TRACEMALLOC = os.environ.get("PROFILE_TRACEMALLOC", "true").lower() == "true"
+PROFILE_TOP_ALLOCATIONS = int(os.environ.get("PROFILE_TOP_ALLOCATIONS", "10"))
+PROFILE_SLOW_MESSAGE_SECONDS = float(os.environ.get("PROFILE_SLOW_MESSAGE_SECONDS", "30"))
+
+# Pinecone upserts: requests are packed by estimated payload size (the API
+# caps a request at 2 MB and 1000 vectors) and sent with bounded parallelism
+PINECONE_UPSERT_PARALLELISM = int(os.environ.get("PINECONE_UPSERT_PARALLELISM", "4"))
+PINECONE_MAX_REQUEST_BYTES = int(os.environ.get("PINECONE_MAX_REQUEST_BYTES", str(1536 * 1024)))
+PINECONE_MAX_BATCH_VECTORS = int(os.environ.get("PINECONE_MAX_BATCH_VECTORS", "1000"))
+PINECONE_STATS_INTERVAL_SECONDS = float(os.environ.get("PINECONE_STATS_INTERVAL_SECONDS", "300"))
+
+# Vector store: "pinecone", or "local" for a memory-mapped NumPy store in
+# LOCAL_VECTOR_STORE_PATH (float32, float16 to halve its size, or int8 to
+# quarter it)
+VECTOR_STORE_BACKEND = os.environ.get("VECTOR_STORE_BACKEND", "pinecone")
+LOCAL_VECTOR_STORE_PATH = os.environ.get("LOCAL_VECTOR_STORE_PATH", "vector_store")
+LOCAL_VECTOR_STORE_DTYPE = os.environ.get("LOCAL_VECTOR_STORE_DTYPE", "float32")
+
+# Where python -m embedding.reindex records how far it got
+REINDEX_CHECKPOINT_PATH = os.environ.get("REINDEX_CHECKPOINT_PATH", "reindex_checkpoint.json")
+
+# python -m pipeline.bulk_import records each object's outcome here so a
+# rerun only picks up what is left
+BULK_IMPORT_MANIFEST_PATH = os.environ.get("BULK_IMPORT_MANIFEST_PATH", "bulk_import_manifest.jsonl")
+
+# Chunk sizes in estimated tokens (see embedding.embedder.estimate_tokens):
+# small pieces are packed up to the target, nothing exceeds the max, and
+# long text is split into windows that overlap by CHUNK_OVERLAP_TOKENS
+CHUNK_TARGET_TOKENS = int(os.environ.get("CHUNK_TARGET_TOKENS", "512"))
+CHUNK_MAX_TOKENS = int(os.environ.get("CHUNK_MAX_TOKENS", "1024"))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", "64"))
+
+# Client-side limits for external services (0 disables a limit). Set the
+# OpenAI numbers to the account's quota; throttled and failed calls are
+# retried with jittered exponential backoff, honouring retry-after
+OPENAI_REQUESTS_PER_MINUTE = int(os.environ.get("OPENAI_REQUESTS_PER_MINUTE", "3000"))
+OPENAI_TOKENS_PER_MINUTE = int(os.environ.get("OPENAI_TOKENS_PER_MINUTE", "1000000"))
+OPENAI_MAX_CONCURRENCY = int(os.environ.get("OPENAI_MAX_CONCURRENCY", "8"))
+PINECONE_REQUESTS_PER_MINUTE = int(os.environ.get("PINECONE_REQUESTS_PER_MINUTE", "0"))
+PINECONE_MAX_CONCURRENCY = int(os.environ.get("PINECONE_MAX_CONCURRENCY", "8"))
+EXTERNAL_MAX_RETRIES = int(os.environ.get("EXTERNAL_MAX_RETRIES", "6"))
+EXTERNAL_BACKOFF_BASE_SECONDS = float(os.environ.get("EXTERNAL_BACKOFF_BASE_SECONDS", "0.5"))
+EXTERNAL_BACKOFF_MAX_SECONDS = float(os.environ.get("EXTERNAL_BACKOFF_MAX_SECONDS", "60"))
+
+# Failed messages are retried through delayed retry topics
+# (<topic>.retry.1, .retry.2, ... one per delay) and end up on the
+# dead-letter topic once the delays run out
+RETRY_ENABLED = os.environ.get("RETRY_ENABLED", "true").lower() == "true"
+RETRY_DELAYS_SECONDS = [float(d) for d in os.environ.get("RETRY_DELAYS_SECONDS", "60,600,3600").split(",") if d.strip()]
+KAFKA_DLQ_TOPIC = os.environ.get("KAFKA_DLQ_TOPIC", f"{KAFKA_TOPIC_NAME}.dlq")
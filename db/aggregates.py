@@ -0,0 +1,125 @@
+"""
+Incrementally maintained rating aggregates (trace.rating_aggregates).
+
+Each ingestion adds the document's ratings to the running totals in the same
+transaction; replacing a document first takes its previous ratings back out.
+Read per-instructor / per-course averages from the trace.rating_summary view.
+
+    python -m db.aggregates rebuild
+"""
+import argparse
+from psycopg2.extras import execute_values
+from db.pool import run_with_connection, close_pool
+from db.schema import ensure_schema
+
+# (rating_count, response_count, mean_sum, weighted_mean_sum) per key
+_ZERO = (0, 0, 0.0, 0.0)
+
+def course_number_of(course_info):
+    catalog_section = course_info.get('catalog_section', '')
+    return f"{course_info.get('subject', '')} {catalog_section.split()[0]}" if catalog_section else ''
+
+def document_contributions(document_data):
+    """Totals this document adds, keyed by (instructor, course_number, semester, year, category)"""
+    course_info = document_data.get('course_info', {})
+    if not course_info:
+        return {}
+
+    totals = {}
+    for rating in document_data.get('ratings', []):
+        mean = rating.get('course_mean')
+        if mean is None:
+            continue
+        responses = rating.get('response_count') or 0
+        key = (
+            course_info.get('instructor', ''),
+            course_number_of(course_info),
+            course_info.get('semester', ''),
+            course_info.get('year', 0),
+            rating.get('category', '')
+        )
+        count, response_sum, mean_sum, weighted = totals.get(key, _ZERO)
+        totals[key] = (count + 1, response_sum + responses, mean_sum + mean, weighted + mean * responses)
+    return totals
+
+def stored_contributions(cursor, document_id):
+    """Totals a previously stored version of the document added, read back from its rows"""
+    cursor.execute("""
+        SELECT COALESCE(ci.instructor_name, ''), COALESCE(ci.course_number, ''), COALESCE(ci.semester, ''),
+               COALESCE(ci.year, 0), COALESCE(cr.category, ''),
+               count(*), COALESCE(sum(cr.response_count), 0),
+               sum(cr.course_mean), COALESCE(sum(cr.course_mean * cr.response_count), 0)
+        FROM trace.course_ratings cr
+        JOIN trace.course_info ci ON ci.document_id = cr.document_id
+        WHERE cr.document_id = %s AND cr.course_mean IS NOT NULL
+        GROUP BY 1, 2, 3, 4, 5
+    """, (document_id,))
+    return {tuple(row[:5]): (row[5], row[6], float(row[7]), float(row[8])) for row in cursor.fetchall()}
+
+def apply_deltas(cursor, deltas):
+    """Add (possibly negative) totals to the aggregate rows"""
+    rows = [key + values for key, values in sorted(deltas.items()) if values != _ZERO]
+    if not rows:
+        return
+    # Sorted keys: concurrent writers lock aggregate rows in the same order
+    execute_values(cursor, """
+        INSERT INTO trace.rating_aggregates
+        (instructor_name, course_number, semester, year, category, rating_count, response_count, mean_sum, weighted_mean_sum)
+        VALUES %s
+        ON CONFLICT (instructor_name, course_number, semester, year, category) DO UPDATE SET
+            rating_count = trace.rating_aggregates.rating_count + EXCLUDED.rating_count,
+            response_count = trace.rating_aggregates.response_count + EXCLUDED.response_count,
+            mean_sum = trace.rating_aggregates.mean_sum + EXCLUDED.mean_sum,
+            weighted_mean_sum = trace.rating_aggregates.weighted_mean_sum + EXCLUDED.weighted_mean_sum,
+            updated_at = now()
+    """, rows, page_size=len(rows))
+
+def remove_document_aggregates(cursor, document_id):
+    """Take a stored document's ratings out of the totals; call before its rows are deleted"""
+    previous = stored_contributions(cursor, document_id)
+    apply_deltas(cursor, {key: tuple(-v for v in values) for key, values in previous.items()})
+
+def add_document_aggregates(cursor, document_data):
+    apply_deltas(cursor, document_contributions(document_data))
+
+def rebuild_rating_aggregates(db_connection):
+    """Recompute every aggregate from trace.course_ratings in one transaction"""
+    cursor = db_connection.cursor()
+    try:
+        cursor.execute("LOCK TABLE trace.rating_aggregates IN EXCLUSIVE MODE")
+        cursor.execute("DELETE FROM trace.rating_aggregates")
+        cursor.execute("""
+            INSERT INTO trace.rating_aggregates
+            (instructor_name, course_number, semester, year, category, rating_count, response_count, mean_sum, weighted_mean_sum)
+            SELECT COALESCE(ci.instructor_name, ''), COALESCE(ci.course_number, ''), COALESCE(ci.semester, ''),
+                   COALESCE(ci.year, 0), COALESCE(cr.category, ''),
+                   count(*), COALESCE(sum(cr.response_count), 0),
+                   sum(cr.course_mean), COALESCE(sum(cr.course_mean * cr.response_count), 0)
+            FROM trace.course_ratings cr
+            JOIN trace.course_info ci ON ci.document_id = cr.document_id
+            WHERE cr.course_mean IS NOT NULL
+            GROUP BY 1, 2, 3, 4, 5
+        """)
+        rows = cursor.rowcount
+        db_connection.commit()
+        print(f"✅ Rebuilt rating aggregates: {rows} rows")
+        return rows
+    except Exception:
+        db_connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain trace.rating_aggregates")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args(argv)
+
+    try:
+        run_with_connection(ensure_schema)
+        run_with_connection(rebuild_rating_aggregates)
+    finally:
+        close_pool()
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,68 @@
-def store_in_database(db_connection, document_data, file_name):
-    cursor = db_connection.cursor()
-    try:
+import io
+import logging
+from psycopg2.extras import execute_values
+from db.fingerprints import lock_existing_document, record_fingerprint
+from db.aggregates import course_number_of, add_document_aggregates, remove_document_aggregates
+from db.raw_text import store_raw_text, delete_raw_text
+from db.pool import CONNECTION_ERRORS
+from config.settings import DB_COPY_THRESHOLD
+
+logger = logging.getLogger('kafka-pdf-consumer')
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    return (str(value)
+            .replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r'))
+
+def insert_rows(cursor, table, columns, rows):
+    """
+    Insert many rows in one round trip: a multi-row INSERT for typical
+    sizes, COPY FROM STDIN once the set is large enough for it to win.
+    """
+    if not rows:
+        return
+    column_list = ', '.join(columns)
+    if len(rows) >= DB_COPY_THRESHOLD:
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join(_copy_value(v) for v in row))
+            buffer.write('\n')
+        buffer.seek(0)
+        cursor.copy_expert(f"COPY {table} ({column_list}) FROM STDIN", buffer)
+    else:
+        execute_values(cursor, f"INSERT INTO {table} ({column_list}) VALUES %s", rows, page_size=len(rows))
+
+def delete_document_rows(cursor, document_id):
+    """Remove the derived rows of a document so they can be rewritten"""
+    cursor.execute("DELETE FROM trace.student_comments WHERE document_id = %s", (document_id,))
+    cursor.execute("DELETE FROM trace.course_ratings WHERE document_id = %s", (document_id,))
+    cursor.execute("DELETE FROM trace.course_info WHERE document_id = %s", (document_id,))
+
+def write_document(cursor, document_data, file_name, fingerprint=None):
+    """
+    Write one parsed document inside the caller's transaction and return its
+    id. When a fingerprint is given and the object was ingested before, the
+    existing document is replaced in place (same id, so vector ids stay stable)
+    and fingerprint['replaced'] is set, so the embed step knows old chunks
+    may be left over.
+    """
+    document_id = lock_existing_document(cursor, fingerprint) if fingerprint else None
+    if fingerprint:
+        fingerprint['replaced'] = document_id is not None
+
+    if document_id:
+        cursor.execute(
+            "UPDATE trace.documents SET document_name = %s, full_text = %s WHERE id = %s",
+            (file_name, document_data['full_text'], document_id)
+        )
+        # Take the old version's ratings out of the aggregates while its rows still exist
+        remove_document_aggregates(cursor, document_id)
+        delete_document_rows(cursor, document_id)
+    else:
         # Insert into trace.documents
         cursor.execute(
             "INSERT INTO trace.documents (document_name, document_type, full_text) VALUES (%s, %s, %s) RETURNING id",
@@ -8,69 +70,130 @@ def store_in_database(db_connection, document_data, file_name):
         )
         document_id = cursor.fetchone()[0]
 
-        # Insert into trace.course_info if available
-        course_info = document_data.get('course_info', {})
-        if course_info:
-            catalog_section = course_info.get('catalog_section', '')
-            course_number = f"{course_info.get('subject', '')} {catalog_section.split()[0]}" if catalog_section else ''
-            section = catalog_section.split()[1] if len(catalog_section.split()) > 1 else ''
-
-            cursor.execute("""
-                INSERT INTO trace.course_info 
-                (document_id, course_name, course_number, section, semester, year, instructor_name, enrollment_count, response_count, declines_count)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """,
-                (
-                    document_id,
-                    course_info.get('course_name', ''),
-                    course_number,
-                    section,
-                    course_info.get('semester', ''),
-                    course_info.get('year', 0),
-                    course_info.get('instructor', ''),
-                    course_info.get('enrollment', 0),
-                    course_info.get('responses', 0),
-                    course_info.get('declines', 0)
-                )
+    # Insert into trace.course_info if available
+    course_info = document_data.get('course_info', {})
+    if course_info:
+        catalog_section = course_info.get('catalog_section', '')
+        course_number = course_number_of(course_info)
+        section = catalog_section.split()[1] if len(catalog_section.split()) > 1 else ''
+
+        cursor.execute("""
+            INSERT INTO trace.course_info 
+            (document_id, course_name, course_number, section, semester, year, instructor_name, enrollment_count, response_count, declines_count)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """,
+            (
+                document_id,
+                course_info.get('course_name', ''),
+                course_number,
+                section,
+                course_info.get('semester', ''),
+                course_info.get('year', 0),
+                course_info.get('instructor', ''),
+                course_info.get('enrollment', 0),
+                course_info.get('responses', 0),
+                course_info.get('declines', 0)
             )
+        )
 
-        # Insert into trace.course_ratings
-        for rating in document_data.get('ratings', []):
-            cursor.execute("""
-                INSERT INTO trace.course_ratings
-                (document_id, category, question, response_count, course_mean)
-                VALUES (%s, %s, %s, %s, %s)
-                """,
-                (
-                    document_id,
-                    rating.get('category', ''),
-                    rating.get('question', ''),
-                    rating.get('response_count', None),
-                    rating.get('course_mean', None)
-                )
+    # Insert into trace.course_ratings
+    insert_rows(
+        cursor,
+        'trace.course_ratings',
+        ('document_id', 'category', 'question', 'response_count', 'course_mean'),
+        [
+            (
+                document_id,
+                rating.get('category', ''),
+                rating.get('question', ''),
+                rating.get('response_count', None),
+                rating.get('course_mean', None)
             )
+            for rating in document_data.get('ratings', [])
+        ]
+    )
 
-        # Insert into trace.student_comments
-        for comment in document_data.get('comments', []):
-            cursor.execute("""
-                INSERT INTO trace.student_comments
-                (document_id, question_category, question, comment_number, comment_text)
-                VALUES (%s, %s, %s, %s, %s)
-                """,
-                (
-                    document_id,
-                    'Student Feedback',
-                    comment.get('question', ''),
-                    comment.get('comment_number', 0),
-                    comment.get('text', '')
-                )
+    # Insert into trace.student_comments
+    insert_rows(
+        cursor,
+        'trace.student_comments',
+        ('document_id', 'question_category', 'question', 'comment_number', 'comment_text'),
+        [
+            (
+                document_id,
+                'Student Feedback',
+                comment.get('question', ''),
+                comment.get('comment_number', 0),
+                comment.get('text', '')
             )
+            for comment in document_data.get('comments', [])
+        ]
+    )
+
+    add_document_aggregates(cursor, document_data)
+
+    if fingerprint:
+        record_fingerprint(cursor, fingerprint, document_id)
+        if document_data.get('raw_text') is not None:
+            store_raw_text(cursor, fingerprint, document_id, document_data['raw_text'], document_data['parser_version'])
+        else:
+            # Raw text of an older version would re-parse into stale rows
+            delete_raw_text(cursor, fingerprint)
 
+    return document_id
+
+def store_in_database(db_connection, document_data, file_name, fingerprint=None):
+    """
+    Store a parsed document in its own transaction. Failures are rolled back
+    and raised, so the message goes to retry / DLQ routing instead of being
+    committed as processed.
+    """
+    cursor = db_connection.cursor()
+    try:
+        document_id = write_document(cursor, document_data, file_name, fingerprint)
         db_connection.commit()
-        print(f"✅ Successfully stored {file_name} in database with ID {document_id}")
+        logger.info(f"✅ Successfully stored {file_name} in database with ID {document_id}")
         return document_id
 
+    except CONNECTION_ERRORS:
+        # The server has already abandoned the transaction; let the caller
+        # reconnect and retry (see db.pool.run_with_connection)
+        raise
     except Exception as e:
         db_connection.rollback()
-        print(f"❌ Error storing document in database: {e}")
-        return None
+        logger.error(f"❌ Error storing document in database: {e}")
+        raise
+    finally:
+        if not cursor.closed:
+            cursor.close()
+
+def store_documents(db_connection, documents):
+    """
+    Store a batch of (document_data, file_name, fingerprint) in a single
+    transaction and return their ids in the same order. Any failure rolls
+    back the whole batch and is raised, so the caller can fall back to
+    storing documents one at a time.
+    """
+    # Take the per-object advisory locks in a fixed order so two batches
+    # touching the same objects can't deadlock
+    order = sorted(
+        range(len(documents)),
+        key=lambda i: (documents[i][2]['bucket'], documents[i][2]['object_name']) if documents[i][2] else ('', '')
+    )
+    document_ids = [None] * len(documents)
+    cursor = db_connection.cursor()
+    try:
+        for i in order:
+            document_data, file_name, fingerprint = documents[i]
+            document_ids[i] = write_document(cursor, document_data, file_name, fingerprint)
+        db_connection.commit()
+        logger.info(f"✅ Successfully stored {len(documents)} documents in database in one transaction")
+        return document_ids
+    except CONNECTION_ERRORS:
+        raise
+    except Exception:
+        db_connection.rollback()
+        raise
+    finally:
+        if not cursor.closed:
+            cursor.close()
@@ -0,0 +1,102 @@
+def make_fingerprint(bucket, object_name, generation=None, md5_hash=None):
+    return {
+        'bucket': bucket,
+        'object_name': object_name,
+        'generation': int(generation) if generation not in (None, '') else None,
+        'md5_hash': md5_hash or None,
+    }
+
+def is_already_ingested(db_connection, fingerprint):
+    """
+    True when this exact object version has been stored and embedded
+    before: same bucket/object and either the same GCS generation or the
+    same MD5. A version whose rows were written but whose vectors never
+    made it (see mark_embedded) is not ingested yet.
+    """
+    if fingerprint['generation'] is None and fingerprint['md5_hash'] is None:
+        return False
+
+    cursor = db_connection.cursor()
+    try:
+        cursor.execute(
+            "SELECT generation, md5_hash FROM trace.document_fingerprints"
+            " WHERE bucket = %s AND object_name = %s AND embedded_at IS NOT NULL",
+            (fingerprint['bucket'], fingerprint['object_name'])
+        )
+        row = cursor.fetchone()
+        db_connection.commit()
+    finally:
+        cursor.close()
+
+    if row is None:
+        return False
+    generation, md5_hash = row
+    if fingerprint['generation'] is not None and generation == fingerprint['generation']:
+        return True
+    return fingerprint['md5_hash'] is not None and md5_hash == fingerprint['md5_hash']
+
+def lock_existing_document(cursor, fingerprint):
+    """
+    Serialize writers for one object and return the document_id it was
+    previously stored under, if any. Must run inside the write transaction.
+    """
+    cursor.execute(
+        "SELECT pg_advisory_xact_lock(hashtext(%s))",
+        (f"{fingerprint['bucket']}/{fingerprint['object_name']}",)
+    )
+    cursor.execute(
+        "SELECT document_id FROM trace.document_fingerprints WHERE bucket = %s AND object_name = %s FOR UPDATE",
+        (fingerprint['bucket'], fingerprint['object_name'])
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def record_fingerprint(cursor, fingerprint, document_id):
+    """
+    Record the version just written. A new version starts out not embedded;
+    rewriting the same version (pipeline.reprocess) keeps its embedded_at.
+    """
+    cursor.execute("""
+        INSERT INTO trace.document_fingerprints (bucket, object_name, generation, md5_hash, document_id, embedded_at)
+        VALUES (%s, %s, %s, %s, %s, NULL)
+        ON CONFLICT (bucket, object_name) DO UPDATE
+        SET generation = EXCLUDED.generation,
+            md5_hash = EXCLUDED.md5_hash,
+            document_id = EXCLUDED.document_id,
+            ingested_at = now(),
+            embedded_at = CASE
+                WHEN trace.document_fingerprints.generation IS NOT DISTINCT FROM EXCLUDED.generation
+                 AND trace.document_fingerprints.md5_hash IS NOT DISTINCT FROM EXCLUDED.md5_hash
+                THEN trace.document_fingerprints.embedded_at
+            END
+        """,
+        (
+            fingerprint['bucket'],
+            fingerprint['object_name'],
+            fingerprint['generation'],
+            fingerprint['md5_hash'],
+            document_id
+        )
+    )
+
+def mark_embedded(db_connection, fingerprints):
+    """
+    Mark these object versions as fully ingested once their vectors are
+    upserted. Only the exact version is marked, so a job finishing late
+    can't mark a newer version written meanwhile.
+    """
+    cursor = db_connection.cursor()
+    try:
+        for fingerprint in fingerprints:
+            cursor.execute(
+                "UPDATE trace.document_fingerprints SET embedded_at = now()"
+                " WHERE bucket = %s AND object_name = %s"
+                " AND generation IS NOT DISTINCT FROM %s AND md5_hash IS NOT DISTINCT FROM %s",
+                (fingerprint['bucket'], fingerprint['object_name'], fingerprint['generation'], fingerprint['md5_hash'])
+            )
+        db_connection.commit()
+    except Exception:
+        db_connection.rollback()
+        raise
+    finally:
+        cursor.close()
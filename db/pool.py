@@ -0,0 +1,95 @@
+import os
+import time
+import logging
+import threading
+import psycopg2
+from psycopg2 import pool as pg_pool
+from config.settings import DB_CONFIG, DB_POOL_MIN_CONNECTIONS, DB_POOL_MAX_CONNECTIONS, DB_RECONNECT_RETRIES
+
+logger = logging.getLogger('kafka-pdf-consumer')
+
+# Errors that mean the connection itself is unusable (server restart,
+# network drop, idle timeout); anything else is a problem with the query
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+class ConnectionPool:
+    """
+    ThreadedConnectionPool that blocks when all connections are checked
+    out (psycopg2's raises PoolError instead) and replaces connections that
+    have died.
+    """
+
+    def __init__(self, minconn=DB_POOL_MIN_CONNECTIONS, maxconn=DB_POOL_MAX_CONNECTIONS, **kwargs):
+        self._pool = pg_pool.ThreadedConnectionPool(minconn, maxconn, **(kwargs or DB_CONFIG))
+        self._slots = threading.BoundedSemaphore(maxconn)
+
+    def getconn(self):
+        self._slots.acquire()
+        try:
+            conn = self._pool.getconn()
+            if conn.closed:
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, close=False):
+        try:
+            if not close and not conn.closed:
+                # Never hand out a connection with a transaction left open
+                conn.rollback()
+            self._pool.putconn(conn, close=close or bool(conn.closed))
+        except CONNECTION_ERRORS:
+            self._pool.putconn(conn, close=True)
+        finally:
+            self._slots.release()
+
+    def closeall(self):
+        self._pool.closeall()
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ConnectionPool()
+            _pool_pid = os.getpid()
+        return _pool
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+def run_with_connection(fn, retries=DB_RECONNECT_RETRIES):
+    """
+    Call fn(connection) with a pooled connection. If the connection turns
+    out to be dead, it is discarded and fn is retried on a fresh one, so a
+    database restart doesn't break every later write.
+    """
+    attempt = 0
+    while True:
+        db_pool = get_pool()
+        conn = db_pool.getconn()
+        try:
+            result = fn(conn)
+        except CONNECTION_ERRORS as e:
+            db_pool.putconn(conn, close=True)
+            if attempt >= retries:
+                raise
+            attempt += 1
+            logger.warning(f"⚠️ Database connection lost ({e}); reconnecting (attempt {attempt}/{retries})")
+            time.sleep(min(2 ** attempt, 30) * 0.5)
+            continue
+        except Exception:
+            db_pool.putconn(conn)
+            raise
+        db_pool.putconn(conn)
+        return result
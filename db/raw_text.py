@@ -0,0 +1,66 @@
+from parser.raw_text import RAW_TEXT_COMPRESSION
+
+def store_raw_text(cursor, fingerprint, document_id, raw_text, parser_version, compression=RAW_TEXT_COMPRESSION):
+    """Save an object's compressed raw text; runs inside the caller's write transaction"""
+    cursor.execute("""
+        INSERT INTO trace.document_raw_text
+        (bucket, object_name, generation, md5_hash, document_id, compression, raw_text, parser_version)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (bucket, object_name) DO UPDATE
+        SET generation = EXCLUDED.generation,
+            md5_hash = EXCLUDED.md5_hash,
+            document_id = EXCLUDED.document_id,
+            compression = EXCLUDED.compression,
+            raw_text = EXCLUDED.raw_text,
+            parser_version = EXCLUDED.parser_version,
+            stored_at = now()
+        """,
+        (
+            fingerprint['bucket'],
+            fingerprint['object_name'],
+            fingerprint['generation'],
+            fingerprint['md5_hash'],
+            document_id,
+            compression,
+            raw_text,
+            parser_version
+        )
+    )
+
+def delete_raw_text(cursor, fingerprint):
+    cursor.execute(
+        "DELETE FROM trace.document_raw_text WHERE bucket = %s AND object_name = %s",
+        (fingerprint['bucket'], fingerprint['object_name'])
+    )
+
+def iter_stale_raw_text(db_connection, parser_version, fetch_size=500):
+    """
+    Yield (document_id, fingerprint, compression, raw_text) for every object
+    parsed with an older parser version, in document id order, through a
+    server-side cursor so only fetch_size rows are in memory at a time.
+    """
+    cursor = db_connection.cursor(name="stale_raw_text")
+    cursor.itersize = fetch_size
+    try:
+        cursor.execute("""
+            SELECT document_id, bucket, object_name, generation, md5_hash, compression, raw_text
+            FROM trace.document_raw_text
+            WHERE parser_version < %s
+            ORDER BY document_id
+        """, (parser_version,))
+        for document_id, bucket, object_name, generation, md5_hash, compression, raw_text in cursor:
+            fingerprint = {'bucket': bucket, 'object_name': object_name, 'generation': generation, 'md5_hash': md5_hash}
+            yield document_id, fingerprint, compression, bytes(raw_text)
+    finally:
+        cursor.close()
+
+def parser_version_counts(db_connection):
+    """{parser_version: number of stored objects}"""
+    cursor = db_connection.cursor()
+    try:
+        cursor.execute("SELECT parser_version, count(*) FROM trace.document_raw_text GROUP BY 1 ORDER BY 1")
+        counts = dict(cursor.fetchall())
+        db_connection.commit()
+        return counts
+    finally:
+        cursor.close()
@@ -0,0 +1,78 @@
+# Tables owned by the consumer itself. The core trace.* tables
+# (documents, course_info, course_ratings, student_comments) are managed
+# outside this repo; everything here is created idempotently at startup.
+
+SCHEMA_STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS trace.document_fingerprints (
+        bucket TEXT NOT NULL,
+        object_name TEXT NOT NULL,
+        generation BIGINT,
+        md5_hash TEXT,
+        document_id INTEGER NOT NULL,
+        ingested_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (bucket, object_name)
+    )
+    """,
+    # Set once the object's vectors are upserted; a version counts as ingested
+    # only then. Rows from before the column existed are taken as embedded
+    "ALTER TABLE trace.document_fingerprints ADD COLUMN IF NOT EXISTS embedded_at TIMESTAMPTZ DEFAULT now()",
+    "ALTER TABLE trace.document_fingerprints ALTER COLUMN embedded_at DROP DEFAULT",
+    # Compressed raw text of each object (see parser.raw_text) and the parser
+    # version its rows were produced with; python -m pipeline.reprocess
+    # re-parses the stale ones without touching GCS
+    """
+    CREATE TABLE IF NOT EXISTS trace.document_raw_text (
+        bucket TEXT NOT NULL,
+        object_name TEXT NOT NULL,
+        generation BIGINT,
+        md5_hash TEXT,
+        document_id INTEGER NOT NULL,
+        compression TEXT NOT NULL,
+        raw_text BYTEA NOT NULL,
+        parser_version INTEGER NOT NULL,
+        stored_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (bucket, object_name)
+    )
+    """,
+    # Already compressed: stop TOAST from trying again
+    "ALTER TABLE trace.document_raw_text ALTER COLUMN raw_text SET STORAGE EXTERNAL",
+    "CREATE INDEX IF NOT EXISTS document_raw_text_version_idx ON trace.document_raw_text (parser_version, document_id)",
+    # Running rating totals per instructor / course / term / category, kept
+    # up to date by db.aggregates inside each ingestion transaction
+    """
+    CREATE TABLE IF NOT EXISTS trace.rating_aggregates (
+        instructor_name TEXT NOT NULL,
+        course_number TEXT NOT NULL,
+        semester TEXT NOT NULL,
+        year INTEGER NOT NULL,
+        category TEXT NOT NULL,
+        rating_count BIGINT NOT NULL DEFAULT 0,
+        response_count BIGINT NOT NULL DEFAULT 0,
+        mean_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+        weighted_mean_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (instructor_name, course_number, semester, year, category)
+    )
+    """,
+    """
+    CREATE OR REPLACE VIEW trace.rating_summary AS
+    SELECT instructor_name, course_number, semester, year, category,
+           rating_count, response_count,
+           mean_sum / NULLIF(rating_count, 0) AS mean_course_mean,
+           weighted_mean_sum / NULLIF(response_count, 0) AS response_weighted_mean
+    FROM trace.rating_aggregates
+    """,
+]
+
+def ensure_schema(db_connection):
+    cursor = db_connection.cursor()
+    try:
+        for statement in SCHEMA_STATEMENTS:
+            cursor.execute(statement)
+        db_connection.commit()
+    except Exception:
+        db_connection.rollback()
+        raise
+    finally:
+        cursor.close()
@@ -1,5 +1,6 @@
 import psycopg2
-from config.settings import DB_CONFIG
+from config.settings import DB_CONFIG, CHUNK_TARGET_TOKENS, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS
+from embedding.embedder import estimate_tokens
 
 def infer_chunk_type_from_question(question):
     q = question.lower()
@@ -16,8 +17,102 @@ def infer_chunk_type_from_question(question):
     else:
         return "student_comment"
 
+def split_text(text, max_tokens=CHUNK_TARGET_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """Split text on word boundaries into windows of about max_tokens, each repeating the last overlap_tokens of the previous one"""
+    # Work in characters, matching estimate_tokens()
+    width, overlap_width = max_tokens * 3, overlap_tokens * 3
+
+    # A single "word" longer than the window (a pasted URL, say) is cut up too
+    words = [word[i:i + width] for word in text.split() for i in range(0, len(word), width)]
+    if not words:
+        return []
+
+    windows = []
+    start = 0
+    while start < len(words):
+        end, length = start + 1, len(words[start])
+        while end < len(words) and length + 1 + len(words[end]) <= width:
+            length += 1 + len(words[end])
+            end += 1
+        windows.append(' '.join(words[start:end]))
+        if end >= len(words):
+            break
+
+        # Step back over roughly overlap_tokens worth of words, always moving forward
+        back, overlap = end, 0
+        while back > start + 1 and overlap + len(words[back - 1]) + 1 <= overlap_width:
+            back -= 1
+            overlap += len(words[back]) + 1
+        start = back
+    return windows
+
+def pack_units(units, target_tokens=CHUNK_TARGET_TOKENS, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Group small pieces of text (one comment, one rating row) into chunks of
+    up to target_tokens. A piece over max_tokens on its own is split first.
+    """
+    pieces = []
+    for unit in units:
+        if estimate_tokens(unit) > max_tokens:
+            pieces.extend(split_text(unit, target_tokens, overlap_tokens))
+        else:
+            pieces.append(unit)
+
+    groups, current, current_tokens = [], [], 0
+    for piece in pieces:
+        tokens = estimate_tokens(piece)
+        if current and current_tokens + tokens > target_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+def chunk_id(document_id, chunk_type, part):
+    # The first part keeps the historical "<doc>_<type>" id, so re-running
+    # overwrites the vectors written before chunks could be split
+    return f"{document_id}_{chunk_type}" if part == 0 else f"{document_id}_{chunk_type}_{part}"
+
+def document_chunk_prefix(document_id):
+    """Every chunk id of a document, and no other, starts with this"""
+    return f"{document_id}_"
+
+def document_of_chunk_id(vector_id):
+    return vector_id.partition("_")[0]
+
+def format_rating(rating):
+    mean = rating.get('course_mean')
+    count = rating.get('response_count')
+    return (
+        f"{rating.get('category', '')}: {rating.get('question', '')} - "
+        f"course mean {mean if mean is not None else 'n/a'}"
+        f"{f' ({count} responses)' if count is not None else ''}"
+    )
+
 def chunk_document_data(document):
+    """
+    Split a document into chunks bounded by CHUNK_MAX_TOKENS:
+    comments grouped by question type (packed up to CHUNK_TARGET_TOKENS,
+    with oversized comments split), the ratings table, and the cleaned
+    full text in overlapping windows. Ids are deterministic, so
+    re-processing a document overwrites its vectors; parts it no longer
+    produces are deleted by VectorStore.upload_chunks when the document
+    is passed as replaced.
+    """
     chunks = []
+    document_id = document['document_id']
+
+    def add_chunks(chunk_type, texts):
+        for part, text in enumerate(texts):
+            chunks.append({
+                'id': chunk_id(document_id, chunk_type, part),
+                'document_id': document_id,
+                'text': text,
+                'chunk_type': chunk_type,
+                'professor': document['professor']
+            })
 
     # Comment chunks grouped by question type
     grouped_comments = {}
@@ -28,55 +123,117 @@ def chunk_document_data(document):
         grouped_comments[chunk_type].append(comment)
 
     for chunk_type, comments in grouped_comments.items():
-        combined_text = "\n\n".join([f"{c['comment_number']}. {c['text']}" for c in comments])
-        question_header = comments[0]['question'] if comments else ""
-        chunks.append({
-            'id': f"{document['document_id']}_{chunk_type}",
-            'text': f"Q: {question_header}\n\n{combined_text}",
-            'chunk_type': chunk_type,
-            'professor': document['professor']
-        })
+        question_header = f"Q: {comments[0]['question']}\n\n"
+        budget = CHUNK_TARGET_TOKENS - estimate_tokens(question_header)
+        groups = pack_units(
+            [f"{c['comment_number']}. {c['text']}" for c in comments],
+            target_tokens=budget,
+            max_tokens=CHUNK_MAX_TOKENS - estimate_tokens(question_header)
+        )
+        add_chunks(chunk_type, [question_header + "\n\n".join(group) for group in groups])
+
+    # Ratings table, one row per line
+    ratings = document.get('ratings', [])
+    if ratings:
+        header = f"Ratings for {document.get('document_name', document_id)} ({document['professor']})\n"
+        groups = pack_units([format_rating(r) for r in ratings], target_tokens=CHUNK_TARGET_TOKENS - estimate_tokens(header))
+        add_chunks('ratings', [header + "\n".join(group) for group in groups])
+
+    # Cleaned full text in overlapping windows
+    full_text = document.get('full_text') or ''
+    add_chunks('full_text', split_text(full_text))
 
     return chunks
 
-def generate_chunks_from_db():
+def _document_filters(filters):
+    """WHERE clauses and parameters for the semester / year / instructor filters"""
+    clauses, params = [], []
+    if filters.get('semester'):
+        clauses.append("ci.semester = %s")
+        params.append(filters['semester'])
+    if filters.get('year'):
+        clauses.append("ci.year = %s")
+        params.append(int(filters['year']))
+    if filters.get('instructor'):
+        clauses.append("ci.instructor_name ILIKE %s")
+        params.append(f"%{filters['instructor']}%")
+    return clauses, params
+
+def iter_documents_from_db(conn, filters=None, after_id=0, fetch_size=500):
+    """
+    Yield documents in the shape chunk_document_data() expects, in id order,
+    starting after after_id. Documents stream through a server-side cursor
+    and their comments and ratings are fetched one page of documents at a
+    time, so memory stays bounded however large the tables are.
+    """
+    clauses, params = _document_filters(filters or {})
+    where = " AND ".join(["d.id > %s"] + clauses)
+
+    documents = conn.cursor(name="reindex_documents")
+    details = conn.cursor()
+    try:
+        documents.execute(f"""
+            SELECT d.id, d.document_name, d.full_text, ci.instructor_name
+            FROM trace.documents d
+            JOIN trace.course_info ci ON d.id = ci.document_id
+            WHERE {where}
+            ORDER BY d.id
+        """, [after_id] + params)
+
+        while True:
+            page = documents.fetchmany(fetch_size)
+            if not page:
+                break
+
+            details.execute("""
+                SELECT document_id, question, comment_number, comment_text
+                FROM trace.student_comments
+                WHERE document_id = ANY(%s)
+                ORDER BY document_id, comment_number
+            """, ([row[0] for row in page],))
+
+            comments_by_doc = {}
+            for doc_id, question, number, text in details:
+                comments_by_doc.setdefault(doc_id, []).append({
+                    'question': question,
+                    'comment_number': number,
+                    'text': text
+                })
+
+            details.execute("""
+                SELECT document_id, category, question, response_count, course_mean
+                FROM trace.course_ratings
+                WHERE document_id = ANY(%s)
+                ORDER BY document_id, id
+            """, ([row[0] for row in page],))
+
+            ratings_by_doc = {}
+            for doc_id, category, question, response_count, course_mean in details:
+                ratings_by_doc.setdefault(doc_id, []).append({
+                    'category': category,
+                    'question': question,
+                    'response_count': response_count,
+                    'course_mean': course_mean
+                })
+
+            for doc_id, name, full_text, instructor_name in page:
+                yield {
+                    'document_id': doc_id,
+                    'document_name': name,
+                    'full_text': full_text,
+                    'comments': comments_by_doc.get(doc_id, []),
+                    'ratings': ratings_by_doc.get(doc_id, []),
+                    'professor': instructor_name
+                }
+    finally:
+        details.close()
+        documents.close()
+
+def generate_chunks_from_db(filters=None, after_id=0):
+    """Yield the chunks of every stored document (see iter_documents_from_db)"""
     conn = psycopg2.connect(**DB_CONFIG)
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        SELECT d.id, d.document_name, d.full_text, ci.instructor_name
-        FROM documents d
-        JOIN course_info ci ON d.id = ci.document_id
-    """)
-    documents = cursor.fetchall()
-
-    cursor.execute("""
-        SELECT document_id, question, comment_number, comment_text
-        FROM student_comments
-        ORDER BY document_id, comment_number
-    """)
-    comments = cursor.fetchall()
-    conn.close()
-
-    comments_by_doc = {}
-    for doc_id, question, number, text in comments:
-        if doc_id not in comments_by_doc:
-            comments_by_doc[doc_id] = []
-        comments_by_doc[doc_id].append({
-            'question': question,
-            'comment_number': number,
-            'text': text
-        })
-
-    all_chunks = []
-    for doc_id, name, full_text, instructor_name in documents:
-        document = {
-            'document_id': doc_id,
-            'document_name': name,
-            'full_text': full_text,
-            'comments': comments_by_doc.get(doc_id, []),
-            'professor': instructor_name
-        }
-        all_chunks.extend(chunk_document_data(document))
-
-    return all_chunks
\ No newline at end of file
+    try:
+        for document in iter_documents_from_db(conn, filters, after_id):
+            yield from chunk_document_data(document)
+    finally:
+        conn.close()
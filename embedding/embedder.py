@@ -1,33 +1,172 @@
 import os
-import sys
+import hashlib
+import logging
+import math
+import struct
 import traceback
-from openai import OpenAI
-from dotenv import load_dotenv
-
-# Try to load from .env file, but don't fail if it's not there
-try:
-    load_dotenv()
-except:
-    pass
-
-def get_openai_embedding(text, model="text-embedding-3-small"):
-    print(f"Debug: Starting get_openai_embedding with model={model}")
-    try:
-        # Initialize client with API key from environment variable
-        api_key = os.environ.get("OPENAI_API_KEY")
-        print(f"Debug: API key starts with: {api_key[:4] if api_key else 'None'}")
-        
-        client = OpenAI(api_key=api_key)
-        print("Debug: OpenAI client initialized successfully")
-        
-        response = client.embeddings.create(
-            input=[text],
-            model=model
-        )
-        print("Debug: Got response from OpenAI API")
-        
-        return response.data[0].embedding
-    except Exception as e:
-        print(f"Debug: Error in get_openai_embedding: {e}")
-        traceback.print_exc(file=sys.stdout)
-        raise
\ No newline at end of file
+from embedding.embedding_cache import get_embedding_cache
+from embedding.profile import get_embedding_profile
+from embedding.rate_limit import call_with_retries
+from monitoring.metrics import EXTERNAL_ERRORS
+from config.settings import (
+    EMBEDDING_BACKEND, EMBEDDING_MODEL, EMBEDDING_MAX_BATCH_INPUTS, EMBEDDING_MAX_BATCH_TOKENS
+)
+
+logger = logging.getLogger('kafka-pdf-consumer')
+
+def estimate_tokens(text):
+    """
+    Cheap upper-bound token estimate used for request packing.
+    English text averages ~4 characters per token; 3 leaves headroom for
+    numbers and punctuation, which tokenize less efficiently.
+    """
+    return max(1, math.ceil(len(text) / 3))
+
+def pack_batches(texts, max_inputs=EMBEDDING_MAX_BATCH_INPUTS, max_tokens=EMBEDDING_MAX_BATCH_TOKENS):
+    """
+    Split texts into consecutive batches that respect the per-request input
+    count and token budget. Returns a list of (start, end) index ranges.
+    A single text larger than max_tokens still gets a batch of its own.
+    """
+    batches = []
+    start = 0
+    batch_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if i > start and (i - start >= max_inputs or batch_tokens + tokens > max_tokens):
+            batches.append((start, i))
+            start = i
+            batch_tokens = 0
+        batch_tokens += tokens
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
+
+class OpenAIEmbeddingBackend:
+    """Embeds through the OpenAI API using one client (and HTTP connection pool) per process"""
+    # Calls go through the "openai" rate limiter (see embedding.rate_limit)
+    service = "openai"
+
+    def __init__(self, model=EMBEDDING_MODEL, api_key=None, dimensions=None):
+        self.model = model
+        # Shortened output (text-embedding-3 only); None returns the model's own size
+        self.dimensions = dimensions
+        self.api_key = api_key or os.environ.get("OPENAI_API_KEY")
+        self._client = None
+        self._client_pid = None
+
+    def with_model(self, model):
+        """The same backend for another model, at that model's own size"""
+        return OpenAIEmbeddingBackend(model, api_key=self.api_key)
+
+    @property
+    def client(self):
+        if self._client is None or self._client_pid != os.getpid():
+            from openai import OpenAI
+            # Retries are handled by embedding.rate_limit, which also honours retry-after
+            self._client = OpenAI(api_key=self.api_key, max_retries=0)
+            self._client_pid = os.getpid()
+        return self._client
+
+    def embed_batch(self, texts):
+        if self.dimensions:
+            response = self.client.embeddings.create(input=texts, model=self.model, dimensions=self.dimensions)
+        else:
+            response = self.client.embeddings.create(input=texts, model=self.model)
+        # The API tags each result with its input index; don't rely on order
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+class FakeEmbeddingBackend:
+    """
+    Deterministic local embedder for tests and benchmarks. The same text
+    always maps to the same unit vector, and no network calls are made.
+    """
+
+    def __init__(self, model="fake", dimension=1536):
+        self.model = model
+        self.dimension = dimension
+        self.requests = 0
+
+    def with_model(self, model):
+        return FakeEmbeddingBackend(model, self.dimension)
+
+    def embed_batch(self, texts):
+        self.requests += 1
+        return [self._vector(text) for text in texts]
+
+    def _vector(self, text):
+        values = []
+        counter = 0
+        while len(values) < self.dimension:
+            digest = hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+            values.extend(v / 2147483648.0 for v in struct.unpack("<8i", digest))
+            counter += 1
+        values = values[:self.dimension]
+        norm = math.sqrt(sum(v * v for v in values)) or 1.0
+        return [v / norm for v in values]
+
+_backend = None
+
+def get_embedding_backend():
+    global _backend
+    if _backend is None:
+        profile = get_embedding_profile()
+        if EMBEDDING_BACKEND == "fake":
+            _backend = FakeEmbeddingBackend(dimension=profile.dimensions)
+        else:
+            _backend = OpenAIEmbeddingBackend(profile.model, dimensions=profile.requested_dimensions)
+    return _backend
+
+def set_embedding_backend(backend):
+    """Swap the process-wide backend (e.g. FakeEmbeddingBackend in tests)"""
+    global _backend
+    _backend = backend
+
+def embed_texts(texts, backend=None, cache=None):
+    """
+    Embed many texts with as few requests as the backend's limits allow.
+    Texts may come from any number of documents; vectors are returned in
+    the same order as the input. Vectors already in the embedding cache are
+    reused and only the misses are sent to the backend.
+    """
+    backend = backend or get_embedding_backend()
+    cache = cache or get_embedding_cache()
+    texts = list(texts)
+    # Shortened vectors are cached apart from full-size ones of the same model
+    namespace = backend.model if not getattr(backend, "dimensions", None) else f"{backend.model}@{backend.dimensions}"
+
+    vectors = cache.get_many(namespace, texts) if cache else [None] * len(texts)
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    missing_texts = [texts[i] for i in missing]
+
+    service = getattr(backend, "service", None)
+    fresh = []
+    for start, end in pack_batches(missing_texts):
+        batch = missing_texts[start:end]
+        try:
+            if service:
+                fresh.extend(call_with_retries(
+                    lambda: backend.embed_batch(batch), service, tokens=sum(estimate_tokens(t) for t in batch)
+                ))
+            else:
+                fresh.extend(backend.embed_batch(batch))
+        except Exception as e:
+            EXTERNAL_ERRORS.inc(service=service or "embedding")
+            logger.error(f"❌ Embedding request for inputs {start}-{end - 1} failed: {e}")
+            logger.error(traceback.format_exc())
+            raise
+
+    for i, vector in zip(missing, fresh):
+        vectors[i] = vector
+    if cache and fresh:
+        cache.put_many(namespace, missing_texts, fresh)
+    return vectors
+
+def get_openai_embedding(text, model=EMBEDDING_MODEL):
+    backend = get_embedding_backend()
+    if getattr(backend, "model", model) != model:
+        # Stay on the configured backend, so EMBEDDING_BACKEND=fake never reaches the API
+        if not hasattr(backend, "with_model"):
+            raise ValueError(f"{type(backend).__name__} can't embed with model {model!r}")
+        backend = backend.with_model(model)
+    return embed_texts([text], backend=backend)[0]
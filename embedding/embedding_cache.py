@@ -0,0 +1,148 @@
+import os
+import hashlib
+import sqlite3
+import struct
+import threading
+import time
+from array import array
+from config.settings import EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES, EMBEDDING_CACHE_PRECISION
+
+CACHE_PRECISIONS = ("float32", "float16", "int8")
+
+def cache_key(model, text):
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+def pack_vector(vector, precision="float32"):
+    if precision == "float16":
+        return struct.pack(f"<{len(vector)}e", *vector)
+    if precision == "int8":
+        # One float32 scale, then each value as a multiple of scale / 127
+        scale = max((abs(v) for v in vector), default=0.0) or 1.0
+        return struct.pack("<f", scale) + array("b", [round(v / scale * 127) for v in vector]).tobytes()
+    return array("f", vector).tobytes()
+
+def unpack_vector(blob, precision="float32"):
+    if precision == "float16":
+        return list(struct.unpack(f"<{len(blob) // 2}e", blob))
+    if precision == "int8":
+        step = struct.unpack_from("<f", blob)[0] / 127
+        values = array("b")
+        values.frombytes(blob[4:])
+        return [v * step for v in values]
+    values = array("f")
+    values.frombytes(blob)
+    return values.tolist()
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache keyed by sha256(model + text).
+
+    Vectors are stored as float32 blobs in SQLite (6 KB for a 1536-d vector),
+    or as float16 (3 KB) or int8 with a per-vector scale (1.5 KB). Entries
+    of different precisions are keyed apart, so changing it only costs
+    misses.
+    Once the table grows past max_entries the least recently used rows are
+    evicted. Several processes may share one file; SQLite serializes writes.
+    Each process counts its own inserts from the size it opened the file
+    at, so with several writers the table can overshoot max_entries until
+    one of them reaches it and evicts.
+    """
+
+    def __init__(self, path, max_entries=EMBEDDING_CACHE_MAX_ENTRIES, precision=EMBEDDING_CACHE_PRECISION):
+        if precision not in CACHE_PRECISIONS:
+            raise ValueError(f"unknown cache precision {precision!r}; use one of {', '.join(CACHE_PRECISIONS)}")
+        self.path = path
+        self.max_entries = max_entries
+        self.precision = precision
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        # Upper bound on the row count (replaced keys count as new); the
+        # table is only counted again when this passes max_entries
+        self._row_estimate = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _namespace(self, model):
+        # float32 keeps the keys written before precision was configurable
+        return model if self.precision == "float32" else f"{model}:{self.precision}"
+
+    def get_many(self, model, texts):
+        """Return a list aligned with texts holding cached vectors or None"""
+        namespace = self._namespace(model)
+        keys = [cache_key(namespace, t) for t in texts]
+        found = {}
+        with self._lock:
+            # Stay under SQLite's default bound-parameter limit
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, k) for k in found]
+                )
+                self._conn.commit()
+            hits = sum(1 for k in keys if k in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+
+        return [unpack_vector(found[k], self.precision) if k in found else None for k in keys]
+
+    def put_many(self, model, texts, vectors):
+        now = time.time()
+        namespace = self._namespace(model)
+        rows = [(cache_key(namespace, t), pack_vector(v, self.precision), now) for t, v in zip(texts, vectors)]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows
+            )
+            self._row_estimate += len(rows)
+            if self._row_estimate > self.max_entries:
+                count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                excess = count - self.max_entries
+                if excess > 0:
+                    self._conn.execute(
+                        "DELETE FROM embeddings WHERE key IN "
+                        "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)", (excess,)
+                    )
+                self._row_estimate = min(count, self.max_entries)
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 3) if total else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_cache = None
+_cache_pid = None
+
+def get_embedding_cache():
+    """Process-wide cache, or None when EMBEDDING_CACHE_PATH is not set"""
+    global _cache, _cache_pid
+    if not EMBEDDING_CACHE_PATH:
+        return None
+    # SQLite connections must not be shared across fork()
+    if _cache is None or _cache_pid != os.getpid():
+        _cache = EmbeddingCache(EMBEDDING_CACHE_PATH)
+        _cache_pid = os.getpid()
+    return _cache
@@ -0,0 +1,321 @@
+"""
+Vector store kept on local disk, for offline benchmarks, CI and as an
+in-cluster cache for hot queries. Select it with VECTOR_STORE_BACKEND=local.
+
+A store is a directory holding
+
+    vectors.npy   (capacity, dimension) float32/float16/int8 matrix, memory-mapped
+    scales.npy    (capacity,) float32 row scales, int8 stores only
+    ids.jsonl     append-only journal of row assignments, metadata and deletes
+
+Vectors are normalized on write, so cosine similarity is a matrix product.
+int8 rows hold each value as a multiple of max|value| / 127 for that row;
+scores are computed on the integers and multiplied by the row scale.
+Filterable metadata fields are kept as integer-coded columns; the boolean
+mask for a filter value is computed with one vectorized comparison and
+cached until the next write.
+"""
+import os
+import json
+import logging
+import threading
+import numpy as np
+from embedding.vector_store import VectorStore
+from embedding.chunker import document_of_chunk_id
+
+logger = logging.getLogger('kafka-pdf-consumer')
+
+# Metadata fields kept as columns for fast filtering; other fields are
+# still filterable, by scanning the metadata
+INDEXED_FIELDS = ("professor", "chunk_type")
+# Rows scored per matrix product; bounds the float32 copy made for float16/int8 stores
+QUERY_BLOCK_ROWS = 65536
+MIN_CAPACITY = 1024
+DTYPES = ("float32", "float16", "int8")
+
+class LocalVectorStore(VectorStore):
+    def __init__(self, path, dimension=1536, dtype="float32"):
+        if dtype not in DTYPES:
+            raise ValueError(f"unsupported vector dtype {dtype!r}; use one of {', '.join(DTYPES)}")
+        self.path = path
+        self.name = f"local vector store {path}"
+        self.dimension = dimension
+        self.dtype = np.dtype(dtype)
+        self.quantized = dtype == "int8"
+        self._lock = threading.RLock()
+        self._rows = {}
+        self._ids = []
+        self._metadata = []
+        self._free = []
+        self._codes = {}
+        self._values = {field: {} for field in INDEXED_FIELDS}
+        self._mask_cache = {}
+        # Chunk ids by document, for replacing a document's chunks
+        self._documents = {}
+        self._journal_lines = 0
+
+        os.makedirs(path, exist_ok=True)
+        self._matrix_path = os.path.join(path, "vectors.npy")
+        self._journal_path = os.path.join(path, "ids.jsonl")
+        self._scales_path = os.path.join(path, "scales.npy")
+        if os.path.exists(self._matrix_path):
+            self._matrix = np.lib.format.open_memmap(self._matrix_path, mode="r+")
+            if self._matrix.shape[1] != dimension or self._matrix.dtype != self.dtype:
+                raise ValueError(
+                    f"{self._matrix_path} holds {self._matrix.shape[1]}-d {self._matrix.dtype} vectors, "
+                    f"expected {dimension}-d {self.dtype}"
+                )
+        else:
+            self._matrix = np.lib.format.open_memmap(self._matrix_path, mode="w+", dtype=self.dtype, shape=(MIN_CAPACITY, dimension))
+        self._scales = None
+        if self.quantized:
+            if os.path.exists(self._scales_path):
+                self._scales = np.lib.format.open_memmap(self._scales_path, mode="r+")
+            else:
+                self._scales = np.lib.format.open_memmap(self._scales_path, mode="w+", dtype=np.float32, shape=(len(self._matrix),))
+        self._live = np.zeros(len(self._matrix), dtype=bool)
+        self._codes = {field: np.full(len(self._matrix), -1, dtype=np.int32) for field in INDEXED_FIELDS}
+        self._replay_journal()
+        self._journal = open(self._journal_path, "a", encoding="utf-8")
+        logger.info(f"Opened {self.name}: {len(self)} vectors ({self.dimension}-d {self.dtype})")
+
+    def __len__(self):
+        return len(self._rows)
+
+    # --- storage ---------------------------------------------------------------
+
+    def _replay_journal(self):
+        if not os.path.exists(self._journal_path):
+            return
+        with open(self._journal_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A write cut short by a crash; everything before it is intact
+                    logger.warning(f"Ignoring truncated entry in {self._journal_path}")
+                    continue
+                self._journal_lines += 1
+                if entry.get("deleted"):
+                    self._clear_row(entry["id"])
+                else:
+                    self._assign_row(entry["id"], entry["row"], entry.get("metadata") or {})
+        used = set(self._rows.values())
+        self._free = [row for row in range(len(self._ids)) if row not in used]
+
+    @staticmethod
+    def _grown_copy(path, array, shape):
+        tmp_path = path + ".tmp"
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=array.dtype, shape=shape)
+        kept = min(len(array), shape[0])
+        grown[:kept] = array[:kept]
+        grown.flush()
+        del grown
+        os.replace(tmp_path, path)
+        return np.lib.format.open_memmap(path, mode="r+")
+
+    def _grow(self, needed):
+        capacity = len(self._matrix)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        if self.quantized:
+            # Scales first: a crash in between leaves extra zero scales, which are harmless
+            self._scales = self._grown_copy(self._scales_path, self._scales, (new_capacity,))
+        self._matrix = self._grown_copy(self._matrix_path, self._matrix, (new_capacity, self.dimension))
+        self._live = np.concatenate([self._live, np.zeros(new_capacity - capacity, dtype=bool)])
+        for field in INDEXED_FIELDS:
+            self._codes[field] = np.concatenate([self._codes[field], np.full(new_capacity - capacity, -1, dtype=np.int32)])
+
+    def _assign_row(self, vector_id, row, metadata):
+        self._grow(row + 1)
+        if row >= len(self._ids):
+            self._ids.extend([None] * (row + 1 - len(self._ids)))
+            self._metadata.extend([None] * (row + 1 - len(self._metadata)))
+        self._rows[vector_id] = row
+        self._ids[row] = vector_id
+        self._documents.setdefault(document_of_chunk_id(vector_id), set()).add(vector_id)
+        self._metadata[row] = metadata
+        self._live[row] = True
+        for field in INDEXED_FIELDS:
+            value = metadata.get(field)
+            codes = self._values[field]
+            if value is not None and value not in codes:
+                codes[value] = len(codes)
+            self._codes[field][row] = codes[value] if value is not None else -1
+
+    def _clear_row(self, vector_id):
+        row = self._rows.pop(vector_id, None)
+        if row is None:
+            return None
+        document = self._documents.get(document_of_chunk_id(vector_id))
+        if document is not None:
+            document.discard(vector_id)
+            if not document:
+                del self._documents[document_of_chunk_id(vector_id)]
+        self._ids[row] = None
+        self._metadata[row] = None
+        self._live[row] = False
+        for field in INDEXED_FIELDS:
+            self._codes[field][row] = -1
+        return row
+
+    def _allocate_row(self):
+        if self._free:
+            return self._free.pop()
+        return len(self._ids)
+
+    def _write_journal(self, entries):
+        for entry in entries:
+            self._journal.write(json.dumps(entry) + "\n")
+        self._journal.flush()
+        self._journal_lines += len(entries)
+
+    # --- VectorStore -----------------------------------------------------------
+
+    def _normalized(self, values):
+        matrix = np.asarray(values, dtype=np.float32)
+        if matrix.ndim != 2 or matrix.shape[1] != self.dimension:
+            raise ValueError(f"expected {self.dimension}-d vectors, got shape {matrix.shape}")
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    def upsert(self, vectors):
+        """Insert or replace vectors by id; returns how many were written"""
+        if not vectors:
+            return 0
+        matrix = self._normalized([vector["values"] for vector in vectors])
+        with self._lock:
+            rows, entries = [], []
+            for vector in vectors:
+                metadata = vector.get("metadata") or {}
+                row = self._rows.get(vector["id"])
+                if row is None:
+                    row = self._allocate_row()
+                self._assign_row(vector["id"], row, metadata)
+                rows.append(row)
+                entries.append({"id": vector["id"], "row": row, "metadata": metadata})
+            # With a repeated id the last vector wins, as with the metadata above
+            if self.quantized:
+                scales = np.abs(matrix).max(axis=1) / 127
+                scales[scales == 0] = 1
+                self._matrix[rows] = np.rint(matrix / scales[:, None]).astype(np.int8)
+                self._scales[rows] = scales
+            else:
+                self._matrix[rows] = matrix.astype(self.dtype)
+            self._mask_cache.clear()
+            self._write_journal(entries)
+        return len(vectors)
+
+    def delete(self, ids):
+        with self._lock:
+            entries = []
+            for vector_id in ids:
+                row = self._clear_row(vector_id)
+                if row is not None:
+                    self._matrix[row] = 0
+                    self._free.append(row)
+                    entries.append({"id": vector_id, "deleted": True})
+            self._mask_cache.clear()
+            self._write_journal(entries)
+
+    def _field_mask(self, field, value):
+        count = len(self._ids)
+        if field in INDEXED_FIELDS:
+            key = (field, value)
+            if key not in self._mask_cache:
+                code = self._values[field].get(value)
+                self._mask_cache[key] = self._codes[field][:count] == code if code is not None else np.zeros(count, dtype=bool)
+            return self._mask_cache[key]
+        return np.array([meta is not None and meta.get(field) == value for meta in self._metadata], dtype=bool)
+
+    def _filter_mask(self, filter):
+        """Rows matching a Pinecone-style filter: {field: value}, {field: {"$eq": v}} or {field: {"$in": [...]}}"""
+        mask = self._live[:len(self._ids)].copy()
+        for field, condition in (filter or {}).items():
+            if isinstance(condition, dict):
+                (op, operand), = condition.items()
+                if op == "$eq":
+                    values = [operand]
+                elif op == "$in":
+                    values = list(operand)
+                else:
+                    raise ValueError(f"unsupported filter operator {op!r}")
+            else:
+                values = [condition]
+            matched = np.zeros_like(mask)
+            for value in values:
+                matched |= self._field_mask(field, value)
+            mask &= matched
+        return mask
+
+    def query_many(self, vectors, top_k=10, filter=None):
+        """Cosine top-k for each query vector; returns one result list per query"""
+        queries = self._normalized(vectors)
+        with self._lock:
+            mask = self._filter_mask(filter)
+            rows = np.flatnonzero(mask)
+            best_scores = np.empty((len(queries), 0), dtype=np.float32)
+            best_rows = np.empty((len(queries), 0), dtype=np.int64)
+            for start in range(0, len(rows), QUERY_BLOCK_ROWS):
+                block = rows[start:start + QUERY_BLOCK_ROWS]
+                if block[-1] - block[0] + 1 == len(block):
+                    # Contiguous rows: a slice of the mapped matrix, no gather
+                    rows_index = slice(block[0], block[-1] + 1)
+                else:
+                    rows_index = block
+                scores = queries @ self._matrix[rows_index].astype(np.float32, copy=False).T
+                if self.quantized:
+                    scores *= self._scales[rows_index]
+                best_scores = np.concatenate([best_scores, scores], axis=1)
+                best_rows = np.concatenate([best_rows, np.broadcast_to(block, scores.shape)], axis=1)
+                if best_scores.shape[1] > top_k:
+                    keep = np.argpartition(-best_scores, top_k, axis=1)[:, :top_k]
+                    best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                    best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+            results = []
+            for scores, hits in zip(best_scores, best_rows):
+                order = np.argsort(-scores, kind="stable")
+                results.append([
+                    {"id": self._ids[row], "score": float(scores[i]), "metadata": self._metadata[row]}
+                    for i, row in ((i, hits[i]) for i in order)
+                ])
+            return results
+
+    def query(self, vector, top_k=10, filter=None):
+        return self.query_many([vector], top_k=top_k, filter=filter)[0]
+
+    def list_document_ids(self, document_id):
+        with self._lock:
+            return list(self._documents.get(str(document_id), ()))
+
+    def flush(self):
+        with self._lock:
+            self._matrix.flush()
+            if self.quantized:
+                self._scales.flush()
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+
+    def compact_journal(self):
+        """Rewrite the journal as one line per live vector"""
+        with self._lock:
+            tmp_path = self._journal_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for vector_id, row in self._rows.items():
+                    f.write(json.dumps({"id": vector_id, "row": row, "metadata": self._metadata[row]}) + "\n")
+            self._journal.close()
+            os.replace(tmp_path, self._journal_path)
+            self._journal = open(self._journal_path, "a", encoding="utf-8")
+            self._journal_lines = len(self._rows)
+
+    def close(self):
+        with self._lock:
+            if self._journal.closed:
+                return
+            self.flush()
+            # Replaced and deleted ids leave stale journal lines behind
+            if self._journal_lines > 2 * len(self._rows) + MIN_CAPACITY:
+                self.compact_journal()
+            self._journal.close()
@@ -1,92 +1,196 @@
+import json
+import time
 import logging
+import threading
 import traceback
-from pinecone import Pinecone, ServerlessSpec
-from embedding.embedder import get_openai_embedding
+from concurrent.futures import ThreadPoolExecutor
+from embedding.rate_limit import call_with_retries
+from embedding.vector_store import VectorStore
+from embedding.chunker import document_chunk_prefix
+from embedding.profile import get_embedding_profile, WIRE_FLOAT_CHARS
+from monitoring.metrics import STAGE_DURATION, VECTORS_UPSERTED, EXTERNAL_ERRORS
+from config.settings import (
+    PINECONE_UPSERT_PARALLELISM, PINECONE_MAX_REQUEST_BYTES, PINECONE_MAX_BATCH_VECTORS, PINECONE_STATS_INTERVAL_SECONDS,
+    EMBEDDING_WIRE_PRECISION
+)
 
 logger = logging.getLogger('kafka-pdf-consumer')
 
-def upload_chunks_to_pinecone(chunks, index_name, api_key, environment):
-    try:
-        logger.info(f"Starting Pinecone upload with API key: {api_key[:4]}... to index: {index_name}")
-        logger.info(f"Uploading {len(chunks)} chunks to Pinecone in environment: {environment}")
-        
-        # Init Pinecone client
-        pc = Pinecone(api_key=api_key)
-        logger.info("Pinecone client initialized")
-        
+# pinecone.Pinecone, imported on first use; benchmarks put a fake here
+Pinecone = None
+
+def _pinecone_class():
+    global Pinecone
+    if Pinecone is None:
+        from pinecone import Pinecone as client_class
+        Pinecone = client_class
+    return Pinecone
+
+def estimate_vector_bytes(vector, float_chars=WIRE_FLOAT_CHARS[EMBEDDING_WIRE_PRECISION]):
+    """Approximate JSON size of one vector in an upsert request body"""
+    # Full-precision floats serialize to ~20 characters each including the
+    # separator; rounded ones (EMBEDDING_WIRE_PRECISION) to fewer
+    return len(vector["id"]) + float_chars * len(vector["values"]) + len(json.dumps(vector.get("metadata", {}))) + 64
+
+def pack_upsert_batches(vectors, max_bytes=PINECONE_MAX_REQUEST_BYTES, max_count=PINECONE_MAX_BATCH_VECTORS,
+                        float_chars=WIRE_FLOAT_CHARS[EMBEDDING_WIRE_PRECISION]):
+    """Group vectors into requests that stay under the request size and count limits"""
+    batches = []
+    batch, batch_bytes = [], 0
+    for vector in vectors:
+        size = estimate_vector_bytes(vector, float_chars)
+        if batch and (batch_bytes + size > max_bytes or len(batch) >= max_count):
+            batches.append(batch)
+            batch, batch_bytes = [], 0
+        batch.append(vector)
+        batch_bytes += size
+    if batch:
+        batches.append(batch)
+    return batches
+
+class PineconeUploader(VectorStore):
+    """
+    Long-lived handle on one Pinecone index.
+
+    The index is looked up (and created if missing) once, on first use,
+    with the dimension of the embedding profile; an existing index of another
+    dimension is refused. After that each upload costs only its upsert
+    requests. Upserts run on a
+    shared thread pool of PINECONE_UPSERT_PARALLELISM, and index stats are
+    logged at most once per PINECONE_STATS_INTERVAL_SECONDS.
+    """
+
+    def __init__(self, index_name, api_key, environment, dimension=None, parallelism=PINECONE_UPSERT_PARALLELISM, profile=None):
+        self.index_name = index_name
+        self.name = f"Pinecone index {index_name}"
+        self.api_key = api_key
+        self.environment = environment
+        self.profile = profile or get_embedding_profile()
+        self.dimension = dimension or self.profile.dimensions
+        self.float_chars = WIRE_FLOAT_CHARS[self.profile.wire_precision]
+        self._index = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix="pinecone-upsert")
+        self._last_stats = 0.0
+
+    @property
+    def index(self):
+        with self._lock:
+            if self._index is None:
+                self._index = self._connect()
+            return self._index
+
+    def _connect(self):
+        logger.info(f"Connecting to Pinecone with API key: {self.api_key[:4]}... index: {self.index_name}")
+        pc = _pinecone_class()(api_key=self.api_key)
+
         # Check existing indexes
         existing_indexes = pc.list_indexes().names()
         logger.info(f"Existing Pinecone indexes: {existing_indexes}")
-        
+
         # Create index if it doesn't exist
-        if index_name not in existing_indexes:
-            logger.info(f"Creating new index: {index_name} with dimension 1536")
+        if self.index_name not in existing_indexes:
+            from pinecone import ServerlessSpec
+            logger.info(f"Creating new index: {self.index_name} with dimension {self.dimension}")
             pc.create_index(
-                name=index_name,
-                dimension=1536,
+                name=self.index_name,
+                dimension=self.dimension,
                 metric="cosine",
                 spec=ServerlessSpec(
                     cloud="aws",
-                    region=environment.split("-")[0]  # e.g., "us-east-1"
+                    region=self.environment.split("-")[0]  # e.g., "us-east-1"
                 )
             )
-            logger.info(f"✅ Created Pinecone index: {index_name}")
-        
-        index = pc.Index(index_name)
-        logger.info(f"Obtained index reference for: {index_name}")
-        
-        # Process chunks in batches
-        batch_size = 10  # Smaller batch for testing
-        total_uploaded = 0
-        
-        for i in range(0, len(chunks), batch_size):
-            batch = chunks[i:i+batch_size]
-            batch_vectors = []
-            
-            for chunk in batch:
-                try:
-                    # Get embedding
-                    vector = get_openai_embedding(chunk["text"])
-                    
-                    # Validate vector
-                    if len(vector) != 1536:
-                        logger.warning(f"Vector dimension mismatch: {len(vector)} (expected 1536)")
-                    
-                    # Add to batch
-                    batch_vectors.append({
-                        "id": chunk["id"],
-                        "values": vector,
-                        "metadata": {
-                            "professor": chunk.get("professor", "Unknown"),
-                            "chunk_type": chunk.get("chunk_type", "unknown"),
-                            "text": chunk["text"][:500]  # Truncate text for metadata
-                        }
-                    })
-                except Exception as e:
-                    logger.error(f"❌ Failed to create embedding for {chunk['id']}: {e}")
-            
-            # Upload batch
-            if batch_vectors:
-                try:
-                    result = index.upsert(vectors=batch_vectors)
-                    logger.info(f"✅ Batch {i//batch_size + 1}: Uploaded {len(batch_vectors)} vectors. Result: {result}")
-                    total_uploaded += len(batch_vectors)
-                except Exception as e:
-                    logger.error(f"❌ Failed to upload batch: {e}")
-                    logger.error(traceback.format_exc())
-        
-        # Verify upload with stats
+            logger.info(f"✅ Created Pinecone index: {self.index_name}")
+        else:
+            # An index's dimension is fixed at creation; upserts of another size would all fail
+            dimension = pc.describe_index(self.index_name).dimension
+            if dimension != self.dimension:
+                raise ValueError(
+                    f"Pinecone index {self.index_name} has dimension {dimension} but the embedding profile "
+                    f"produces {self.dimension}; set EMBEDDING_DIMENSIONS={dimension} or use a new index"
+                )
+
+        index = pc.Index(self.index_name)
+        logger.info(f"Obtained index reference for: {self.index_name}")
+        return index
+
+    def _upsert_batch(self, batch):
         try:
-            stats = index.describe_index_stats()
-            logger.info(f"Index stats after upload: {stats}")
+            with STAGE_DURATION.time(stage="upsert"):
+                call_with_retries(lambda: self.index.upsert(vectors=batch), "pinecone")
+            VECTORS_UPSERTED.inc(len(batch))
+            return len(batch)
+        except Exception as e:
+            EXTERNAL_ERRORS.inc(service="pinecone")
+            logger.error(f"❌ Failed to upload batch of {len(batch)} vectors: {e}")
+            logger.error(traceback.format_exc())
+            return 0
+
+    def build_vectors(self, chunks, embeddings):
+        vectors = super().build_vectors(chunks, embeddings)
+        for vector in vectors:
+            vector["values"] = self.profile.wire_values(vector["values"])
+        return vectors
+
+    def upsert(self, vectors):
+        """Upsert vectors in size-bounded batches concurrently; returns how many were written"""
+        batches = pack_upsert_batches(vectors, float_chars=self.float_chars)
+        uploaded = sum(self._executor.map(self._upsert_batch, batches))
+        logger.info(f"✅ Uploaded {uploaded}/{len(vectors)} vectors in {len(batches)} requests")
+        return uploaded
+
+    def maybe_log_stats(self):
+        now = time.monotonic()
+        if now - self._last_stats < PINECONE_STATS_INTERVAL_SECONDS:
+            return
+        self._last_stats = now
+        try:
+            stats = self.index.describe_index_stats()
             logger.info(f"Total vectors in index: {stats.get('total_vector_count', 'unknown')}")
         except Exception as e:
             logger.error(f"❌ Failed to get index stats: {e}")
-        
-        logger.info(f"✅ Completed Pinecone upload. Total chunks processed: {len(chunks)}, successfully uploaded: {total_uploaded}")
-        return True
-    
-    except Exception as e:
-        logger.error(f"❌ Fatal error in upload_chunks_to_pinecone: {e}")
-        logger.error(traceback.format_exc())
-        return False
\ No newline at end of file
+
+    def connect(self):
+        return self.index
+
+    def delete(self, ids):
+        ids = list(ids)
+        for start in range(0, len(ids), PINECONE_MAX_BATCH_VECTORS):
+            batch = ids[start:start + PINECONE_MAX_BATCH_VECTORS]
+            call_with_retries(lambda: self.index.delete(ids=batch), "pinecone")
+
+    def query(self, vector, top_k=10, filter=None):
+        result = call_with_retries(
+            lambda: self.index.query(vector=list(vector), top_k=top_k, filter=filter, include_metadata=True),
+            "pinecone"
+        )
+        return [{"id": m["id"], "score": m["score"], "metadata": m.get("metadata") or {}} for m in result["matches"]]
+
+    def list_document_ids(self, document_id):
+        # Listing by id prefix needs a serverless index
+        pages = call_with_retries(lambda: list(self.index.list(prefix=document_chunk_prefix(document_id))), "pinecone")
+        return [vector_id for page in pages for vector_id in page]
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+_uploaders = {}
+_uploaders_lock = threading.Lock()
+
+def get_uploader(index_name, api_key, environment):
+    key = (index_name, api_key, environment)
+    with _uploaders_lock:
+        if key not in _uploaders:
+            _uploaders[key] = PineconeUploader(index_name, api_key, environment)
+        return _uploaders[key]
+
+def upload_chunks_to_pinecone(chunks, index_name, api_key, environment):
+    return get_uploader(index_name, api_key, environment).upload_chunks(chunks)
+
+def close_uploaders():
+    """Wait for outstanding upserts and release the upsert threads"""
+    with _uploaders_lock:
+        for uploader in _uploaders.values():
+            uploader.close()
+        _uploaders.clear()
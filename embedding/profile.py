@@ -0,0 +1,58 @@
+"""
+The embedding profile: which model, how many dimensions, and how precisely
+vectors are sent and stored. Everything that creates, checks or sizes
+vectors (embedder, embedding cache, Pinecone index, local store) reads it
+from here, so changing EMBEDDING_DIMENSIONS changes all of them together.
+
+text-embedding-3 models return shortened vectors when asked for fewer
+dimensions; that is the same as truncating the full vector and
+normalizing it again, which is what python -m embedding.recall does to
+compare profiles offline.
+"""
+from config.settings import EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, EMBEDDING_WIRE_PRECISION
+
+NATIVE_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+DEFAULT_DIMENSIONS = 1536
+
+# Decimal places kept per value in the JSON sent to Pinecone; vector
+# components are at most 1 in magnitude, so this bounds the absolute
+# rounding error. Only the payload shrinks: values are not cast to a
+# smaller type, and Pinecone stores float32 either way. (For float16 or
+# int8 storage, see the local store's dtype.)
+WIRE_DECIMALS = {"full": None, "round7": 7, "round4": 4}
+# Approximate JSON characters per value, separator included
+WIRE_FLOAT_CHARS = {"full": 20, "round7": 12, "round4": 9}
+
+class EmbeddingProfile:
+    def __init__(self, model=EMBEDDING_MODEL, dimensions=EMBEDDING_DIMENSIONS, wire_precision=EMBEDDING_WIRE_PRECISION):
+        if wire_precision not in WIRE_DECIMALS:
+            raise ValueError(f"unknown wire precision {wire_precision!r}; use one of {', '.join(WIRE_DECIMALS)}")
+        native = NATIVE_DIMENSIONS.get(model, DEFAULT_DIMENSIONS)
+        if dimensions and dimensions > native:
+            raise ValueError(f"{model} produces at most {native} dimensions, not {dimensions}")
+        self.model = model
+        self.dimensions = dimensions or native
+        # Only sent to the API when it differs from what the model returns anyway
+        self.requested_dimensions = dimensions if dimensions and dimensions != native else None
+        self.wire_precision = wire_precision
+
+    def wire_values(self, values):
+        decimals = WIRE_DECIMALS[self.wire_precision]
+        if decimals is None:
+            return values
+        return [round(v, decimals) for v in values]
+
+    def __repr__(self):
+        return f"EmbeddingProfile({self.model}, {self.dimensions}d, wire={self.wire_precision})"
+
+_profile = None
+
+def get_embedding_profile():
+    global _profile
+    if _profile is None:
+        _profile = EmbeddingProfile()
+    return _profile
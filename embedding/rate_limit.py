@@ -0,0 +1,174 @@
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from monitoring.metrics import EXTERNAL_RETRIES
+from config.settings import (
+    OPENAI_REQUESTS_PER_MINUTE, OPENAI_TOKENS_PER_MINUTE, OPENAI_MAX_CONCURRENCY,
+    PINECONE_REQUESTS_PER_MINUTE, PINECONE_MAX_CONCURRENCY,
+    EXTERNAL_MAX_RETRIES, EXTERNAL_BACKOFF_BASE_SECONDS, EXTERNAL_BACKOFF_MAX_SECONDS
+)
+
+logger = logging.getLogger('kafka-pdf-consumer')
+
+class TokenBucket:
+    """Refills at rate_per_minute, holding at most one minute's worth; a rate of 0 means unlimited"""
+
+    def __init__(self, rate_per_minute):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(rate_per_minute)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount=1):
+        if not self.rate:
+            return
+        # A request larger than the bucket could never fit; let it through once the bucket is full
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate
+            time.sleep(min(wait, 1.0))
+
+class RateLimiter:
+    """
+    Client-side limits for one external service: requests and tokens per
+    minute plus a cap on concurrent calls. When the service throttles us
+    anyway, every caller holds off until the retry-after has passed, and
+    saturated() reports True so the consumer can stop fetching.
+    """
+
+    def __init__(self, name, requests_per_minute=0, tokens_per_minute=0, max_concurrency=0):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._throttled_until = 0.0
+
+    @contextmanager
+    def limit(self, tokens=1):
+        with self._lock:
+            self._waiting += 1
+        holding_slot = False
+        try:
+            delay = self._throttled_until - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if self._slots:
+                self._slots.acquire()
+                holding_slot = True
+            self.requests.acquire(1)
+            self.tokens.acquire(tokens)
+        except BaseException:
+            # Give the slot back, or every failure here shrinks the concurrency for good
+            if holding_slot:
+                self._slots.release()
+            with self._lock:
+                self._waiting -= 1
+            raise
+        with self._lock:
+            self._waiting -= 1
+        try:
+            yield
+        finally:
+            if self._slots:
+                self._slots.release()
+
+    def throttled(self, seconds):
+        with self._lock:
+            self._throttled_until = max(self._throttled_until, time.monotonic() + seconds)
+
+    def saturated(self):
+        """True while throttled, or while more callers are queued than may run at once"""
+        with self._lock:
+            if time.monotonic() < self._throttled_until:
+                return True
+            return bool(self.max_concurrency) and self._waiting >= self.max_concurrency
+
+_limiters = {
+    "openai": RateLimiter("openai", OPENAI_REQUESTS_PER_MINUTE, OPENAI_TOKENS_PER_MINUTE, OPENAI_MAX_CONCURRENCY),
+    "pinecone": RateLimiter("pinecone", PINECONE_REQUESTS_PER_MINUTE, 0, PINECONE_MAX_CONCURRENCY),
+}
+
+def get_limiter(service):
+    return _limiters[service]
+
+def downstream_saturated():
+    """Names of the services currently asking us to slow down"""
+    return [name for name, limiter in _limiters.items() if limiter.saturated()]
+
+def _status_of(error):
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    if status is None and getattr(error, "response", None) is not None:
+        status = getattr(error.response, "status_code", None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def _headers_of(error):
+    headers = getattr(error, "headers", None)
+    if headers is None and getattr(error, "response", None) is not None:
+        headers = getattr(error.response, "headers", None)
+    return headers or {}
+
+def retry_after_seconds(error):
+    """The delay the server asked for, from retry-after-ms or retry-after, if any"""
+    headers = _headers_of(error)
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError, AttributeError):
+        # retry-after may also be an HTTP date; fall back to our own backoff
+        pass
+    return None
+
+def is_retryable(error):
+    status = _status_of(error)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    name = type(error).__name__
+    return "Connection" in name or "Timeout" in name
+
+def call_with_retries(fn, service, tokens=1, retries=EXTERNAL_MAX_RETRIES):
+    """
+    Call fn() inside the service's rate limiter, retrying throttling,
+    server and connection errors with full-jitter exponential backoff. A
+    server-supplied retry-after takes precedence over the computed delay.
+    """
+    limiter = get_limiter(service)
+    attempt = 0
+    while True:
+        try:
+            with limiter.limit(tokens):
+                return fn()
+        except Exception as e:
+            if attempt >= retries or not is_retryable(e):
+                raise
+            attempt += 1
+            delay = retry_after_seconds(e)
+            if delay is None:
+                delay = random.uniform(0, min(EXTERNAL_BACKOFF_MAX_SECONDS, EXTERNAL_BACKOFF_BASE_SECONDS * 2 ** attempt))
+            if _status_of(e) == 429:
+                limiter.throttled(delay)
+            EXTERNAL_RETRIES.inc(service=service)
+            logger.warning(f"⚠️ {service} call failed ({e}); retry {attempt}/{retries} in {delay:.1f}s")
+            time.sleep(delay)
@@ -0,0 +1,184 @@
+"""
+Compare embedding profiles offline: what shorter vectors and smaller
+storage types cost in search quality, size and query time.
+
+    python -m embedding.recall
+    python -m embedding.recall --profiles 1536/float32 512/float16 256/int8 --docs 100
+    python -m embedding.recall --from-db --limit 5000 --profiles 512/float32/round4 --save recall.json
+
+Each profile is DIMENSIONS/STORAGE[/WIRE]: the vector size, the local
+store dtype (float32, float16 or int8) and optionally the decimal places
+the vectors are rounded to for Pinecone (round7 or round4, see
+EMBEDDING_WIRE_PRECISION). STORAGE is the actual stored type, so its
+recall is that of float16 or int8 vectors; WIRE only measures what the
+rounding costs.
+
+Chunks come from the synthetic benchmark corpus, or from the database with
+--from-db. They are embedded once at the model's full size; shorter
+profiles truncate and renormalize those vectors, which is what the API
+returns for the dimensions parameter. Every profile is loaded into a
+LocalVectorStore and queried with a sample of the chunks themselves;
+recall@k is the share of the full-size float32 top-k (the query chunk
+excluded) that the profile also returns. With EMBEDDING_BACKEND=fake the
+vectors are random, so only the size and timing columns mean anything.
+"""
+import argparse
+import json
+import logging
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import psycopg2
+from config.settings import DB_CONFIG, EMBEDDING_BACKEND, EMBEDDING_MODEL
+from embedding.chunker import chunk_document_data, iter_documents_from_db
+from embedding.embedder import FakeEmbeddingBackend, OpenAIEmbeddingBackend, embed_texts
+from embedding.local_vector_store import LocalVectorStore
+from embedding.pinecone_uploader import estimate_vector_bytes
+from embedding.profile import EmbeddingProfile, NATIVE_DIMENSIONS, DEFAULT_DIMENSIONS, WIRE_DECIMALS, WIRE_FLOAT_CHARS
+
+logger = logging.getLogger('kafka-pdf-consumer')
+
+DEFAULT_PROFILES = ("1536/float32", "1536/float16", "1536/int8", "512/float32", "512/int8", "256/float32", "256/int8")
+
+def parse_profile(spec, model):
+    parts = spec.split("/")
+    if len(parts) not in (2, 3):
+        raise argparse.ArgumentTypeError(f"profile {spec!r} is not DIMENSIONS/STORAGE[/WIRE]")
+    profile = EmbeddingProfile(model, int(parts[0]), parts[2] if len(parts) == 3 else "full")
+    return profile, parts[1]
+
+def synthetic_chunks(docs, seed=0):
+    from benchmarks.synthetic_pdf import generate_corpus
+    from parser.pdf_text_extractor import extract_text_from_pdf_bytes
+    from parser.trace_cleaner import process_pdf_text, extract_metadata_from_filename
+
+    chunks = []
+    for document_id, (file_name, pdf_bytes) in enumerate(generate_corpus(docs, seed=seed), 1):
+        parsed = process_pdf_text(extract_text_from_pdf_bytes(pdf_bytes))
+        parsed["course_info"].update(extract_metadata_from_filename(file_name))
+        chunks.extend(chunk_document_data({
+            "document_id": document_id,
+            "document_name": file_name,
+            "full_text": parsed["full_text"],
+            "comments": parsed["comments"],
+            "ratings": parsed["ratings"],
+            "professor": parsed["course_info"].get("instructor", "Unknown"),
+        }))
+    return chunks
+
+def database_chunks(limit):
+    chunks = []
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        for document in iter_documents_from_db(conn):
+            chunks.extend(chunk_document_data(document))
+            if len(chunks) >= limit:
+                break
+    finally:
+        conn.close()
+    return chunks[:limit]
+
+def full_size_backend(model):
+    """The configured backend at the model's own size, whatever EMBEDDING_DIMENSIONS says"""
+    dimension = NATIVE_DIMENSIONS.get(model, DEFAULT_DIMENSIONS)
+    if EMBEDDING_BACKEND == "fake":
+        return FakeEmbeddingBackend(dimension=dimension)
+    return OpenAIEmbeddingBackend(model)
+
+def shortened(vectors, profile):
+    matrix = vectors[:, :profile.dimensions]
+    matrix = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+    decimals = WIRE_DECIMALS[profile.wire_precision]
+    return matrix if decimals is None else np.round(matrix, decimals)
+
+def exact_top_k(vectors, queries, top_k):
+    """Rows of the top_k nearest vectors for each query row, the query itself excluded"""
+    scores = vectors[queries] @ vectors.T
+    scores[np.arange(len(queries)), queries] = -np.inf
+    return np.argsort(-scores, axis=1)[:, :top_k]
+
+def measure(profile, dtype, vectors, ids, queries, baseline, top_k):
+    matrix = shortened(vectors, profile)
+    path = tempfile.mkdtemp(prefix="recall-")
+    try:
+        store = LocalVectorStore(path, dimension=profile.dimensions, dtype=dtype)
+        store.upsert([{"id": vector_id, "values": values} for vector_id, values in zip(ids, matrix)])
+        started = time.perf_counter()
+        results = store.query_many(matrix[queries], top_k=top_k + 1)
+        query_ms = (time.perf_counter() - started) * 1000 / len(queries)
+        store.close()
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+    found = 0
+    for query, matches, expected in zip(queries, results, baseline):
+        returned = [m["id"] for m in matches if m["id"] != ids[query]][:top_k]
+        found += len(set(returned) & {ids[row] for row in expected})
+    wire_bytes = estimate_vector_bytes({"id": ids[0], "values": matrix[0]}, WIRE_FLOAT_CHARS[profile.wire_precision])
+    return {
+        "profile": f"{profile.dimensions}/{dtype}/{profile.wire_precision}",
+        "dimensions": profile.dimensions,
+        "storage": dtype,
+        "wire": profile.wire_precision,
+        f"recall@{top_k}": round(found / (len(queries) * top_k), 4),
+        "bytes_per_vector": profile.dimensions * np.dtype(dtype).itemsize + (4 if dtype == "int8" else 0),
+        "wire_bytes_per_vector": wire_bytes,
+        "query_ms": round(query_ms, 3),
+    }
+
+def compare_profiles(profiles, chunks, model, queries=200, top_k=10, seed=0):
+    texts = [chunk["text"] for chunk in chunks]
+    ids = [chunk["id"] for chunk in chunks]
+    started = time.perf_counter()
+    vectors = np.asarray(embed_texts(texts, backend=full_size_backend(model)), dtype=np.float32)
+    logger.info(f"Embedded {len(texts)} chunks with {model} in {time.perf_counter() - started:.1f}s")
+
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(vectors), size=min(queries, len(vectors)), replace=False)
+    baseline = exact_top_k(vectors / np.linalg.norm(vectors, axis=1, keepdims=True), sample, top_k)
+    return [measure(profile, dtype, vectors, ids, sample, baseline, top_k) for profile, dtype in profiles]
+
+def print_table(rows, top_k):
+    recall = f"recall@{top_k}"
+    print(f"{'profile':<24} {recall:>10} {'bytes/vec':>10} {'wire B/vec':>11} {'query ms':>9}")
+    for row in rows:
+        print(f"{row['profile']:<24} {row[recall]:>10.4f} {row['bytes_per_vector']:>10} {row['wire_bytes_per_vector']:>11} {row['query_ms']:>9.3f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare recall and size of embedding profiles")
+    parser.add_argument("--profiles", nargs="+", default=list(DEFAULT_PROFILES), help="DIMENSIONS/STORAGE[/WIRE] ...")
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--docs", type=int, default=50, help="synthetic documents to chunk")
+    parser.add_argument("--from-db", action="store_true", help="use chunks of stored documents instead")
+    parser.add_argument("--limit", type=int, default=5000, help="at most this many chunks with --from-db")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stderr)]
+    )
+
+    try:
+        profiles = [parse_profile(spec, args.model) for spec in args.profiles]
+    except (argparse.ArgumentTypeError, ValueError) as e:
+        parser.error(str(e))
+    chunks = database_chunks(args.limit) if args.from_db else synthetic_chunks(args.docs, args.seed)
+    if len(chunks) <= args.top_k:
+        parser.error(f"only {len(chunks)} chunks; need more than --top-k")
+
+    rows = compare_profiles(profiles, chunks, args.model, queries=args.queries, top_k=args.top_k, seed=args.seed)
+    print_table(rows, args.top_k)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"model": args.model, "chunks": len(chunks), "queries": min(args.queries, len(chunks)), "results": rows}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
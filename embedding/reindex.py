@@ -0,0 +1,164 @@
+"""
+Re-embed stored documents and upsert them into the vector store.
+
+    python -m embedding.reindex
+    python -m embedding.reindex --semester Fall --year 2024 --instructor Smith
+    python -m embedding.reindex --restart --workers 4 --batch-size 100
+
+Documents are read in id order through a server-side cursor, chunked in
+batches of --batch-size documents, and embedded/upserted by --workers
+threads. After every batch that finished (along with all earlier ones) the
+last document id is written to the checkpoint file, so an interrupted run
+picks up where it stopped. Use it after changing the embedding model or
+profile (into a new index when EMBEDDING_DIMENSIONS changes) or the
+chunking.
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+
+import psycopg2
+from config.settings import DB_CONFIG, REINDEX_CHECKPOINT_PATH
+from embedding.chunker import chunk_document_data, iter_documents_from_db
+from embedding.vector_store import upload_chunks, close_vector_stores
+from pipeline.offsets import OffsetTracker
+
+logger = logging.getLogger('kafka-pdf-consumer')
+
+_STOP = object()
+
+def load_checkpoint(path, filters):
+    """Last finished document id from a previous run with the same filters, else 0"""
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("filters") != filters:
+        logger.warning(f"⚠️ Checkpoint {path} was written for filters {checkpoint.get('filters')}; starting over")
+        return 0
+    return checkpoint.get("last_document_id", 0)
+
+def save_checkpoint(path, filters, last_document_id):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"filters": filters, "last_document_id": last_document_id, "updated_at": time.time()}, f)
+    os.replace(tmp_path, path)
+
+def iter_batches(conn, filters, after_id, batch_size):
+    """Chunk documents in groups of batch_size, yielding (seq, last_id, doc_count, chunks)"""
+    seq, docs, chunks = 0, 0, []
+    last_id = after_id
+    for document in iter_documents_from_db(conn, filters, after_id, fetch_size=batch_size):
+        chunks.extend(chunk_document_data(document))
+        docs += 1
+        last_id = document["document_id"]
+        if docs >= batch_size:
+            yield seq, last_id, docs, chunks
+            seq, docs, chunks = seq + 1, 0, []
+    if docs:
+        yield seq, last_id, docs, chunks
+
+def reindex(filters, checkpoint_path, batch_size=100, workers=2, restart=False):
+    """Run the re-index; returns True when every matching document was uploaded"""
+    after_id = 0 if restart else load_checkpoint(checkpoint_path, filters)
+    if after_id:
+        logger.info(f"↩️ Resuming after document {after_id}")
+
+    batches = queue.Queue(maxsize=workers * 2)
+    tracker = OffsetTracker()
+    last_ids = {}
+    failed = threading.Event()
+    totals = {"documents": 0, "chunks": 0}
+    totals_lock = threading.Lock()
+
+    def upload_worker():
+        while True:
+            item = batches.get()
+            if item is _STOP:
+                break
+            seq, last_id, doc_count, chunks = item
+            if failed.is_set():
+                continue
+            # Every document is re-chunked, so any of them may have parts left over
+            ok = not chunks or upload_chunks(chunks, {chunk["document_id"] for chunk in chunks})
+            if not ok:
+                logger.error(f"❌ Upload failed for documents up to {last_id}; stopping")
+                failed.set()
+                continue
+            with totals_lock:
+                totals["documents"] += doc_count
+                totals["chunks"] += len(chunks)
+            tracker.mark_done("reindex", seq)
+
+    threads = [threading.Thread(target=upload_worker, name=f"reindex-{n}", daemon=True) for n in range(workers)]
+    for t in threads:
+        t.start()
+
+    def commit_progress():
+        ready = tracker.pop_committable().get("reindex")
+        if ready is not None:
+            save_checkpoint(checkpoint_path, filters, last_ids[ready - 1])
+            for seq in [seq for seq in last_ids if seq < ready]:
+                del last_ids[seq]
+
+    started = time.monotonic()
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        for item in iter_batches(conn, filters, after_id, batch_size):
+            if failed.is_set():
+                break
+            # Register the batch before a worker can finish it
+            tracker.add("reindex", item[0])
+            last_ids[item[0]] = item[1]
+            while True:
+                try:
+                    batches.put(item, timeout=1)
+                    break
+                except queue.Full:
+                    commit_progress()
+            commit_progress()
+    finally:
+        conn.close()
+        for _ in threads:
+            batches.put(_STOP)
+        for t in threads:
+            t.join()
+        commit_progress()
+        close_vector_stores()
+
+    elapsed = time.monotonic() - started
+    logger.info(
+        f"✅ Re-indexed {totals['documents']} documents ({totals['chunks']} chunks) in {elapsed:.1f}s"
+        if not failed.is_set() else
+        f"🛑 Re-index stopped after {totals['documents']} documents; rerun to resume from {checkpoint_path}"
+    )
+    return not failed.is_set()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-embed stored TRACE documents into the vector store")
+    parser.add_argument("--semester", help="e.g. Fall")
+    parser.add_argument("--year", type=int)
+    parser.add_argument("--instructor", help="case-insensitive substring of the instructor name")
+    parser.add_argument("--batch-size", type=int, default=100, help="documents per embedding/upsert batch")
+    parser.add_argument("--workers", type=int, default=2, help="batches embedded and upserted concurrently")
+    parser.add_argument("--checkpoint", default=REINDEX_CHECKPOINT_PATH)
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start from the first document")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stderr)]
+    )
+
+    filters = {"semester": args.semester, "year": args.year, "instructor": args.instructor}
+    ok = reindex(filters, args.checkpoint, batch_size=args.batch_size, workers=max(1, args.workers), restart=args.restart)
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
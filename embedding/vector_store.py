@@ -0,0 +1,156 @@
+"""
+Where chunk vectors are written. VECTOR_STORE_BACKEND selects Pinecone
+(embedding.pinecone_uploader) or the local memory-mapped store
+(embedding.local_vector_store); both implement VectorStore:
+
+    upsert(vectors)                  -> number written
+    delete(ids)
+    list_document_ids(document_id)   -> ids of the document's stored chunks
+    query(vector, top_k, filter)     -> [{"id", "score", "metadata"}, ...]
+    close()
+
+Filters use Pinecone's syntax for the fields we set on every chunk, e.g.
+{"professor": "Smith"} or {"chunk_type": {"$in": ["comment", "ratings"]}}.
+"""
+import logging
+import threading
+import traceback
+from embedding.embedder import embed_texts
+from embedding.embedding_cache import get_embedding_cache
+from monitoring.metrics import STAGE_DURATION
+from config.settings import VECTOR_STORE_BACKEND, LOCAL_VECTOR_STORE_PATH, LOCAL_VECTOR_STORE_DTYPE
+from embedding.profile import get_embedding_profile
+from config.settings import PINECONE_INDEX, PINECONE_API_KEY, PINECONE_ENVIRONMENT
+
+logger = logging.getLogger('kafka-pdf-consumer')
+
+def chunk_metadata(chunk):
+    return {
+        "professor": chunk.get("professor", "Unknown"),
+        "chunk_type": chunk.get("chunk_type", "unknown"),
+        "text": chunk["text"][:500]  # Truncate text for metadata
+    }
+
+class VectorStore:
+    """Shared upload path: embed the chunks, then upsert them through the subclass"""
+    name = "vector store"
+    # Set from the embedding profile by each backend
+    dimension = 1536
+
+    def connect(self):
+        """Open connections / files up front instead of on the first upload"""
+
+    def upsert(self, vectors):
+        raise NotImplementedError
+
+    def delete(self, ids):
+        raise NotImplementedError
+
+    def query(self, vector, top_k=10, filter=None):
+        raise NotImplementedError
+
+    def list_document_ids(self, document_id):
+        raise NotImplementedError
+
+    def delete_stale_chunks(self, chunks, documents):
+        """
+        Delete the vectors of these documents that the new chunks no longer
+        include. Documents keep their id when replaced, so one that now
+        splits into fewer parts would otherwise keep its old high-numbered
+        chunks. Costs a listing per document, so callers pass only the
+        documents that replaced an earlier version. Returns how many were
+        deleted.
+        """
+        keep = {chunk["id"] for chunk in chunks}
+        stale = [
+            vector_id
+            for document_id in documents
+            for vector_id in self.list_document_ids(document_id)
+            if vector_id not in keep
+        ]
+        if stale:
+            self.delete(stale)
+            logger.info(f"🧹 Deleted {len(stale)} stale chunk vectors of {len(documents)} documents")
+        return len(stale)
+
+    def maybe_log_stats(self):
+        pass
+
+    def close(self):
+        pass
+
+    def build_vectors(self, chunks, embeddings):
+        vectors = []
+        for chunk, values in zip(chunks, embeddings):
+            # Validate vector; the store would reject it anyway, so fail the upload up front
+            if len(values) != self.dimension:
+                raise ValueError(f"Vector dimension mismatch for {chunk['id']}: {len(values)} (expected {self.dimension})")
+            vectors.append({"id": chunk["id"], "values": values, "metadata": chunk_metadata(chunk)})
+        return vectors
+
+    def upload_chunks(self, chunks, replaced=()):
+        """
+        Embed and upsert chunks; True when every vector was written. replaced
+        names the documents among them that were stored over an earlier
+        version, whose chunks the new ones don't overwrite are then deleted.
+        """
+        try:
+            logger.info(f"Uploading {len(chunks)} chunks to {self.name}")
+
+            # Embed every chunk up front in as few requests as possible
+            try:
+                with STAGE_DURATION.time(stage="embed"):
+                    embeddings = embed_texts([chunk["text"] for chunk in chunks])
+            except Exception as e:
+                logger.error(f"❌ Failed to create embeddings for {len(chunks)} chunks: {e}")
+                return False
+
+            cache = get_embedding_cache()
+            if cache:
+                logger.info(f"Embedding cache stats: {cache.stats()}")
+
+            total_uploaded = self.upsert(self.build_vectors(chunks, embeddings))
+            # Only once the new chunks are in, so a document is never left without vectors
+            if replaced and total_uploaded == len(chunks):
+                self.delete_stale_chunks(chunks, set(replaced))
+            self.maybe_log_stats()
+
+            logger.info(f"✅ Completed upload to {self.name}. Total chunks processed: {len(chunks)}, successfully uploaded: {total_uploaded}")
+            # Report partial uploads as failures so the caller doesn't treat missing vectors as done
+            return total_uploaded == len(chunks)
+
+        except Exception as e:
+            logger.error(f"❌ Fatal error uploading to {self.name}: {e}")
+            logger.error(traceback.format_exc())
+            return False
+
+_local_stores = {}
+_local_lock = threading.Lock()
+
+def get_vector_store(backend=None):
+    """The process-wide store for the configured backend"""
+    backend = backend or VECTOR_STORE_BACKEND
+    if backend == "local":
+        # numpy is only needed for the local store
+        from embedding.local_vector_store import LocalVectorStore
+        with _local_lock:
+            if LOCAL_VECTOR_STORE_PATH not in _local_stores:
+                _local_stores[LOCAL_VECTOR_STORE_PATH] = LocalVectorStore(
+                    LOCAL_VECTOR_STORE_PATH, dimension=get_embedding_profile().dimensions, dtype=LOCAL_VECTOR_STORE_DTYPE
+                )
+            return _local_stores[LOCAL_VECTOR_STORE_PATH]
+    from embedding.pinecone_uploader import get_uploader
+    return get_uploader(PINECONE_INDEX, PINECONE_API_KEY, PINECONE_ENVIRONMENT)
+
+def upload_chunks(chunks, replaced=()):
+    """Embed chunks and write them to the configured store; False if any vector is missing"""
+    return get_vector_store().upload_chunks(chunks, replaced)
+
+def close_vector_stores():
+    """Flush and close every store opened by this process"""
+    from embedding.pinecone_uploader import close_uploaders
+    close_uploaders()
+    with _local_lock:
+        for store in _local_stores.values():
+            store.close()
+        _local_stores.clear()
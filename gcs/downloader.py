@@ -1,10 +1,76 @@
 import os
-from google.cloud import storage
-from google.oauth2 import service_account
+import io
+
+# One client per process: building a client re-reads credentials and opens a
+# new HTTP session, so it is created lazily and reused for every download.
+# The pid check makes forked worker processes build their own. The SDK
+# itself is only imported on first use to keep startup fast.
+_client = None
+_client_pid = None
+
+def get_storage_client():
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        from google.cloud import storage
+        _client = storage.Client()
+        _client_pid = os.getpid()
+    return _client
+
+def _get_blob(bucket_name, file_name, generation=None):
+    # client.bucket() builds the handle locally; get_bucket() would cost a metadata RPC
+    bucket = get_storage_client().bucket(bucket_name)
+    return bucket.blob(file_name, generation=generation)
 
 def download_pdf_from_gcs(bucket_name, file_name, local_path):
-    client = storage.Client()
-    bucket = client.get_bucket(bucket_name)
-    blob = bucket.blob(file_name)
+    blob = _get_blob(bucket_name, file_name)
     blob.download_to_filename(local_path)
     print(f"✅ Downloaded {file_name} to {local_path}")
+
+def download_pdf_bytes(bucket_name, file_name, chunk_size=8 * 1024 * 1024, generation=None):
+    """
+    Download an object straight into memory.
+
+    Small files finish in a single request. Larger files are fetched as
+    consecutive ranged reads of chunk_size bytes, so a dropped connection
+    only retries one chunk instead of the whole file.
+    """
+    from google.api_core.exceptions import RequestRangeNotSatisfiable
+
+    blob = _get_blob(bucket_name, file_name, generation=generation)
+    buffer = io.BytesIO()
+    start = 0
+    while True:
+        try:
+            chunk = blob.download_as_bytes(start=start, end=start + chunk_size - 1)
+        except RequestRangeNotSatisfiable:
+            # Object size was an exact multiple of chunk_size
+            break
+        buffer.write(chunk)
+        if len(chunk) < chunk_size:
+            break
+        start += len(chunk)
+
+    data = buffer.getvalue()
+    print(f"✅ Downloaded {file_name} into memory ({len(data)} bytes)")
+    return data
+
+def get_object_fingerprint(bucket_name, file_name):
+    """Fetch (generation, md5_hash) with one metadata request; (None, None) if the object is gone"""
+    blob = get_storage_client().bucket(bucket_name).get_blob(file_name)
+    if blob is None:
+        return None, None
+    return blob.generation, blob.md5_hash
+
+def list_objects(bucket_name, prefix=None, page_size=1000):
+    """
+    Yield (name, generation, md5_hash) for every object under prefix. The
+    listing is paged by the SDK and only asks for the fields used here.
+    """
+    blobs = get_storage_client().list_blobs(
+        bucket_name,
+        prefix=prefix,
+        page_size=page_size,
+        fields="items(name,generation,md5Hash),nextPageToken"
+    )
+    for blob in blobs:
+        yield blob.name, blob.generation, blob.md5_hash
@@ -1,160 +1,447 @@
-import json
 import os
 import sys
+import queue
+import signal
 import logging
+import threading
+import time
 import traceback
-from kafka import KafkaConsumer
-import psycopg2
-from config.settings import DB_CONFIG
-from gcs.downloader import download_pdf_from_gcs
-from parser.pdf_text_extractor import extract_text_from_pdf
-from parser.trace_cleaner import process_pdf_text, extract_metadata_from_filename
-from db.db_insert import store_in_database
-from embedding.chunker import chunk_document_data
-from embedding.pinecone_uploader import upload_chunks_to_pinecone
-from config.settings import PINECONE_API_KEY, PINECONE_ENVIRONMENT, PINECONE_INDEX,KAFKA_BOOTSTRAP_SERVERS,KAFKA_TOPIC_NAME, LOCAL_PDF_DIR, KAFKA_GROUP_ID
-
-# Set up logging to be captured in Kubernetes
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[logging.StreamHandler(sys.stderr)]
-)
+from concurrent.futures import ThreadPoolExecutor
+from kafka import KafkaConsumer, KafkaProducer, ConsumerRebalanceListener
+from kafka.structs import OffsetAndMetadata
+from db.pool import run_with_connection, close_pool
+from db.schema import ensure_schema
+from parser.worker_pool import get_parse_pool, shutdown_parse_pool
+from gcs.downloader import get_storage_client
+from embedding.embedder import get_embedding_backend
+from embedding.profile import get_embedding_profile
+from embedding.vector_store import get_vector_store, close_vector_stores
+from embedding.rate_limit import downstream_saturated
+from monitoring.profiling import get_profiler, traced
+from monitoring.metrics import start_metrics_server, add_route, DOCUMENTS_PROCESSED, KAFKA_LAG, IN_FLIGHT, QUEUE_DEPTH
+from pipeline.offsets import OffsetTracker
+from pipeline.staged import StagedPipeline
+from pipeline.batching import MicroBatcher
+from pipeline.retry import FailureRouter, DelayedPartitions, retry_topics, read_headers, decode_value
+from pipeline.stages import make_job, build_stages, cleanup_job, run_job, run_batch
+from config.settings import KAFKA_BOOTSTRAP_SERVERS, KAFKA_TOPIC_NAME, LOCAL_PDF_DIR, KAFKA_GROUP_ID, KAFKA_MAX_POLL_RECORDS, PDF_DOWNLOAD_MODE
+from config.settings import PIPELINE_MODE, PIPELINE_QUEUE_SIZE, PIPELINE_MAX_IN_FLIGHT, METRICS_PORT, METRICS_LAG_INTERVAL_SECONDS
+from config.settings import PIPELINE_BATCH_SIZE, PIPELINE_BATCH_WINDOW_SECONDS, PIPELINE_BATCH_WORKERS, RETRY_ENABLED
+from config.settings import PARSE_WORKER_MODE, LIVENESS_TIMEOUT_SECONDS
+
 logger = logging.getLogger('kafka-pdf-consumer')
 
-# Create a directory for PDFs with proper absolute path
-local_dir = LOCAL_PDF_DIR  # Use a standard temp directory in containers
-os.makedirs(local_dir, exist_ok=True)
-
-# Initialize database connection
-try:
-    conn = psycopg2.connect(**DB_CONFIG)
-    logger.info("✅ Database connection established")
-except Exception as e:
-    logger.error(f"❌ Database connection failed: {e}")
-    sys.exit(1)
-
-# Initialize the Kafka consumer
-try:
-    consumer = KafkaConsumer(
-        KAFKA_TOPIC_NAME,
-        bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS,
-        value_deserializer=lambda m: json.loads(m.decode("utf-8")),
-        group_id=KAFKA_GROUP_ID,
-        # Improved settings for reliability
-        auto_offset_reset='earliest',  # Start from earliest unprocessed message
-        enable_auto_commit=True,  # Auto-commit offsets
-        auto_commit_interval_ms=5000,  # Commit every 5 seconds
-        session_timeout_ms=30000,  # 30-second session timeout
-        heartbeat_interval_ms=10000  # 10-second heartbeat
+class CommitOnRevoke(ConsumerRebalanceListener):
+    def __init__(self, app):
+        self.app = app
+
+    def on_partitions_revoked(self, revoked):
+        app = self.app
+        try:
+            app.commit_completed()
+        except Exception as e:
+            logger.error(f"❌ Failed to commit offsets on revoke: {e}")
+        app.tracker.revoke(revoked)
+        app.delayed.forget(revoked)
+        for tp in revoked:
+            app.committed_offsets.pop(tp, None)
+        logger.info(f"Partitions revoked: {[tp.partition for tp in revoked]}")
+
+    def on_partitions_assigned(self, assigned):
+        logger.info(f"Partitions assigned: {[tp.partition for tp in assigned]}")
+
+class ConsumerApp:
+    """
+    The PDF ingestion consumer. Nothing connects until start(); run()
+    polls until stop() is called (SIGTERM / SIGINT under main()), then
+    drains in-flight work, commits it and closes every client.
+
+    Offsets are committed by hand once a message has fully finished, so a
+    rebalance never skips a document that was still being processed.
+    """
+
+    def __init__(self):
+        self.tracker = OffsetTracker()
+        self.completed = queue.Queue()
+        self.committed_offsets = {}
+        self.consumer = None
+        self.delayed = None
+        self.router = None
+        self.pipeline = None
+        self.batcher = None
+        self.ready = {}
+        self.draining = False
+        self.last_progress = time.monotonic()
+        self._stop = threading.Event()
+        # Create a directory for PDFs with proper absolute path (only needed
+        # when PDFs are spooled to disk instead of parsed from memory)
+        self.local_dir = LOCAL_PDF_DIR
+
+    # --- startup -----------------------------------------------------------
+
+    def warm_up(self):
+        """
+        Create every client in parallel so a new pod pays for the slowest
+        one rather than the sum of them. Any failure is fatal: the pod is
+        restarted instead of failing every message.
+        """
+        tasks = {
+            "database": lambda: run_with_connection(ensure_schema),
+            "kafka": self._connect_kafka,
+            "gcs": get_storage_client,
+            "vector_store": lambda: get_vector_store().connect(),
+        }
+        backend = get_embedding_backend()
+        if getattr(backend, "service", None) == "openai":
+            tasks["openai"] = lambda: backend.client
+        if PARSE_WORKER_MODE == "process":
+            tasks["parser"] = get_parse_pool
+
+        self.ready = {name: False for name in tasks}
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="warmup") as executor:
+            futures = {name: executor.submit(self._warm, name, fn) for name, fn in tasks.items()}
+        failed = [name for name, future in futures.items() if not future.result()]
+        if failed:
+            raise RuntimeError(f"could not initialize: {', '.join(failed)}")
+        logger.info(f"✅ All clients ready in {time.monotonic() - started:.1f}s")
+
+    def _warm(self, name, fn):
+        started = time.monotonic()
+        try:
+            fn()
+        except Exception as e:
+            logger.error(f"❌ {name} initialization failed: {e}")
+            logger.error(traceback.format_exc())
+            return False
+        self.ready[name] = True
+        logger.info(f"✅ {name} ready ({time.monotonic() - started:.1f}s)")
+        return True
+
+    def _connect_kafka(self):
+        self.consumer = KafkaConsumer(
+            bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS,
+            value_deserializer=decode_value,
+            group_id=KAFKA_GROUP_ID,
+            # Improved settings for reliability
+            auto_offset_reset='earliest',  # Start from earliest unprocessed message
+            enable_auto_commit=False,  # Offsets are committed after processing completes
+            max_poll_records=KAFKA_MAX_POLL_RECORDS,
+            session_timeout_ms=30000,  # 30-second session timeout
+            heartbeat_interval_ms=10000  # 10-second heartbeat
+        )
+        # Failed messages come back through the delayed retry topics
+        topics = [KAFKA_TOPIC_NAME] + (retry_topics() if RETRY_ENABLED else [])
+        self.consumer.subscribe(topics, listener=CommitOnRevoke(self))
+        self.delayed = DelayedPartitions(self.consumer)
+
+        if RETRY_ENABLED:
+            producer = KafkaProducer(bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS, acks='all', linger_ms=5)
+            self.router = FailureRouter(producer)
+
+        # Log what topics the consumer is actually subscribed to
+        logger.info(f"Consumer subscribed to topics: {self.consumer.subscription()}")
+        logger.info(f"Consumer group ID: {KAFKA_GROUP_ID}")
+
+    def start_pipeline(self):
+        if PIPELINE_MODE == "batched":
+            self.batcher = MicroBatcher(
+                traced("store_embed_batch", run_batch),
+                on_complete=self.on_job_complete,
+                max_size=PIPELINE_BATCH_SIZE,
+                max_wait=PIPELINE_BATCH_WINDOW_SECONDS,
+                workers=PIPELINE_BATCH_WORKERS,
+                queue_size=PIPELINE_QUEUE_SIZE
+            )
+            self.batcher.start()
+            self.pipeline = StagedPipeline(
+                build_stages(batched=True),
+                on_complete=self.on_job_parsed,
+                queue_size=PIPELINE_QUEUE_SIZE,
+                on_progress=self.heartbeat
+            )
+            self.pipeline.start()
+        elif PIPELINE_MODE == "staged":
+            self.pipeline = StagedPipeline(
+                build_stages(),
+                on_complete=self.on_job_complete,
+                queue_size=PIPELINE_QUEUE_SIZE,
+                on_progress=self.heartbeat
+            )
+            self.pipeline.start()
+        logger.info(f"Pipeline mode: {PIPELINE_MODE}")
+        logger.info(f"Embedding profile: {get_embedding_profile()}")
+
+    def start(self):
+        if PDF_DOWNLOAD_MODE != "memory":
+            os.makedirs(self.local_dir, exist_ok=True)
+        self.warm_up()
+        self.start_pipeline()
+        logger.info("📥 Kafka Consumer is running and waiting for PDF upload events...")
+
+    # --- health ------------------------------------------------------------
+
+    def heartbeat(self):
+        self.last_progress = time.monotonic()
+
+    def liveness(self):
+        # The poll loop wakes at least once a second unless it is running a
+        # job (sequential mode) or waiting for pipeline room (staged and
+        # batched); every finished stage counts as progress too. Nothing
+        # moving at all means a stuck consumer.
+        stalled = time.monotonic() - self.last_progress
+        if self.consumer is not None and not self.draining and stalled > LIVENESS_TIMEOUT_SECONDS:
+            return 500, f"no progress for {stalled:.0f}s\n"
+        return 200, "ok\n"
+
+    def readiness(self):
+        pending = [name for name, ok in self.ready.items() if not ok]
+        if self.draining:
+            return 503, "draining\n"
+        if not self.ready or pending:
+            return 503, f"waiting for: {', '.join(pending) or 'startup'}\n"
+        return 200, "ready\n"
+
+    # --- offsets and metrics -------------------------------------------------
+
+    def commit_completed(self):
+        while True:
+            try:
+                tp, offset = self.completed.get_nowait()
+            except queue.Empty:
+                break
+            self.tracker.mark_done(tp, offset)
+
+        offsets = self.tracker.pop_committable()
+        if offsets:
+            self.consumer.commit({tp: OffsetAndMetadata(offset, None) for tp, offset in offsets.items()})
+            self.committed_offsets.update(offsets)
+
+    def update_consumer_metrics(self):
+        """Refresh lag and queue gauges; uses only metadata the consumer already has, no broker calls"""
+        consumer = self.consumer
+        lag = {}
+        for tp in consumer.assignment():
+            highwater = consumer.highwater(tp)
+            if highwater is None:
+                continue
+            committed = self.committed_offsets.get(tp)
+            lag[(tp.topic, tp.partition)] = max(0, highwater - (committed if committed is not None else consumer.position(tp)))
+        KAFKA_LAG.replace(lag)
+        IN_FLIGHT.set(self.tracker.in_flight())
+        if self.pipeline is not None:
+            depths = self.pipeline.queue_depths()
+            if self.batcher is not None:
+                depths["batch"] = self.batcher.depth()
+            QUEUE_DEPTH.replace(depths)
+
+    # --- message handling ----------------------------------------------------
+
+    def route_failure(self, tp, offset, value, retry_info, error, permanent=False):
+        """
+        Pass a failed message on to the retry / dead-letter topics. Returns False
+        if that didn't work; the offset then stays uncommitted so the message is
+        redelivered after a restart or rebalance rather than lost.
+        """
+        if self.router is None:
+            return True
+        try:
+            self.router.route(value, retry_info, error, tp.topic, tp.partition, offset, permanent=permanent)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Could not publish failed message {tp.topic}[{tp.partition}]@{offset}: {e}")
+            return False
+
+    def on_job_complete(self, job, error):
+        self.heartbeat()
+        cleanup_job(job)
+        get_profiler().finish(job.pop("trace", None), error)
+        if error is not None:
+            DOCUMENTS_PROCESSED.inc(status="error")
+            logger.error(f"❌ Error processing file {job['file_name']}: {error}")
+            if not self.route_failure(job["tp"], job["offset"], job["value"], job["retry"], error):
+                return
+        elif job.get("skipped"):
+            DOCUMENTS_PROCESSED.inc(status="skipped")
+        else:
+            DOCUMENTS_PROCESSED.inc(status="ok")
+            logger.info(f"✅ Successfully processed '{job['file_name']}'")
+        self.completed.put((job["tp"], job["offset"]))
+
+    def on_job_parsed(self, job, error):
+        # Batched mode: parsed documents wait for their batch; failures and
+        # skips finish straight away
+        if error is not None or job.get("skipped"):
+            self.on_job_complete(job, error)
+        else:
+            self.batcher.submit(job)
+
+    def handle_message(self, tp, message, retry_info):
+        data = message.value
+        logger.info(f"Received message: {str(data)[:200]}...")  # Log first 200 chars
+
+        job = make_job(data, self.local_dir, tp.partition, message.offset) if isinstance(data, dict) else None
+        if job is None:
+            logger.error(f"❌ Missing bucket or file_name in message: {data}")
+            DOCUMENTS_PROCESSED.inc(status="invalid")
+            # Retrying can't fix a malformed message; park it on the dead-letter topic
+            if self.route_failure(tp, message.offset, data, retry_info, ValueError("invalid message"), permanent=True):
+                self.completed.put((tp, message.offset))
+            return
+
+        job["tp"] = tp
+        job["offset"] = message.offset
+        job["value"] = data
+        job["retry"] = retry_info
+        if retry_info["attempt"]:
+            logger.info(f"🔁 Retry attempt {retry_info['attempt']} after: {retry_info['error']}")
+        logger.info(f"📂 Processing file: {job['file_name']} from bucket: {job['bucket']}")
+
+        job["trace"] = get_profiler().start(job["file_name"])
+        if self.pipeline is not None:
+            try:
+                self.pipeline.submit(job)
+            except BaseException as e:
+                get_profiler().finish(job.pop("trace", None), e)
+                raise
+            return
+
+        error = None
+        try:
+            run_job(job, progress=self.heartbeat)
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            error = e
+        self.on_job_complete(job, error)
+
+    # --- main loop ------------------------------------------------------------
+
+    def stop(self):
+        """Ask run() to return after the current poll; safe to call from a signal handler"""
+        self._stop.set()
+
+    def run(self):
+        consumer = self.consumer
+        last_metrics_update = 0.0
+        backpressure = False
+        try:
+            # Poll with a timeout so stop() is noticed within a second
+            while not self._stop.is_set():
+                self.heartbeat()
+                self.commit_completed()
+
+                if METRICS_PORT and time.monotonic() - last_metrics_update >= METRICS_LAG_INTERVAL_SECONDS:
+                    self.update_consumer_metrics()
+                    last_metrics_update = time.monotonic()
+
+                # Stop fetching while too much work is queued or OpenAI/Pinecone are
+                # throttling us; polling continues so the consumer stays in the group.
+                # Retry partitions whose next message isn't due yet stay paused too.
+                saturated = downstream_saturated()
+                assignment = consumer.assignment()
+                if self.tracker.in_flight() >= PIPELINE_MAX_IN_FLIGHT or saturated:
+                    if not backpressure:
+                        reason = f"{', '.join(saturated)} saturated" if saturated else f"{self.tracker.in_flight()} messages in flight"
+                        logger.info(f"⏸️ Pausing fetch: {reason}")
+                        backpressure = True
+                    hold = set(assignment)
+                else:
+                    if backpressure:
+                        logger.info("▶️ Resuming fetch")
+                        backpressure = False
+                    hold = self.delayed.held() & assignment
+                if hold:
+                    consumer.pause(*hold)
+                release = consumer.paused() - hold
+                if release:
+                    consumer.resume(*release)
+
+                message_batch = consumer.poll(timeout_ms=1000)
+                if not message_batch:
+                    # No messages received in this poll cycle
+                    continue
+
+                # Process each partition's messages
+                for tp, messages in message_batch.items():
+                    logger.info(f"Received {len(messages)} messages from partition {tp.partition}")
+
+                    for message in messages:
+                        retry_info = read_headers(message.headers)
+                        if retry_info["not_before"] > time.time():
+                            # Rest of this batch is re-fetched once the partition is due
+                            self.delayed.defer(tp, message.offset, retry_info["not_before"])
+                            break
+
+                        self.heartbeat()
+                        self.tracker.add(tp, message.offset)
+                        try:
+                            self.handle_message(tp, message, retry_info)
+                        except Exception as e:
+                            logger.error(f"❌ Error processing message: {e}")
+                            logger.error(traceback.format_exc())
+                            if self.route_failure(tp, message.offset, message.value, retry_info, e):
+                                self.completed.put((tp, message.offset))
+
+                        if self.pipeline is None:
+                            self.commit_completed()
+        except Exception as e:
+            logger.error(f"❌ Unexpected error in consumer loop: {e}")
+            logger.error(traceback.format_exc())
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """Finish in-flight work, commit it and leave the group"""
+        self.draining = True
+        logger.info(f"👋 Draining {self.tracker.in_flight()} in-flight message(s)")
+        if self.pipeline is not None:
+            self.pipeline.shutdown()
+        if self.batcher is not None:
+            self.batcher.shutdown()
+        shutdown_parse_pool()
+        close_vector_stores()
+        if self.consumer is not None:
+            try:
+                self.commit_completed()
+            except Exception as e:
+                logger.error(f"❌ Failed to commit final offsets: {e}")
+            self.consumer.close()
+        if self.router is not None:
+            self.router.producer.close()
+        close_pool()
+        logger.info("🛑 Consumer has shut down")
+
+def main():
+    # Set up logging to be captured in Kubernetes
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stderr)]
     )
 
-    # Log what topics the consumer is actually subscribed to
-    logger.info(f"Consumer subscribed to topics: {consumer.subscription()}")
-    logger.info(f"Consumer group ID: pdf-processing-group")
-    logger.info("📥 Kafka Consumer is running and waiting for PDF upload events...")
-
-except Exception as e:
-    logger.error(f"❌ Failed to initialize Kafka consumer: {e}")
-    logger.error(traceback.format_exc())
-    sys.exit(1)
-
-# Main processing loop
-try:
-    # Poll for messages with a timeout to allow for clean shutdown
-    while True:
-        # Poll with a timeout to allow for clean shutdown
-        message_batch = consumer.poll(timeout_ms=1000)
-        if not message_batch:
-            # No messages received in this poll cycle
-            continue
-
-        # Process each partition's messages
-        for tp, messages in message_batch.items():
-            logger.info(f"Received {len(messages)} messages from partition {tp.partition}")
-
-            for message in messages:
-                try:
-                    data = message.value
-                    logger.info(f"Received message: {json.dumps(data)[:200]}...")  # Log first 200 chars
-
-                    # Extract message data
-                    bucket = data.get("bucket")
-                    file_name = data.get("file")
-
-                    if not bucket or not file_name:
-                        logger.error(f"❌ Missing bucket or file_name in message: {data}")
-                        continue
-
-                    logger.info(f"📂 Processing file: {file_name} from bucket: {bucket}")
-
-                    # Create local path for PDF
-                    local_path = os.path.join(local_dir, os.path.basename(file_name))
-
-                    # Process the PDF
-                    try:
-                        # Download PDF
-                        logger.info(f"⬇️ Downloading PDF from GCS: {bucket}/{file_name}")
-                        download_pdf_from_gcs(bucket, file_name, local_path)
-
-                        # Extract text
-                        logger.info(f"📄 Extracting text from PDF")
-                        text = extract_text_from_pdf(local_path)
-
-                        # Parse and process
-                        logger.info(f"🔍 Processing PDF text")
-                        parsed_data = process_pdf_text(text)
-                        parsed_data["course_info"].update(extract_metadata_from_filename(file_name))
-
-                        # Store in database
-                        logger.info(f"💾 Storing data in PostgreSQL")
-                        document_id = store_in_database(conn, parsed_data, file_name)
-
-                        # Vectorize and store in Pinecone
-                        if document_id:
-                            logger.info(f"🔗 Chunking document {document_id} for embedding")
-                            chunked_data = chunk_document_data({
-                                "document_id": document_id,
-                                "document_name": file_name,
-                                "full_text": parsed_data["full_text"],
-                                "comments": parsed_data.get("comments", []),
-                                "professor": parsed_data["course_info"].get("instructor", "Unknown")
-                            })
-
-                            logger.info(f"📤 Uploading chunks to Pinecone")
-                            upload_chunks_to_pinecone(
-                                chunked_data,
-                                index_name=PINECONE_INDEX,
-                                api_key=PINECONE_API_KEY,
-                                environment=PINECONE_ENVIRONMENT
-                            )
-
-                            logger.info(f"✅ Vectorized and uploaded document ID {document_id} to Pinecone")
-
-                        # Cleanup
-                        if os.path.exists(local_path):
-                            os.remove(local_path)
-                            logger.info(f"🧹 Removed temporary file: {local_path}")
-
-                        logger.info(f"✅ Successfully processed '{file_name}'")
-
-                    except Exception as e:
-                        logger.error(f"❌ Error processing file {file_name}: {e}")
-                        logger.error(traceback.format_exc())
-
-                except Exception as e:
-                    logger.error(f"❌ Error processing message: {e}")
-                    logger.error(traceback.format_exc())
-
-except KeyboardInterrupt:
-    logger.info("👋 Shutting down consumer")
-except Exception as e:
-    logger.error(f"❌ Unexpected error in consumer loop: {e}")
-    logger.error(traceback.format_exc())
-finally:
-    # Clean shutdown
-    if 'consumer' in locals():
-        consumer.close()
-    if 'conn' in locals() and conn:
-        conn.close()
-    logger.info("🛑 Consumer has shut down")
\ No newline at end of file
+    app = ConsumerApp()
+    if METRICS_PORT:
+        add_route('/healthz', app.liveness)
+        add_route('/readyz', app.readiness)
+        start_metrics_server(METRICS_PORT)
+
+    # Kubernetes sends SIGTERM before killing the pod; finish what we have
+    def request_stop(signum, frame):
+        logger.info(f"Received {signal.Signals(signum).name}; stopping after in-flight work")
+        app.stop()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    # kill -USR2 <pid> switches profiling on or off (see monitoring.profiling)
+    signal.signal(signal.SIGUSR2, lambda signum, frame: get_profiler().toggle())
+
+    try:
+        app.start()
+    except Exception as e:
+        logger.error(f"❌ Startup failed: {e}")
+        app.shutdown()
+        sys.exit(1)
+    app.run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger('kafka-pdf-consumer')
+
+# Minimal Prometheus text-format metrics, kept dependency-free. Each metric
+# is a family keyed by label values; render() produces the /metrics body.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_registry = []
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + (extra or [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}"]
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def replace(self, values):
+        """
+        Swap in every value of the gauge at once, dropping stale labels (e.g.
+        after a rebalance). Keys are label values in labelnames order: a tuple,
+        or a plain value for a single-label gauge.
+        """
+        with self._lock:
+            self._values = {
+                tuple(str(v) for v in (labels if isinstance(labels, tuple) else (labels,))): value
+                for labels, value in values.items()
+            }
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+            state['counts'][bisect.bisect_left(self.buckets, value)] += 1
+            state['sum'] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _render_value(self, key, state):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), state['counts']):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, [('le', bound)])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {state['sum']}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+STAGE_DURATION = Histogram(
+    'trace_consumer_stage_duration_seconds', 'Time spent in each pipeline stage per document', ['stage'])
+DOCUMENTS_PROCESSED = Counter(
+    'trace_consumer_documents_total', 'Messages finished, by outcome', ['status'])
+BYTES_DOWNLOADED = Counter(
+    'trace_consumer_downloaded_bytes_total', 'PDF bytes downloaded from GCS')
+CHUNKS_PRODUCED = Counter(
+    'trace_consumer_chunks_total', 'Chunks produced for embedding')
+VECTORS_UPSERTED = Counter(
+    'trace_consumer_vectors_upserted_total', 'Vectors written to the vector store')
+EXTERNAL_ERRORS = Counter(
+    'trace_consumer_external_errors_total', 'Failed calls to external services', ['service'])
+FAILURES_ROUTED = Counter(
+    'trace_consumer_failures_routed_total', 'Failed messages re-published, by destination (retry or dlq)', ['destination'])
+EXTERNAL_RETRIES = Counter(
+    'trace_consumer_external_retries_total', 'Retried calls to external services', ['service'])
+SLOW_MESSAGES = Counter(
+    'trace_consumer_slow_messages_total', 'Messages over PROFILE_SLOW_MESSAGE_SECONDS while profiling is on')
+KAFKA_LAG = Gauge(
+    'trace_consumer_kafka_lag_messages', 'High watermark minus committed offset per assigned partition', ['topic', 'partition'])
+IN_FLIGHT = Gauge(
+    'trace_consumer_in_flight_messages', 'Messages received but not yet committed')
+QUEUE_DEPTH = Gauge(
+    'trace_consumer_queue_depth', 'Jobs waiting in front of each pipeline stage', ['stage'])
+
+# Extra HTTP routes (path -> callable returning (status, body)), so other
+# endpoints can share the metrics server
+_routes = {'/metrics': lambda: (200, render())}
+
+def add_route(path, handler):
+    _routes[path] = handler
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        handler = _routes.get(self.path.split('?')[0])
+        if handler is None:
+            status, body = 404, 'not found\n'
+        else:
+            status, body = handler()
+        payload = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would drown the application log
+        pass
+
+def start_metrics_server(port):
+    server = ThreadingHTTPServer(('0.0.0.0', port), _Handler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True)
+    thread.start()
+    logger.info(f"📊 Metrics available on :{port}/metrics")
+    return server
@@ -0,0 +1,156 @@
+"""
+On-demand profiling of individual messages.
+
+While profiling is on (PROFILE_ENABLED, or toggled with SIGUSR2), each
+message carries a MessageTrace under job["trace"] that collects per-stage
+timings; messages slower than PROFILE_SLOW_MESSAGE_SECONDS are logged with
+them. PROFILE_SAMPLE_RATE of the messages are also run under cProfile and
+tracemalloc, one message at a time, and leave
+
+    <PROFILE_DIR>/<time>-<file>.pstats      python -m pstats <file>
+    <PROFILE_DIR>/<time>-<file>.alloc.txt   top allocation growth per stage
+
+behind. Stages run on several threads, so allocation diffs include what
+other threads allocated meanwhile; with PARSE_WORKER_MODE=process the
+parse itself happens in a worker process and shows up as waiting (profile
+it with PARSE_WORKER_MODE=inline). While profiling is off no trace is
+created and a stage costs one dict lookup more.
+"""
+import os
+import re
+import time
+import random
+import logging
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from monitoring.metrics import SLOW_MESSAGES
+from config.settings import PROFILE_ENABLED, PROFILE_SAMPLE_RATE, PROFILE_DIR, PROFILE_TRACEMALLOC
+from config.settings import PROFILE_TOP_ALLOCATIONS, PROFILE_SLOW_MESSAGE_SECONDS
+
+logger = logging.getLogger('kafka-pdf-consumer')
+
+class MessageTrace:
+    def __init__(self, file_name, profile=False, track_memory=False):
+        self.file_name = file_name
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.allocations = {}
+        self.profile = cProfile.Profile() if profile else None
+        self.track_memory = track_memory
+        self.stop_tracemalloc = False
+
+    @property
+    def sampled(self):
+        return self.profile is not None
+
+    @contextmanager
+    def stage(self, name):
+        before = tracemalloc.take_snapshot() if self.track_memory else None
+        if self.profile:
+            self.profile.enable()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+            if self.profile:
+                self.profile.disable()
+            if before is not None:
+                diff = tracemalloc.take_snapshot().compare_to(before, 'lineno')
+                self.allocations[name] = [str(stat) for stat in diff[:PROFILE_TOP_ALLOCATIONS]]
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+class MessageProfiler:
+    def __init__(self, enabled=PROFILE_ENABLED, sample_rate=PROFILE_SAMPLE_RATE, output_dir=PROFILE_DIR,
+                 track_memory=PROFILE_TRACEMALLOC, slow_seconds=PROFILE_SLOW_MESSAGE_SECONDS):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.output_dir = output_dir
+        self.track_memory = track_memory
+        self.slow_seconds = slow_seconds
+        # One sampled message at a time: profilers and tracemalloc are process-wide
+        self._sample_slot = threading.Lock()
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        logger.info(f"🔬 Profiling {'enabled' if self.enabled else 'disabled'} (sample rate {self.sample_rate})")
+
+    def start(self, file_name):
+        """A trace for this message, or None while profiling is off"""
+        if not self.enabled:
+            return None
+        sampled = random.random() < self.sample_rate and self._sample_slot.acquire(blocking=False)
+        track_memory = sampled and self.track_memory
+        trace = MessageTrace(file_name, profile=sampled, track_memory=track_memory)
+        # Leave tracemalloc running afterwards if someone else started it
+        trace.stop_tracemalloc = track_memory and not tracemalloc.is_tracing()
+        if trace.stop_tracemalloc:
+            tracemalloc.start()
+        return trace
+
+    def finish(self, trace, error=None):
+        if trace is None:
+            return
+        elapsed = trace.elapsed()
+        try:
+            if self.slow_seconds and elapsed >= self.slow_seconds:
+                SLOW_MESSAGES.inc()
+                stages = ", ".join(f"{name}={seconds:.2f}s" for name, seconds in trace.stages.items())
+                logger.warning(f"🐢 Slow message {trace.file_name}: {elapsed:.1f}s ({stages}){' failed: ' + str(error) if error else ''}")
+            if trace.sampled:
+                self._write(trace, elapsed)
+        except Exception as e:
+            logger.error(f"❌ Could not record profile for {trace.file_name}: {e}")
+        finally:
+            if trace.sampled:
+                if trace.stop_tracemalloc:
+                    tracemalloc.stop()
+                self._sample_slot.release()
+
+    def _write(self, trace, elapsed):
+        os.makedirs(self.output_dir, exist_ok=True)
+        name = re.sub(r'[^A-Za-z0-9._-]+', '_', os.path.basename(trace.file_name))
+        base = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}")
+        trace.profile.dump_stats(f"{base}.pstats")
+        if trace.allocations:
+            with open(f"{base}.alloc.txt", "w") as f:
+                f.write(f"{trace.file_name}: {elapsed:.2f}s\n")
+                for stage, stats in trace.allocations.items():
+                    f.write(f"\n[{stage}] {trace.stages.get(stage, 0.0):.2f}s\n")
+                    f.writelines(f"  {line}\n" for line in stats)
+        logger.info(f"🔬 Profile of {trace.file_name} written to {base}.pstats")
+
+_profiler = MessageProfiler()
+
+def get_profiler():
+    return _profiler
+
+def run_stage(name, fn, job, *args):
+    """
+    Call fn(job, *args), timing (and profiling) it for traced jobs. job may
+    also be a list of jobs, for batch steps; the time is then attributed
+    to each traced job in it, and only a sampled one is profiled.
+    """
+    jobs = job if isinstance(job, list) else (job,)
+    traces = [j["trace"] for j in jobs if j.get("trace") is not None]
+    if not traces:
+        return fn(job, *args)
+    trace = next((t for t in traces if t.sampled), traces[0])
+    started = time.perf_counter()
+    with trace.stage(name):
+        result = fn(job, *args)
+    for other in traces:
+        if other is not trace:
+            other.stages[name] = other.stages.get(name, 0.0) + time.perf_counter() - started
+    return result
+
+def traced(name, fn):
+    """fn wrapped with run_stage, for handing to a Stage or MicroBatcher"""
+    def run(job, *args):
+        return run_stage(name, fn, job, *args)
+    run.__name__ = getattr(fn, "__name__", name)
+    return run
@@ -1,9 +1,39 @@
-import fitz
+class DocumentTooLargeError(Exception):
+    pass
+
+def iter_pdf_pages(pdf_path=None, pdf_bytes=None, max_chars=None):
+    """
+    Yield the text of each page in turn, so only one page's text has to be
+    in memory at a time. The document is closed as soon as iteration ends,
+    or stops early, instead of when it is garbage-collected. Raises
+    DocumentTooLargeError once the text passes max_chars.
+    """
+    # Imported here so loading this module (e.g. for DocumentTooLargeError) stays cheap
+    import fitz
+
+    if pdf_bytes is not None:
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    else:
+        doc = fitz.open(pdf_path)
+    total_chars = 0
+    try:
+        for page in doc:
+            text = page.get_text()
+            total_chars += len(text)
+            if max_chars and total_chars > max_chars:
+                raise DocumentTooLargeError(
+                    f"PDF text exceeds {max_chars} characters after page {page.number + 1} of {doc.page_count}"
+                )
+            yield text
+    finally:
+        doc.close()
+        # Release MuPDF's internal object cache held for the closed document
+        fitz.TOOLS.store_shrink(100)
 
 def extract_text_from_pdf(pdf_path):
     """Extract text from PDF using PyMuPDF"""
-    doc = fitz.open(pdf_path)
-    text = ""
-    for page in doc:
-        text += page.get_text()
-    return text
+    return "".join(iter_pdf_pages(pdf_path=pdf_path))
+
+def extract_text_from_pdf_bytes(pdf_bytes):
+    """Extract text from an in-memory PDF without touching disk"""
+    return "".join(iter_pdf_pages(pdf_bytes=pdf_bytes))
@@ -0,0 +1,29 @@
+import zlib
+from config.settings import RAW_TEXT_COMPRESSION_LEVEL
+
+# Stored alongside each blob so another codec can be added without a migration
+RAW_TEXT_COMPRESSION = "zlib"
+
+class RawTextCompressor:
+    """
+    Compresses page text as it streams past on its way to the parser, so
+    the full uncompressed text of a report is never held in memory.
+    """
+
+    def __init__(self, level=RAW_TEXT_COMPRESSION_LEVEL):
+        self._compressor = zlib.compressobj(level)
+        self._parts = []
+
+    def pages(self, pages):
+        for page in pages:
+            self._parts.append(self._compressor.compress(page.encode("utf-8")))
+            yield page
+
+    def finish(self):
+        self._parts.append(self._compressor.flush())
+        return b"".join(self._parts)
+
+def decompress_text(blob, compression=RAW_TEXT_COMPRESSION):
+    if compression != "zlib":
+        raise ValueError(f"unknown raw text compression {compression!r}")
+    return zlib.decompress(bytes(blob)).decode("utf-8")
@@ -1,8 +1,71 @@
+import os
 import re
 
+# All patterns are compiled once at import. Reports are split into segments
+# in a single pass over their lines (see ReportTokenizer), and each field
+# extractor below only ever looks at its own segment:
+#   header   -> course_info
+#   sections -> ratings (one list of lines per "... Related" section)
+#   comments -> open-ended answers, grouped by predefined question
+#   full     -> full_text
+
+# Bump whenever a change here alters the parsed output of existing reports;
+# python -m pipeline.reprocess then re-parses every document stored with an
+# older version from its saved raw text
+PARSER_VERSION = 1
+
+FILENAME_RE = re.compile(r'([A-Za-z]+)_([A-Za-z]+)_(\d+)_([A-Za-z]+)-(\d{4})_([A-Za-z0-9]+)_([A-Za-z-]+).pdf')
+
+COURSE_NAME_RE = re.compile(r'([A-Za-z0-9\s:&\-]+)(?=\s+\((Spring|Fall)\s+\d{4}\))')
+INSTRUCTOR_RE = re.compile(r'Instructor:\s*([^\n\r]+)')
+INSTRUCTOR_END_RE = re.compile(r'Subject:|Catalog & Section:|Enrollment:')
+SUBJECT_RE = re.compile(r'Subject:\s*(\w+)')
+CATALOG_RE = re.compile(r'Catalog & Section:\s*(\w+\s+\d+)')
+ENROLLMENT_RE = re.compile(r'Enrollment:\s*(\d+)')
+RESPONSES_RE = re.compile(r'Responses\s+Inc\w*\s+Declines:\s*(\d+)')
+DECLINES_RE = re.compile(r'Declines:\s*(\d+)')
+
+SECTION_RE = re.compile(r'Questions to Assess|Course Related|Learning Related|Instructor Related')
+RATING_ROW_RE = re.compile(r'([A-Za-z].*?)\s+(\d+)\s+(\d+%)\s+(\d+\.\d+)\s+(\d+\.\d+)\s+(\d+\.\d+)')
+
+QUESTION_MARKER_RE = re.compile(r'^\s*Q:\s*(.*)$')
+COMMENT_START_RE = re.compile(r'^(\d+)(?:\s+(.*))?$')
+
+TABLE_LABEL_RE = re.compile(r'(Question|Number of Responses|Response Rate|Course Mean|Dept\. Mean|Univ\. Mean|Course Median|Dept\. Median|Univ\. Median)\s+')
+NOTE_RE = re.compile(r'Note: 5:.*?;')
+
+# Open-ended TRACE questions whose answers are kept
+PREDEFINED_QUESTIONS = [
+    "What were the strengths of this course and/or this instructor?",
+    "What could the instructor do to make this course better?",
+    "Please expand on the instructor’s strengths and/or areas for improvement in facilitating inclusive learning.",
+    "Please comment on your experience of the online course environment in the open-ended text box.",
+    "What I could have done to make this course better for myself.",
+]
+
+def _normalize(text):
+    return ' '.join(text.replace('’', "'").split())
+
+_NORMALIZED_QUESTIONS = [(_normalize(q), q) for q in PREDEFINED_QUESTIONS]
+
+def _match_question(text):
+    """
+    Classify the text following a "Q:" marker. Returns one of
+      ('match', question, remainder) - a predefined question, plus any text after it
+      ('partial', None, '')         - could still become one if the next line continues it
+      ('none', None, '')            - some other question
+    """
+    for normalized, question in _NORMALIZED_QUESTIONS:
+        if text.startswith(normalized):
+            return 'match', question, text[len(normalized):].strip()
+    for normalized, _ in _NORMALIZED_QUESTIONS:
+        if normalized.startswith(text):
+            return 'partial', None, ''
+    return 'none', None, ''
+
 def extract_metadata_from_filename(filename):
-    pattern = r'([A-Za-z]+)_([A-Za-z]+)_(\d+)_([A-Za-z]+)-(\d{4})_([A-Za-z0-9]+)_([A-Za-z-]+).pdf'
-    match = re.match(pattern, filename)
+    # Object names can carry a prefix (reports/2025/...); only the last part is matched
+    match = FILENAME_RE.match(os.path.basename(filename))
     if match:
         last_name, first_name, id_number, semester, year, course_code, report_type = match.groups()
         return {
@@ -16,92 +79,169 @@ def extract_metadata_from_filename(filename):
         }
     return {}
 
-def clean_evaluation_text(text):
-    results = {
-        'full_text': '',
-        'course_info': {},
-        'ratings': [],
-        'comments': []
-    }
+class ReportTokenizer:
+    """
+    Splits report text into header, rating sections and comments in one
+    pass. Text can be fed in pieces (e.g. one page at a time); call close()
+    after the last piece.
+    """
+
+    def __init__(self):
+        self.header = []
+        self.sections = []      # [(title, [lines])]
+        self.comments = []
+        self.full = []          # whitespace-collapsed lines
+        self._state = 'header'
+        self._partial_line = ''
+        self._pending_question = None
+        self._question = None   # current predefined question; None inside other questions
+        self._comment = None
+
+    def feed(self, text):
+        lines = (self._partial_line + text).split('\n')
+        self._partial_line = lines.pop()
+        for line in lines:
+            self._line(line)
+
+    def close(self):
+        if self._partial_line:
+            self._line(self._partial_line)
+            self._partial_line = ''
+        if self._pending_question is not None:
+            self._start_question(None)
+        self._end_comment()
+        return self
+
+    def _line(self, line):
+        collapsed = ' '.join(line.split())
+        if collapsed:
+            self.full.append(collapsed)
 
-    text = re.sub(r'\s+', ' ', text)
+        if self._pending_question is not None:
+            # The previous "Q:" line may have wrapped mid-question
+            status, question, remainder = _match_question(_normalize(self._pending_question + ' ' + collapsed))
+            if status == 'partial':
+                self._pending_question += ' ' + collapsed
+                return
+            if status == 'match':
+                self._start_question(question)
+                if remainder:
+                    self._comment_line(remainder)
+                return
+            self._start_question(None)
 
-    course_name_match = re.search(r'([A-Za-z0-9\s:&\-]+)(?=\s+\((Spring|Fall)\s+\d{4}\))', text)
+        marker = QUESTION_MARKER_RE.match(line)
+        if marker:
+            self._state = 'comments'
+            self._end_comment()
+            status, question, remainder = _match_question(_normalize(marker.group(1)))
+            if status == 'partial':
+                self._pending_question = marker.group(1)
+            else:
+                self._start_question(question)
+                if remainder:
+                    self._comment_line(remainder)
+            return
+
+        if self._state == 'comments':
+            self._comment_line(collapsed)
+            return
+
+        section = SECTION_RE.search(line)
+        if section:
+            if line[:section.start()].strip():
+                self._content_line(line[:section.start()])
+            self.sections.append((line[section.start():].strip(), []))
+            self._state = 'ratings'
+            return
+
+        self._content_line(line)
+
+    def _content_line(self, line):
+        if self._state == 'header':
+            self.header.append(line)
+        else:
+            self.sections[-1][1].append(line)
+
+    def _start_question(self, question):
+        self._pending_question = None
+        self._question = question
+
+    def _comment_line(self, text):
+        if self._question is None or not text:
+            return
+        start = COMMENT_START_RE.match(text)
+        # Comments are numbered 1, 2, 3...; a line that starts with any other
+        # number is a continuation of the current comment
+        if start and (self._comment is None or int(start.group(1)) == self._comment['comment_number'] + 1):
+            self._end_comment()
+            self._comment = {
+                'question': self._question,
+                'comment_number': int(start.group(1)),
+                'parts': [start.group(2)] if start.group(2) else []
+            }
+        elif self._comment is not None:
+            self._comment['parts'].append(text)
+
+    def _end_comment(self):
+        if self._comment is not None:
+            self.comments.append({
+                'question': self._comment['question'],
+                'comment_number': self._comment['comment_number'],
+                'text': ' '.join(self._comment['parts']).strip()
+            })
+            self._comment = None
+
+def tokenize_report(text):
+    tokenizer = ReportTokenizer()
+    tokenizer.feed(text)
+    return tokenizer.close()
+
+def extract_course_info(header_lines):
+    text = ' '.join(' '.join(header_lines).split())
+    course_info = {}
+
+    course_name_match = COURSE_NAME_RE.search(text)
     if course_name_match:
-        results['course_info']['course_name'] = course_name_match.group(1).strip()
+        course_info['course_name'] = course_name_match.group(1).strip()
 
-    instructor_match = re.search(r'Instructor:\s*([^\n\r]+)', text)
+    instructor_match = INSTRUCTOR_RE.search(text)
     if instructor_match:
         name_raw = instructor_match.group(1).strip()
-        name_raw = re.split(r'Subject:|Catalog & Section:|Enrollment:', name_raw)[0].strip()
+        name_raw = INSTRUCTOR_END_RE.split(name_raw)[0].strip()
         if "," in name_raw:
             last, first = name_raw.split(",", 1)
             instructor_name = f"{first.strip()} {last.strip()}"
         else:
             instructor_name = name_raw
-        results['course_info']['instructor'] = instructor_name
+        course_info['instructor'] = instructor_name
 
-    subject_match = re.search(r'Subject:\s*(\w+)', text)
+    subject_match = SUBJECT_RE.search(text)
     if subject_match:
-        results['course_info']['subject'] = subject_match.group(1).strip()
+        course_info['subject'] = subject_match.group(1).strip()
 
-    catalog_match = re.search(r'Catalog & Section:\s*(\w+\s+\d+)', text)
+    catalog_match = CATALOG_RE.search(text)
     if catalog_match:
-        results['course_info']['catalog_section'] = catalog_match.group(1).strip()
+        course_info['catalog_section'] = catalog_match.group(1).strip()
 
-    enrollment_match = re.search(r'Enrollment:\s*(\d+)', text)
+    enrollment_match = ENROLLMENT_RE.search(text)
     if enrollment_match:
-        results['course_info']['enrollment'] = int(enrollment_match.group(1))
+        course_info['enrollment'] = int(enrollment_match.group(1))
 
-    responses_match = re.search(r'Responses\s+Inc\w*\s+Declines:\s*(\d+)', text)
+    responses_match = RESPONSES_RE.search(text)
     if responses_match:
-        results['course_info']['responses'] = int(responses_match.group(1))
+        course_info['responses'] = int(responses_match.group(1))
 
-    declines_match = re.search(r'Declines:\s*(\d+)', text)
+    declines_match = DECLINES_RE.search(text)
     if declines_match:
-        results['course_info']['declines'] = int(declines_match.group(1))
-
-    # Match specific open-ended TRACE questions and group related answers
-    predefined_questions = [
-        "What were the strengths of this course and/or this instructor\?",
-        "What could the instructor do to make this course better\?",
-        "Please expand on the instructor’s strengths and/or areas for improvement in facilitating inclusive learning\.",
-        "Please comment on your experience of the online course environment in the open-ended text box\.",
-        "What I could have done to make this course better for myself\."
-    ]
-
-    question_pattern = r'Q:\s+(' + '|'.join(predefined_questions) + r')\s*((?:\d+\s+.*?\n)+)'
-    matches = re.findall(question_pattern, text, re.DOTALL)
-
-    for question, comments_block in matches:
-        question = question.strip()
-        individual_comments = re.findall(r'(\d+)\s+(.*?)(?=\n\d+\s+|\Z)', comments_block + '\n', re.DOTALL)
-        for comment_num, comment_text in individual_comments:
-            results['comments'].append({
-                'question': question,
-                'comment_number': int(comment_num),
-                'text': comment_text.strip()
-            })
+        course_info['declines'] = int(declines_match.group(1))
 
-    clean_text = re.sub(r'^.*?(?=Declines:)', '', text, flags=re.DOTALL)
-    clean_text = re.sub(r'(Question|Number of Responses|Response Rate|Course Mean|Dept\\. Mean|Univ\\. Mean|Course Median|Dept\\. Median|Univ\\. Median)\s+', '', clean_text)
-    clean_text = re.sub(r'Note: 5:.*?;', '', clean_text)
-    clean_text = re.sub(r'\n\s*\d+\s*\n', '\n', clean_text)
-    clean_text = re.sub(r'\s+', ' ', clean_text).strip()
+    return course_info
 
-    results['full_text'] = clean_text
-    return results
-
-def extract_ratings_data(text):
+def extract_section_ratings(sections):
     ratings = []
-    sections = re.findall(
-        r'((?:Questions to Assess|Course Related|Learning Related|Instructor Related).*?)\n(.*?)(?=Questions to Assess|Course Related|Learning Related|Instructor Related|\Z)',
-        text, re.DOTALL)
-
-    for section_title, section_content in sections:
-        section_title = section_title.strip()
-        rating_rows = re.findall(r'([A-Za-z].*?)\s+(\d+)\s+(\d+%)\s+(\d+\.\d+)\s+(\d+\.\d+)\s+(\d+\.\d+)', section_content)
-        for row in rating_rows:
+    for section_title, section_lines in sections:
+        for row in RATING_ROW_RE.findall('\n'.join(section_lines)):
             try:
                 ratings.append({
                     'category': section_title,
@@ -114,10 +254,39 @@ def extract_ratings_data(text):
                 })
             except (ValueError, IndexError):
                 continue
-
     return ratings
 
+def build_full_text(full_lines):
+    text = ' '.join(full_lines)
+    declines_at = text.find('Declines:')
+    if declines_at > 0:
+        text = text[declines_at:]
+    text = TABLE_LABEL_RE.sub('', text)
+    text = NOTE_RE.sub('', text)
+    return ' '.join(text.split())
+
+def results_from_tokens(tokens):
+    return {
+        'full_text': build_full_text(tokens.full),
+        'course_info': extract_course_info(tokens.header),
+        'ratings': extract_section_ratings(tokens.sections),
+        'comments': tokens.comments
+    }
+
+def clean_evaluation_text(text):
+    results = results_from_tokens(tokenize_report(text))
+    results['ratings'] = []
+    return results
+
+def extract_ratings_data(text):
+    return extract_section_ratings(tokenize_report(text).sections)
+
 def process_pdf_text(text):
-    cleaned_results = clean_evaluation_text(text)
-    cleaned_results['ratings'] = extract_ratings_data(text)
-    return cleaned_results
+    return results_from_tokens(tokenize_report(text))
+
+def process_pdf_pages(pages):
+    """Parse a report from an iterable of page texts without joining them first"""
+    tokenizer = ReportTokenizer()
+    for page_text in pages:
+        tokenizer.feed(page_text)
+    return results_from_tokens(tokenizer.close())
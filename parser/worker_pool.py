@@ -0,0 +1,211 @@
+import logging
+import contextlib
+import multiprocessing
+import resource
+import queue
+import threading
+import time
+import traceback
+from config.settings import PIPELINE_PARSE_WORKERS, PARSE_WORKER_MAX_JOBS, PARSE_JOB_TIMEOUT_SECONDS
+from config.settings import PDF_MAX_TEXT_CHARS, PARSE_WORKER_MEMORY_LIMIT_MB, RAW_TEXT_STORE_ENABLED
+
+logger = logging.getLogger('kafka-pdf-consumer')
+
+class ParseTimeoutError(Exception):
+    pass
+
+class ParseWorkerError(Exception):
+    """
+    A parse that failed inside a worker process. error_type is the class
+    name of the exception the worker raised (None if the worker died), so
+    callers can tell what went wrong without matching on the message.
+    """
+
+    def __init__(self, message, error_type=None):
+        super().__init__(message)
+        self.error_type = error_type
+
+def _timed_pages(pages, timings):
+    """Pass pages through, adding the time spent producing them to timings['extract']"""
+    while True:
+        started = time.perf_counter()
+        try:
+            page = next(pages)
+        except StopIteration:
+            return
+        finally:
+            timings['extract'] += time.perf_counter() - started
+        yield page
+
+def parse_pdf_document(pdf_bytes=None, pdf_path=None, file_name='', timings=None):
+    """
+    Extract and parse one PDF page by page; runs inside a worker process.
+    If a timings dict is given, it receives the seconds spent in text
+    extraction ('extract') and in parsing ('parse'). The raw text comes
+    back compressed under 'raw_text' (see parser.raw_text) unless
+    RAW_TEXT_STORE_ENABLED is off.
+    """
+    from parser.pdf_text_extractor import iter_pdf_pages
+    from parser.trace_cleaner import process_pdf_pages, extract_metadata_from_filename, PARSER_VERSION
+    from parser.raw_text import RawTextCompressor
+
+    timings = {} if timings is None else timings
+    timings['extract'] = 0.0
+    started = time.perf_counter()
+    raw_text = RawTextCompressor() if RAW_TEXT_STORE_ENABLED else None
+    pages = iter_pdf_pages(pdf_path=pdf_path, pdf_bytes=pdf_bytes, max_chars=PDF_MAX_TEXT_CHARS)
+    with contextlib.closing(pages):
+        page_texts = _timed_pages(pages, timings)
+        parsed_data = process_pdf_pages(raw_text.pages(page_texts) if raw_text else page_texts)
+    timings['parse'] = time.perf_counter() - started - timings['extract']
+    parsed_data["course_info"].update(extract_metadata_from_filename(file_name))
+    parsed_data["parser_version"] = PARSER_VERSION
+    if raw_text is not None:
+        parsed_data["raw_text"] = raw_text.finish()
+    return parsed_data
+
+def _worker_main(conn):
+    if PARSE_WORKER_MEMORY_LIMIT_MB:
+        limit = PARSE_WORKER_MEMORY_LIMIT_MB * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        try:
+            timings = {}
+            parsed_data = parse_pdf_document(timings=timings, **task)
+            conn.send(('ok', (parsed_data, timings)))
+        except Exception as e:
+            conn.send(('error', (type(e).__name__, f"{e}\n{traceback.format_exc()}")))
+    conn.close()
+
+class _Worker:
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def run(self, task, timeout):
+        self.conn.send(task)
+        if not self.conn.poll(timeout):
+            raise ParseTimeoutError(f"parse job exceeded {timeout}s")
+        status, payload = self.conn.recv()
+        self.jobs += 1
+        if status == 'error':
+            error_type, message = payload
+            raise ParseWorkerError(message, error_type)
+        return payload
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, EOFError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.kill()
+        self.conn.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+
+class ParseWorkerPool:
+    """
+    Fixed set of worker processes for PDF extraction and parsing.
+
+    parse() blocks the calling thread until its job is done, so at most
+    `workers` jobs run at once. Bytes go in and the parsed dict comes out.
+    A worker is replaced after max_jobs documents, to release memory PyMuPDF
+    keeps hold of, and is killed outright when a job exceeds the timeout.
+    """
+
+    def __init__(self, workers=PIPELINE_PARSE_WORKERS, max_jobs=PARSE_WORKER_MAX_JOBS, timeout=PARSE_JOB_TIMEOUT_SECONDS):
+        # forkserver: forking the consumer directly would copy the state of
+        # its Kafka and HTTP threads into every worker
+        self._context = multiprocessing.get_context('forkserver')
+        # Import the parser once in the fork server so each new (or recycled)
+        # worker starts with PyMuPDF already loaded
+        self._context.set_forkserver_preload(['parser.pdf_text_extractor', 'parser.trace_cleaner', 'parser.raw_text', 'fitz'])
+        self.max_jobs = max_jobs
+        self.timeout = timeout
+        self._idle = queue.Queue()
+        self._all = []
+        self._lock = threading.Lock()
+        for _ in range(max(1, workers)):
+            self._idle.put(self._spawn())
+
+    def _spawn(self):
+        worker = _Worker(self._context)
+        with self._lock:
+            self._all.append(worker)
+        return worker
+
+    def _retire(self, worker, kill=False):
+        with self._lock:
+            self._all.remove(worker)
+        if kill:
+            worker.kill()
+        else:
+            worker.stop()
+
+    def parse(self, pdf_bytes=None, pdf_path=None, file_name='', timings=None):
+        task = {'pdf_bytes': pdf_bytes, 'pdf_path': pdf_path, 'file_name': file_name}
+        worker = self._idle.get()
+        try:
+            result = worker.run(task, self.timeout)
+        except ParseTimeoutError:
+            logger.error(f"❌ Parsing {file_name} timed out after {self.timeout}s; killing worker")
+            self._retire(worker, kill=True)
+            self._idle.put(self._spawn())
+            raise
+        except ParseWorkerError:
+            self._release(worker)
+            raise
+        except (OSError, EOFError) as e:
+            # Worker died mid-job (e.g. segfault or OOM kill inside MuPDF)
+            self._retire(worker, kill=True)
+            self._idle.put(self._spawn())
+            raise ParseWorkerError(f"parse worker died while processing {file_name}: {e}")
+
+        self._release(worker)
+        parsed_data, worker_timings = result
+        if timings is not None:
+            timings.update(worker_timings)
+        return parsed_data
+
+    def _release(self, worker):
+        if worker.jobs >= self.max_jobs:
+            self._retire(worker)
+            worker = self._spawn()
+        self._idle.put(worker)
+
+    def shutdown(self):
+        with self._lock:
+            workers = list(self._all)
+        for worker in workers:
+            worker.stop()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_parse_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ParseWorkerPool()
+        return _pool
+
+def shutdown_parse_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
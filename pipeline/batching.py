@@ -0,0 +1,86 @@
+import time
+import queue
+import logging
+import threading
+import traceback
+
+logger = logging.getLogger('kafka-pdf-consumer')
+
+_STOP = object()
+
+class MicroBatcher:
+    """
+    Groups jobs arriving one at a time into batches.
+
+    A batch is handed to process_batch(jobs) once it holds max_size jobs or
+    max_wait seconds have passed since its first job arrived, whichever
+    comes first. process_batch returns [(job, error)] and on_complete(job,
+    error) is then called for each job, so the caller only learns a job is
+    done (and commits its offset) after its whole batch has been handled.
+    """
+
+    def __init__(self, process_batch, on_complete, max_size=32, max_wait=1.0, workers=1, queue_size=64):
+        self.process_batch = process_batch
+        self.on_complete = on_complete
+        self.max_size = max(1, max_size)
+        self.max_wait = max_wait
+        self.workers = max(1, workers)
+        self.inbox = queue.Queue(maxsize=queue_size)
+        self._threads = []
+
+    def start(self):
+        for n in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"batch-{n}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        logger.info(f"🚀 Micro-batching started: up to {self.max_size} documents or {self.max_wait}s per batch")
+
+    def submit(self, job):
+        self.inbox.put(job)
+
+    def depth(self):
+        return self.inbox.qsize()
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                job = self.inbox.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if job is _STOP:
+                # Flush what we have, then let this worker see the stop
+                self.inbox.put(_STOP)
+                break
+            batch.append(job)
+        return batch
+
+    def _worker(self):
+        while True:
+            first = self.inbox.get()
+            if first is _STOP:
+                break
+            batch = self._collect(first)
+            try:
+                results = self.process_batch(batch)
+            except Exception as e:
+                logger.error(f"❌ Batch of {len(batch)} documents failed: {e}")
+                logger.error(traceback.format_exc())
+                results = [(job, e) for job in batch]
+            for job, error in results:
+                try:
+                    self.on_complete(job, error)
+                except Exception as e:
+                    logger.error(f"❌ Completion handler failed for {job.get('file_name')}: {e}")
+
+    def shutdown(self):
+        """Flush pending jobs and stop the batch workers"""
+        for _ in self._threads:
+            self.inbox.put(_STOP)
+        for t in self._threads:
+            t.join()
+        logger.info("🛑 Micro-batcher drained")
@@ -0,0 +1,236 @@
+"""
+Ingest every TRACE report under a GCS prefix directly, without Kafka.
+
+    python -m pipeline.bulk_import my-bucket --prefix reports/Fall-2023/
+    python -m pipeline.bulk_import my-bucket --prefix reports/ --dry-run
+    PIPELINE_DOWNLOAD_WORKERS=16 PIPELINE_EMBED_WORKERS=8 python -m pipeline.bulk_import my-bucket --batched
+
+Objects are listed page by page; those whose file name matches the TRACE
+naming pattern (see parser.trace_cleaner.extract_metadata_from_filename) are
+submitted as soon as they are listed.
+Each one goes through the consumer's own stages, sized by the PIPELINE_*
+settings; versions already stored and embedded are skipped by the
+fingerprint stage without being downloaded (one whose vectors failed is
+imported again). Every finished object is appended to the
+manifest, so an interrupted or partly failed import can simply be run
+again: objects recorded as done at the same generation are not resubmitted.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from config.settings import BULK_IMPORT_MANIFEST_PATH, LOCAL_PDF_DIR, PDF_DOWNLOAD_MODE, PIPELINE_QUEUE_SIZE
+from config.settings import PIPELINE_BATCH_SIZE, PIPELINE_BATCH_WINDOW_SECONDS, PIPELINE_BATCH_WORKERS
+from db.pool import run_with_connection, close_pool
+from db.schema import ensure_schema
+from gcs.downloader import list_objects
+from embedding.vector_store import close_vector_stores
+from parser.trace_cleaner import extract_metadata_from_filename
+from parser.worker_pool import shutdown_parse_pool
+from pipeline.staged import StagedPipeline
+from pipeline.batching import MicroBatcher
+from pipeline.stages import make_job, build_stages, cleanup_job, run_batch
+
+logger = logging.getLogger('kafka-pdf-consumer')
+
+DONE_STATUSES = ("ok", "skipped")
+
+def is_trace_report(object_name):
+    return bool(extract_metadata_from_filename(object_name))
+
+def load_manifest(path, bucket):
+    """{object_name: generation} for objects of this bucket a previous run finished"""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get("bucket") != bucket:
+                continue
+            # Later lines win: a failed object that succeeded on a rerun counts as done
+            if entry["status"] in DONE_STATUSES:
+                done[entry["object"]] = entry.get("generation")
+            else:
+                done.pop(entry["object"], None)
+    return done
+
+def list_pending(bucket, prefix, done, limit=None):
+    """
+    Yield the TRACE reports under the prefix that the manifest doesn't
+    already cover, as the listing pages arrive, so the import starts on
+    the first page and never holds the whole bucket in memory.
+    """
+    listed = matched = pending = 0
+    for name, generation, md5_hash in list_objects(bucket, prefix):
+        listed += 1
+        if not is_trace_report(name):
+            continue
+        matched += 1
+        if name in done and done[name] in (None, generation):
+            continue
+        pending += 1
+        yield {"bucket": bucket, "file": name, "generation": generation, "md5Hash": md5_hash}
+        if limit and pending >= limit:
+            break
+    print(f"Listed {listed} objects under gs://{bucket}/{prefix or ''}: {matched} TRACE reports, {pending} to import", file=sys.stderr)
+
+class ImportProgress:
+    """Outcome counters, the manifest writer and a periodic progress line on stderr"""
+
+    def __init__(self, manifest_path, interval=5.0):
+        # Objects submitted so far; total is only known once the listing ends
+        self.submitted = 0
+        self.total = None
+        self.counts = {"ok": 0, "skipped": 0, "failed": 0}
+        self.started = time.monotonic()
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._manifest = open(manifest_path, "a")
+        self._stop = threading.Event()
+        self._tty = sys.stderr.isatty()
+        self._thread = threading.Thread(target=self._report, name="import-progress", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def record(self, job, status, error=None):
+        entry = {
+            "bucket": job["bucket"],
+            "object": job["file_name"],
+            "generation": job["fingerprint"]["generation"],
+            "status": status,
+            "error": str(error)[:500] if error else None,
+            "at": time.time(),
+        }
+        with self._lock:
+            self.counts[status] += 1
+            self._manifest.write(json.dumps(entry) + "\n")
+            self._manifest.flush()
+
+    def line(self):
+        with self._lock:
+            done = sum(self.counts.values())
+            counts = ", ".join(f"{name}={count}" for name, count in self.counts.items())
+        elapsed = time.monotonic() - self.started
+        rate = done / elapsed if elapsed else 0.0
+        if self.total is None:
+            return f"📦 {done}/{self.submitted}+ (listing) {counts} | {rate:.1f} docs/s"
+        eta = (self.total - done) / rate if rate else 0.0
+        percent = done / self.total * 100 if self.total else 100.0
+        return f"📦 {done}/{self.total} ({percent:.1f}%) {counts} | {rate:.1f} docs/s | ETA {eta / 60:.0f}m{eta % 60:02.0f}s"
+
+    def _report(self):
+        while not self._stop.wait(self.interval):
+            if self._tty:
+                sys.stderr.write("\r" + self.line())
+                sys.stderr.flush()
+            else:
+                print(self.line(), file=sys.stderr, flush=True)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        if self._tty:
+            sys.stderr.write("\r" + self.line() + "\n")
+        self._manifest.close()
+
+def bulk_import(bucket, prefix=None, manifest_path=BULK_IMPORT_MANIFEST_PATH, batched=False, limit=None, dry_run=False):
+    """Import every pending report; returns True when none failed"""
+    pending = list_pending(bucket, prefix, load_manifest(manifest_path, bucket), limit=limit)
+    if dry_run:
+        for _ in pending:
+            pass
+        return True
+
+    local_dir = LOCAL_PDF_DIR
+    if PDF_DOWNLOAD_MODE != "memory":
+        os.makedirs(local_dir, exist_ok=True)
+
+    progress = ImportProgress(manifest_path)
+
+    def on_complete(job, error):
+        cleanup_job(job)
+        if error is not None:
+            logger.error(f"❌ Error importing {job['file_name']}: {error}")
+            progress.record(job, "failed", error)
+        else:
+            progress.record(job, "skipped" if job.get("skipped") else "ok")
+
+    batcher = None
+    if batched:
+        batcher = MicroBatcher(
+            run_batch, on_complete,
+            max_size=PIPELINE_BATCH_SIZE, max_wait=PIPELINE_BATCH_WINDOW_SECONDS,
+            workers=PIPELINE_BATCH_WORKERS, queue_size=PIPELINE_QUEUE_SIZE
+        )
+        batcher.start()
+
+        def on_parsed(job, error):
+            if error is not None or job.get("skipped"):
+                on_complete(job, error)
+            else:
+                batcher.submit(job)
+
+        pipeline = StagedPipeline(build_stages(batched=True), on_complete=on_parsed, queue_size=PIPELINE_QUEUE_SIZE)
+    else:
+        pipeline = StagedPipeline(build_stages(), on_complete=on_complete, queue_size=PIPELINE_QUEUE_SIZE)
+
+    pipeline.start()
+    progress.start()
+    try:
+        # Positions keep spooled file names unique across prefixes in file mode
+        for index, data in enumerate(pending):
+            pipeline.submit(make_job(data, local_dir, 0, index))
+            progress.submitted = index + 1
+        progress.total = progress.submitted
+    except KeyboardInterrupt:
+        logger.warning("🛑 Interrupted: finishing the objects already submitted; rerun to import the rest")
+    finally:
+        pipeline.shutdown()
+        if batcher is not None:
+            batcher.shutdown()
+        progress.close()
+
+    print(f"✅ Import finished in {time.monotonic() - progress.started:.1f}s: {progress.counts}", file=sys.stderr)
+    return progress.counts["failed"] == 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-import TRACE reports from a GCS bucket")
+    parser.add_argument("bucket")
+    parser.add_argument("--prefix", help="only objects whose name starts with this")
+    parser.add_argument("--manifest", default=BULK_IMPORT_MANIFEST_PATH)
+    parser.add_argument("--batched", action="store_true", help="store and embed in micro-batches (see PIPELINE_BATCH_*)")
+    parser.add_argument("--limit", type=int, help="import at most this many objects")
+    parser.add_argument("--dry-run", action="store_true", help="list what would be imported")
+    parser.add_argument("--verbose", action="store_true", help="log every stage of every document")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stderr)]
+    )
+
+    try:
+        if not args.dry_run:
+            run_with_connection(ensure_schema)
+        ok = bulk_import(
+            args.bucket, args.prefix, args.manifest,
+            batched=args.batched, limit=args.limit, dry_run=args.dry_run
+        )
+    finally:
+        shutdown_parse_pool()
+        close_vector_stores()
+        close_pool()
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
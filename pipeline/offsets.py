@@ -0,0 +1,55 @@
+import threading
+from collections import deque
+
+class OffsetTracker:
+    """
+    Tracks in-flight messages per partition so offsets are only committed
+    once every earlier message in that partition has finished.
+
+    Messages may complete out of order when stages run concurrently; the
+    committable offset for a partition only advances over a contiguous run
+    of finished offsets.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}   # tp -> deque of offsets in arrival order
+        self._done = {}      # tp -> set of finished offsets not yet committable
+        self._ready = {}     # tp -> next offset to commit
+
+    def add(self, tp, offset):
+        with self._lock:
+            self._pending.setdefault(tp, deque()).append(offset)
+            self._done.setdefault(tp, set())
+
+    def mark_done(self, tp, offset):
+        with self._lock:
+            pending = self._pending.get(tp)
+            if pending is None:
+                # Partition was revoked while the message was in flight
+                return
+            done = self._done[tp]
+            done.add(offset)
+            while pending and pending[0] in done:
+                finished = pending.popleft()
+                done.discard(finished)
+                self._ready[tp] = finished + 1
+
+    def in_flight(self):
+        with self._lock:
+            return sum(len(p) for p in self._pending.values())
+
+    def pop_committable(self):
+        """Return {tp: next_offset} for partitions that advanced since the last call"""
+        with self._lock:
+            ready = self._ready
+            self._ready = {}
+            return ready
+
+    def revoke(self, partitions):
+        """Forget partitions we no longer own; their in-flight work is redelivered to the new owner"""
+        with self._lock:
+            for tp in partitions:
+                self._pending.pop(tp, None)
+                self._done.pop(tp, None)
+                self._ready.pop(tp, None)
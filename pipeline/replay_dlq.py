@@ -0,0 +1,99 @@
+"""
+Re-publish dead-lettered messages to the topic they originally came from.
+
+    python -m pipeline.replay_dlq --dry-run
+    python -m pipeline.replay_dlq --error-contains "timed out" --limit 100
+    python -m pipeline.replay_dlq
+
+Replayed messages start again at attempt 0. Offsets on the dead-letter
+topic are only committed by a full replay (no --error-contains / --limit),
+so a filtered replay leaves everything where it is for a later run.
+"""
+import argparse
+import logging
+import sys
+import time
+
+from kafka import KafkaConsumer, KafkaProducer
+from kafka.structs import OffsetAndMetadata
+from config.settings import KAFKA_BOOTSTRAP_SERVERS, KAFKA_TOPIC_NAME, KAFKA_DLQ_TOPIC, KAFKA_GROUP_ID
+from pipeline.retry import read_headers, ORIGINAL_TOPIC_HEADER, ORIGINAL_PARTITION_HEADER, ORIGINAL_OFFSET_HEADER, ERROR_HEADER
+
+logger = logging.getLogger('kafka-pdf-consumer')
+
+def replay(consumer, producer, limit=None, error_contains=None, dry_run=False, idle_timeout_ms=5000):
+    """Replay what is currently on the dead-letter topic; returns how many messages were re-published"""
+    replayed = 0
+    last_offsets = {}
+    while limit is None or replayed < limit:
+        batch = consumer.poll(timeout_ms=idle_timeout_ms)
+        if not batch:
+            break
+        for tp, messages in batch.items():
+            for message in messages:
+                if limit is not None and replayed >= limit:
+                    break
+                info = read_headers(message.headers)
+                if error_contains and error_contains not in (info["error"] or ""):
+                    continue
+
+                target = info["original_topic"] or KAFKA_TOPIC_NAME
+                logger.info(
+                    f"{'Would replay' if dry_run else 'Replaying'} {tp.topic}[{tp.partition}]@{message.offset} "
+                    f"-> {target} (failed with: {info['error']})"
+                )
+                if not dry_run:
+                    headers = [
+                        (ORIGINAL_TOPIC_HEADER, target),
+                        (ORIGINAL_PARTITION_HEADER, info["original_partition"]),
+                        (ORIGINAL_OFFSET_HEADER, info["original_offset"]),
+                        (ERROR_HEADER, f"replayed from {tp.topic} after: {info['error']}"),
+                    ]
+                    # A position the DLQ record doesn't carry is left out, not written as "None"
+                    producer.send(
+                        target,
+                        value=message.value,
+                        headers=[(key, str(value).encode("utf-8")) for key, value in headers if value is not None]
+                    ).get(timeout=30)
+                replayed += 1
+                last_offsets[tp] = message.offset
+
+    if not dry_run:
+        producer.flush()
+        if limit is None and not error_contains and last_offsets:
+            consumer.commit({tp: OffsetAndMetadata(offset + 1, None) for tp, offset in last_offsets.items()})
+    return replayed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay messages from the dead-letter topic")
+    parser.add_argument("--limit", type=int, help="replay at most this many messages")
+    parser.add_argument("--error-contains", help="only replay messages whose error contains this text")
+    parser.add_argument("--dry-run", action="store_true", help="list what would be replayed")
+    parser.add_argument("--group-id", default=f"{KAFKA_GROUP_ID}-dlq-replay")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stderr)]
+    )
+
+    # Values are passed through as raw bytes so they are re-published unchanged
+    consumer = KafkaConsumer(
+        KAFKA_DLQ_TOPIC,
+        bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS,
+        group_id=args.group_id,
+        auto_offset_reset='earliest',
+        enable_auto_commit=False
+    )
+    producer = KafkaProducer(bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS, acks='all')
+    started = time.monotonic()
+    try:
+        count = replay(consumer, producer, limit=args.limit, error_contains=args.error_contains, dry_run=args.dry_run)
+    finally:
+        consumer.close()
+        producer.close()
+    logger.info(f"{'Found' if args.dry_run else 'Replayed'} {count} message(s) from {KAFKA_DLQ_TOPIC} in {time.monotonic() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
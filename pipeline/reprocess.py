@@ -0,0 +1,168 @@
+"""
+Re-parse stored documents from their saved raw text after a parser change.
+
+    python -m pipeline.reprocess --status
+    python -m pipeline.reprocess
+    python -m pipeline.reprocess --workers 8 --batch-size 100 --no-embed
+
+Every object whose rows were produced by an older PARSER_VERSION (see
+parser.trace_cleaner) is decompressed and parsed again across --workers
+processes; its derived rows are rewritten in place and its chunks
+re-embedded, without downloading or extracting the PDF again. A document
+counts as done once its parser version is bumped, so an interrupted run
+simply picks up the remaining stale documents. Documents ingested before
+raw text was stored have to be replayed from Kafka once.
+"""
+import argparse
+import logging
+import multiprocessing
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import psycopg2
+from config.settings import DB_CONFIG
+from db.pool import run_with_connection, close_pool
+from db.schema import ensure_schema
+from db.db_insert import write_document
+from db.raw_text import iter_stale_raw_text, parser_version_counts
+from embedding.chunker import chunk_document_data
+from embedding.vector_store import upload_chunks, close_vector_stores
+from parser.trace_cleaner import PARSER_VERSION
+
+logger = logging.getLogger('kafka-pdf-consumer')
+
+def reparse(document_id, fingerprint, compression, raw_text):
+    """Parse one stored document again; runs in a worker process"""
+    from parser.raw_text import decompress_text
+    from parser.trace_cleaner import process_pdf_text, extract_metadata_from_filename
+
+    parsed_data = process_pdf_text(decompress_text(raw_text, compression))
+    parsed_data["course_info"].update(extract_metadata_from_filename(fingerprint["object_name"]))
+    parsed_data["parser_version"] = PARSER_VERSION
+    # Written back unchanged, along with the new version
+    parsed_data["raw_text"] = raw_text
+    return parsed_data
+
+def reparse_batch(rows):
+    """[(row, parsed_data or None, error or None)] for a batch of stale rows"""
+    results = []
+    for row in rows:
+        try:
+            results.append((row, reparse(*row), None))
+        except Exception as e:
+            results.append((row, None, f"{type(e).__name__}: {e}"))
+    return results
+
+def iter_row_batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def rewrite_documents(db_connection, documents):
+    """Rewrite the rows of [(parsed_data, fingerprint)] in one transaction"""
+    # Same lock order as db.db_insert.store_documents
+    documents = sorted(documents, key=lambda d: (d[1]['bucket'], d[1]['object_name']))
+    cursor = db_connection.cursor()
+    try:
+        for parsed_data, fingerprint in documents:
+            write_document(cursor, parsed_data, fingerprint['object_name'], fingerprint)
+        db_connection.commit()
+    except Exception:
+        db_connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def finish_batch(results, embed, totals):
+    documents, chunks, document_ids = [], [], set()
+    for (document_id, fingerprint, _, _), parsed_data, error in results:
+        if error is not None:
+            logger.error(f"❌ Could not re-parse document {document_id} ({fingerprint['object_name']}): {error}")
+            totals["failed"] += 1
+            continue
+        documents.append((parsed_data, fingerprint))
+        document_ids.add(document_id)
+        if embed:
+            chunks.extend(chunk_document_data({
+                "document_id": document_id,
+                "document_name": fingerprint["object_name"],
+                "full_text": parsed_data["full_text"],
+                "comments": parsed_data.get("comments", []),
+                "ratings": parsed_data.get("ratings", []),
+                "professor": parsed_data["course_info"].get("instructor", "Unknown")
+            }))
+    if not documents:
+        return
+    # Vectors first: a document is only marked current once both are written.
+    # Every one replaces its earlier parse, so chunks it lost are deleted
+    if chunks and not upload_chunks(chunks, document_ids):
+        raise RuntimeError(f"vector upload failed for a batch of {len(documents)} documents")
+    run_with_connection(lambda conn: rewrite_documents(conn, documents))
+    totals["documents"] += len(documents)
+    totals["chunks"] += len(chunks)
+
+def reprocess(workers, batch_size=50, embed=True):
+    """Re-parse every stale document; returns True when none failed"""
+    totals = {"documents": 0, "chunks": 0, "failed": 0}
+    started = time.monotonic()
+    in_flight = deque()
+    conn = psycopg2.connect(**DB_CONFIG)
+    context = multiprocessing.get_context('forkserver')
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            for rows in iter_row_batches(iter_stale_raw_text(conn, PARSER_VERSION, fetch_size=batch_size * workers), batch_size):
+                in_flight.append(executor.submit(reparse_batch, rows))
+                # Keep every worker busy without reading the whole table ahead
+                if len(in_flight) >= workers * 2:
+                    finish_batch(in_flight.popleft().result(), embed, totals)
+            while in_flight:
+                finish_batch(in_flight.popleft().result(), embed, totals)
+    except Exception as e:
+        logger.error(f"🛑 Reprocess stopped after {totals['documents']} documents: {e}; rerun to continue")
+        return False
+    finally:
+        conn.close()
+        close_vector_stores()
+
+    elapsed = time.monotonic() - started
+    logger.info(
+        f"✅ Re-parsed {totals['documents']} documents ({totals['chunks']} chunks) to parser version "
+        f"{PARSER_VERSION} in {elapsed:.1f}s; {totals['failed']} failed"
+    )
+    return totals["failed"] == 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-parse stored TRACE documents from their raw text")
+    parser.add_argument("--status", action="store_true", help="show how many documents each parser version produced")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(), help="parser processes")
+    parser.add_argument("--batch-size", type=int, default=50, help="documents per parse job and database transaction")
+    parser.add_argument("--no-embed", action="store_true", help="rewrite database rows only; leave the vectors alone")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stderr)]
+    )
+
+    try:
+        run_with_connection(ensure_schema)
+        if args.status:
+            for version, count in run_with_connection(parser_version_counts).items():
+                marker = "current" if version == PARSER_VERSION else "stale"
+                logger.info(f"Parser version {version}: {count} documents ({marker})")
+            return
+        ok = reprocess(max(1, args.workers), batch_size=args.batch_size, embed=not args.no_embed)
+    finally:
+        close_pool()
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
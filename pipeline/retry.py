@@ -0,0 +1,130 @@
+import json
+import time
+import logging
+from parser.pdf_text_extractor import DocumentTooLargeError
+from parser.worker_pool import ParseWorkerError
+from monitoring.metrics import FAILURES_ROUTED
+from config.settings import KAFKA_TOPIC_NAME, KAFKA_DLQ_TOPIC, RETRY_DELAYS_SECONDS
+
+logger = logging.getLogger('kafka-pdf-consumer')
+
+# Failed messages are re-published with these headers. The first failure
+# goes to <topic>.retry.1 after RETRY_DELAYS_SECONDS[0], the next to
+# <topic>.retry.2 after RETRY_DELAYS_SECONDS[1], and so on; once the
+# delays run out the message goes to the dead-letter topic.
+ATTEMPT_HEADER = "x-retry-attempt"
+NOT_BEFORE_HEADER = "x-retry-not-before"
+ERROR_HEADER = "x-error"
+ERROR_TYPE_HEADER = "x-error-type"
+FAILED_AT_HEADER = "x-failed-at"
+ORIGINAL_TOPIC_HEADER = "x-original-topic"
+ORIGINAL_PARTITION_HEADER = "x-original-partition"
+ORIGINAL_OFFSET_HEADER = "x-original-offset"
+
+# Errors that will fail the same way on every attempt
+PERMANENT_ERRORS = (DocumentTooLargeError,)
+_PERMANENT_ERROR_NAMES = {cls.__name__ for cls in PERMANENT_ERRORS}
+
+def retry_topics(base_topic=KAFKA_TOPIC_NAME, delays=RETRY_DELAYS_SECONDS):
+    return [f"{base_topic}.retry.{n}" for n in range(1, len(delays) + 1)]
+
+def decode_value(raw):
+    """Kafka value deserializer that hands undecodable payloads through as bytes instead of failing the poll"""
+    try:
+        return json.loads(raw.decode("utf-8"))
+    except (UnicodeDecodeError, ValueError):
+        return raw
+
+def read_headers(headers):
+    """Retry metadata from a message's headers, with defaults for a first delivery"""
+    values = {key: value.decode("utf-8", "replace") for key, value in (headers or [])}
+    return {
+        "attempt": int(values.get(ATTEMPT_HEADER, 0)),
+        "not_before": float(values.get(NOT_BEFORE_HEADER, 0)),
+        "original_topic": values.get(ORIGINAL_TOPIC_HEADER),
+        "original_partition": values.get(ORIGINAL_PARTITION_HEADER),
+        "original_offset": values.get(ORIGINAL_OFFSET_HEADER),
+        "error": values.get(ERROR_HEADER),
+    }
+
+def is_permanent(error):
+    if isinstance(error, PERMANENT_ERRORS):
+        return True
+    # Errors raised in a parse worker arrive as ParseWorkerError, carrying the original class name
+    return isinstance(error, ParseWorkerError) and error.error_type in _PERMANENT_ERROR_NAMES
+
+class FailureRouter:
+    """
+    Publishes failed messages to the next retry topic, or to the dead-letter
+    topic once retries are used up (or straight away for permanent errors),
+    so the partition they came from can move on.
+    """
+
+    def __init__(self, producer, base_topic=KAFKA_TOPIC_NAME, delays=RETRY_DELAYS_SECONDS, dlq_topic=KAFKA_DLQ_TOPIC, send_timeout=30):
+        self.producer = producer
+        self.delays = list(delays)
+        self.topics = retry_topics(base_topic, self.delays)
+        self.dlq_topic = dlq_topic
+        self.send_timeout = send_timeout
+
+    def route(self, value, retry_info, error, source_topic, source_partition, source_offset, permanent=False):
+        """Publish the failed message and wait for the broker to acknowledge it; returns the topic used"""
+        attempt = retry_info.get("attempt", 0) + 1
+        if permanent or is_permanent(error) or attempt > len(self.delays):
+            topic, not_before, destination = self.dlq_topic, 0, "dlq"
+        else:
+            topic, destination = self.topics[attempt - 1], "retry"
+            not_before = time.time() + self.delays[attempt - 1]
+
+        headers = [
+            (ATTEMPT_HEADER, str(attempt)),
+            (NOT_BEFORE_HEADER, str(not_before)),
+            (ERROR_HEADER, str(error)[:2000]),
+            (ERROR_TYPE_HEADER, type(error).__name__),
+            (FAILED_AT_HEADER, str(time.time())),
+            # Keep pointing at where the message first arrived
+            (ORIGINAL_TOPIC_HEADER, retry_info.get("original_topic") or source_topic),
+            (ORIGINAL_PARTITION_HEADER, str(retry_info.get("original_partition") or source_partition)),
+            (ORIGINAL_OFFSET_HEADER, str(retry_info.get("original_offset") or source_offset)),
+        ]
+        payload = value if isinstance(value, bytes) else json.dumps(value).encode("utf-8")
+        self.producer.send(
+            topic,
+            value=payload,
+            headers=[(key, str(v).encode("utf-8")) for key, v in headers]
+        ).get(timeout=self.send_timeout)
+
+        FAILURES_ROUTED.inc(destination=destination)
+        if destination == "dlq":
+            logger.error(f"☠️ Sent message to dead-letter topic {topic} after {attempt} attempt(s): {error}")
+        else:
+            logger.warning(f"🔁 Sent message to {topic} (attempt {attempt}, not before {self.delays[attempt - 1]}s from now)")
+        return topic
+
+class DelayedPartitions:
+    """
+    Retry-topic partitions parked until the message at their head is due.
+    Retry topics are written in failure order, so when the head isn't due
+    nothing behind it is either; the partition is rewound to that message
+    and paused instead of holding up a worker.
+    """
+
+    def __init__(self, consumer):
+        self.consumer = consumer
+        self._due = {}
+
+    def defer(self, tp, offset, not_before):
+        self.consumer.seek(tp, offset)
+        self.consumer.pause(tp)
+        self._due[tp] = not_before
+
+    def held(self, now=None):
+        """Partitions that must stay paused; the rest are released"""
+        now = now or time.time()
+        for tp in [tp for tp, due in self._due.items() if due <= now]:
+            del self._due[tp]
+        return set(self._due)
+
+    def forget(self, partitions):
+        for tp in partitions:
+            self._due.pop(tp, None)
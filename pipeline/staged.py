@@ -0,0 +1,120 @@
+import logging
+import queue
+import threading
+import traceback
+
+logger = logging.getLogger('kafka-pdf-consumer')
+
+_STOP = object()
+
+class Stage:
+    """
+    One step of the pipeline.
+
+    fn takes a job dict and returns it (possibly updated) and runs on
+    `workers` threads. CPU-bound stages hand their work to a process pool
+    from inside fn (see parser.worker_pool), so the thread count bounds how
+    many jobs that pool sees at once.
+
+    thread_init, if given, is called once per worker thread and its return
+    value is passed to fn as a second argument (e.g. a DB connection).
+    """
+
+    def __init__(self, name, fn, workers=1, thread_init=None, thread_close=None):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.thread_init = thread_init
+        self.thread_close = thread_close
+
+class StagedPipeline:
+    """
+    Runs jobs through a list of stages connected by bounded queues.
+
+    submit() blocks once the first queue is full, which throttles the
+    caller. When a job leaves the last stage, is marked job["skipped"] by
+    a stage, or fails in any stage, on_complete(job, error) is called from
+    a worker thread; error is None on success. on_progress(), if given, is
+    called whenever any stage finishes with a job.
+    """
+
+    def __init__(self, stages, on_complete, queue_size=16, on_progress=None):
+        self.stages = stages
+        self.on_complete = on_complete
+        self.on_progress = on_progress
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self._threads = []
+
+    def start(self):
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                t = threading.Thread(
+                    target=self._worker,
+                    args=(index, stage),
+                    name=f"{stage.name}-{n}",
+                    daemon=True
+                )
+                t.start()
+                self._threads.append(t)
+        logger.info(
+            "🚀 Staged pipeline started: " +
+            ", ".join(f"{s.name}={s.workers}" for s in self.stages)
+        )
+
+    def submit(self, job):
+        self.queues[0].put(job)
+
+    def queue_depths(self):
+        return {stage.name: q.qsize() for stage, q in zip(self.stages, self.queues)}
+
+    def _worker(self, index, stage):
+        inbox = self.queues[index]
+        outbox = self.queues[index + 1] if index + 1 < len(self.queues) else None
+        resource = stage.thread_init() if stage.thread_init else None
+
+        try:
+            while True:
+                job = inbox.get()
+                if job is _STOP:
+                    break
+                try:
+                    if stage.thread_init:
+                        result = stage.fn(job, resource)
+                    else:
+                        result = stage.fn(job)
+                except Exception as e:
+                    logger.error(f"❌ Stage '{stage.name}' failed for {job.get('file_name')}: {e}")
+                    logger.error(traceback.format_exc())
+                    self._progress()
+                    self._complete(job, e)
+                    continue
+
+                self._progress()
+                if outbox is not None and not result.get("skipped"):
+                    outbox.put(result)
+                else:
+                    self._complete(result, None)
+        finally:
+            if stage.thread_close and resource is not None:
+                stage.thread_close(resource)
+
+    def _progress(self):
+        if self.on_progress is not None:
+            self.on_progress()
+
+    def _complete(self, job, error):
+        try:
+            self.on_complete(job, error)
+        except Exception as e:
+            logger.error(f"❌ Completion handler failed for {job.get('file_name')}: {e}")
+
+    def shutdown(self):
+        """Stop accepting work, let queued jobs drain stage by stage, then stop workers"""
+        thread_index = 0
+        for index, stage in enumerate(self.stages):
+            for _ in range(stage.workers):
+                self.queues[index].put(_STOP)
+            for t in self._threads[thread_index:thread_index + stage.workers]:
+                t.join()
+            thread_index += stage.workers
+        logger.info("🛑 Staged pipeline drained")
@@ -0,0 +1,257 @@
+import os
+import logging
+from gcs.downloader import download_pdf_from_gcs, download_pdf_bytes, get_object_fingerprint
+from parser.worker_pool import parse_pdf_document, get_parse_pool
+from db.db_insert import store_in_database, store_documents
+from db.fingerprints import make_fingerprint, is_already_ingested, mark_embedded
+from db.pool import run_with_connection
+from embedding.chunker import chunk_document_data
+from embedding.vector_store import upload_chunks
+from config.settings import PDF_DOWNLOAD_MODE, GCS_DOWNLOAD_CHUNK_BYTES
+from config.settings import SKIP_INGESTED_DOCUMENTS, PARSE_WORKER_MODE
+from config.settings import PIPELINE_DOWNLOAD_WORKERS, PIPELINE_PARSE_WORKERS, PIPELINE_DB_WORKERS, PIPELINE_EMBED_WORKERS
+from pipeline.staged import Stage
+from monitoring.metrics import STAGE_DURATION, BYTES_DOWNLOADED, CHUNKS_PRODUCED
+from monitoring.profiling import run_stage, traced
+
+logger = logging.getLogger('kafka-pdf-consumer')
+
+# A job is a plain dict that travels through the stages below. Each stage
+# reads the keys filled in by the previous one and adds its own:
+#   bucket, file_name, local_path  -> set when the message is decoded (local_path in file mode)
+#   fingerprint                    -> set when the message is decoded, completed by fingerprint_stage
+#   skipped                        -> fingerprint_stage, when this version was already ingested
+#   pdf_bytes                      -> download_stage (memory mode only)
+#   parsed_data                    -> extract_parse_stage
+#   document_id                    -> store_stage (store_batch in batched mode), which also
+#                                     sets fingerprint["replaced"] when an earlier version was replaced
+#   chunk_count                    -> embed_stage (embed_batch in batched mode)
+#                                     the fingerprint is marked embedded after the upsert
+#   trace                          -> set by the consumer while profiling is on (see monitoring.profiling)
+
+def make_job(data, local_dir, partition=None, offset=None):
+    bucket = data.get("bucket")
+    file_name = data.get("file")
+    if not bucket or not file_name:
+        return None
+
+    # Prefix with the Kafka position so two files sharing a basename never
+    # overwrite each other while both are in flight
+    base_name = os.path.basename(file_name)
+    if partition is not None and offset is not None:
+        base_name = f"{partition}-{offset}-{base_name}"
+
+    # GCS notifications carry the object generation and MD5; when the
+    # producer forwards them no extra request is needed to deduplicate
+    job = {
+        "bucket": bucket,
+        "file_name": file_name,
+        "fingerprint": make_fingerprint(bucket, file_name, data.get("generation"), data.get("md5Hash")),
+    }
+    if PDF_DOWNLOAD_MODE != "memory":
+        job["local_path"] = os.path.join(local_dir, base_name)
+    return job
+
+def fingerprint_stage(job):
+    """Mark the job skipped when this object version is already in the database"""
+    if not SKIP_INGESTED_DOCUMENTS:
+        return job
+
+    fingerprint = job["fingerprint"]
+    if fingerprint["generation"] is None and fingerprint["md5_hash"] is None:
+        generation, md5_hash = get_object_fingerprint(job["bucket"], job["file_name"])
+        fingerprint.update(make_fingerprint(job["bucket"], job["file_name"], generation, md5_hash))
+
+    with STAGE_DURATION.time(stage="fingerprint"):
+        already_ingested = run_with_connection(lambda conn: is_already_ingested(conn, fingerprint))
+    if already_ingested:
+        logger.info(f"⏭️ Skipping {job['file_name']}: generation {fingerprint['generation']} already ingested")
+        job["skipped"] = True
+    return job
+
+def download_stage(job):
+    logger.info(f"⬇️ Downloading PDF from GCS: {job['bucket']}/{job['file_name']}")
+    with STAGE_DURATION.time(stage="download"):
+        if "local_path" in job:
+            download_pdf_from_gcs(job["bucket"], job["file_name"], job["local_path"])
+            size = os.path.getsize(job["local_path"])
+        else:
+            # Pin the generation we fingerprinted so a concurrent overwrite can't slip in
+            job["pdf_bytes"] = download_pdf_bytes(
+                job["bucket"], job["file_name"],
+                chunk_size=GCS_DOWNLOAD_CHUNK_BYTES,
+                generation=job["fingerprint"]["generation"]
+            )
+            size = len(job["pdf_bytes"])
+    BYTES_DOWNLOADED.inc(size)
+    return job
+
+def extract_parse_stage(job):
+    logger.info(f"📄 Extracting and parsing PDF text")
+    # Drop the bytes from the job so they are not carried on to later stages
+    source = {
+        "pdf_bytes": job.pop("pdf_bytes", None),
+        "pdf_path": job.get("local_path"),
+        "file_name": job["file_name"],
+    }
+    timings = {}
+    if PARSE_WORKER_MODE == "process":
+        job["parsed_data"] = get_parse_pool().parse(timings=timings, **source)
+    else:
+        job["parsed_data"] = parse_pdf_document(timings=timings, **source)
+    for stage, seconds in timings.items():
+        STAGE_DURATION.observe(seconds, stage=stage)
+    return job
+
+def store_stage(job):
+    logger.info(f"💾 Storing data in PostgreSQL")
+    with STAGE_DURATION.time(stage="db_write"):
+        job["document_id"] = run_with_connection(
+            lambda conn: store_in_database(conn, job["parsed_data"], job["file_name"], fingerprint=job.get("fingerprint"))
+        )
+    return job
+
+def chunk_job(job):
+    parsed_data = job["parsed_data"]
+    logger.info(f"🔗 Chunking document {job['document_id']} for embedding")
+    with STAGE_DURATION.time(stage="chunk"):
+        chunked_data = chunk_document_data({
+            "document_id": job["document_id"],
+            "document_name": job["file_name"],
+            "full_text": parsed_data["full_text"],
+            "comments": parsed_data.get("comments", []),
+            "ratings": parsed_data.get("ratings", []),
+            "professor": parsed_data["course_info"].get("instructor", "Unknown")
+        })
+    CHUNKS_PRODUCED.inc(len(chunked_data))
+    job["chunk_count"] = len(chunked_data)
+    return chunked_data
+
+def embed_stage(job):
+    document_id = job.get("document_id")
+    if not document_id:
+        # store_stage raises on failure, so this is a bug, not a bad document
+        raise RuntimeError(f"No document ID for {job['file_name']}; it was not stored")
+
+    chunked_data = chunk_job(job)
+
+    logger.info(f"📤 Uploading chunks to the vector store")
+    if not upload_chunks(chunked_data, replaced_documents([job])):
+        raise RuntimeError(f"Vector upload failed for document ID {document_id}")
+    record_embedded([job])
+
+    logger.info(f"✅ Vectorized and uploaded document ID {document_id}")
+    return job
+
+def replaced_documents(jobs):
+    """Ids of the documents that were stored over an earlier version and may have stale chunks"""
+    return {job["document_id"] for job in jobs if job.get("fingerprint") and job["fingerprint"].get("replaced")}
+
+def record_embedded(jobs):
+    """
+    Only now does fingerprint_stage skip these versions: a job whose upload
+    failed is stored but not embedded, and is processed again on redelivery
+    """
+    fingerprints = [job["fingerprint"] for job in jobs if job.get("fingerprint")]
+    if fingerprints:
+        run_with_connection(lambda conn: mark_embedded(conn, fingerprints))
+
+def store_batch(jobs):
+    """Write every document of a batch in one transaction"""
+    logger.info(f"💾 Storing {len(jobs)} documents in PostgreSQL")
+    documents = [(job["parsed_data"], job["file_name"], job.get("fingerprint")) for job in jobs]
+    with STAGE_DURATION.time(stage="db_write_batch"):
+        document_ids = run_with_connection(lambda conn: store_documents(conn, documents))
+    for job, document_id in zip(jobs, document_ids):
+        job["document_id"] = document_id
+
+def embed_batch(jobs):
+    """Embed and upsert the chunks of every document of a batch together"""
+    chunks, stored = [], []
+    for job in jobs:
+        if job.get("document_id"):
+            chunks.extend(chunk_job(job))
+            stored.append(job)
+    if not chunks:
+        return
+
+    logger.info(f"📤 Uploading {len(chunks)} chunks from {len(jobs)} documents to the vector store")
+    if not upload_chunks(chunks, replaced_documents(stored)):
+        raise RuntimeError(f"Vector upload failed for a batch of {len(jobs)} documents")
+    record_embedded(stored)
+
+def _run_alone(job, stage_fns):
+    try:
+        for fn in stage_fns:
+            job = fn(job)
+        return job, None
+    except Exception as e:
+        logger.error(f"❌ Error processing file {job['file_name']}: {e}")
+        return job, e
+
+def run_batch(jobs):
+    """
+    Store and embed a batch of parsed jobs together; returns [(job, error)].
+    If the combined step fails, each job is retried on its own, so one bad
+    document can't fail (or hold back the offsets of) the rest.
+    """
+    try:
+        store_batch(jobs)
+    except Exception as e:
+        logger.warning(f"⚠️ Batch write of {len(jobs)} documents failed ({e}); storing them one at a time")
+        return [_run_alone(job, (store_stage, embed_stage)) for job in jobs]
+
+    try:
+        embed_batch(jobs)
+    except Exception as e:
+        logger.warning(f"⚠️ Batch upload of {len(jobs)} documents failed ({e}); uploading them one at a time")
+        return [_run_alone(job, (embed_stage,)) for job in jobs]
+
+    logger.info(f"✅ Stored and vectorized a batch of {len(jobs)} documents")
+    return [(job, None) for job in jobs]
+
+def cleanup_job(job):
+    job.pop("pdf_bytes", None)
+    local_path = job.get("local_path")
+    if local_path and os.path.exists(local_path):
+        os.remove(local_path)
+        logger.info(f"🧹 Removed temporary file: {local_path}")
+
+def run_job(job, progress=None):
+    """Run every stage in order on the calling thread; progress(), if given, is called after each one"""
+    def step(name, fn, job):
+        job = run_stage(name, fn, job)
+        if progress is not None:
+            progress()
+        return job
+
+    try:
+        job = step("fingerprint", fingerprint_stage, job)
+        if job.get("skipped"):
+            return job
+        job = step("download", download_stage, job)
+        job = step("extract_parse", extract_parse_stage, job)
+        job = step("store", store_stage, job)
+        job = step("embed", embed_stage, job)
+        logger.info(f"✅ Successfully processed '{job['file_name']}'")
+        return job
+    finally:
+        cleanup_job(job)
+
+def build_stages(batched=False):
+    """
+    The staged-mode pipeline, in order, sized from config. When batched,
+    it stops after parsing and the jobs go on to a MicroBatcher running
+    run_batch.
+    """
+    stages = [
+        Stage("fingerprint", traced("fingerprint", fingerprint_stage), PIPELINE_DB_WORKERS),
+        Stage("download", traced("download", download_stage), PIPELINE_DOWNLOAD_WORKERS),
+        Stage("extract_parse", traced("extract_parse", extract_parse_stage), PIPELINE_PARSE_WORKERS),
+    ]
+    if not batched:
+        stages += [
+            Stage("store", traced("store", store_stage), PIPELINE_DB_WORKERS),
+            Stage("embed", traced("embed", embed_stage), PIPELINE_EMBED_WORKERS),
+        ]
+    return stages
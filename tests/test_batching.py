@@ -0,0 +1,89 @@
+"""Micro-batched store/embed: a bad document must fail alone, not take its batch with it"""
+import pytest
+
+import db.db_insert as db_insert
+import pipeline.stages as stages
+from benchmarks.fakes import FakeDocumentStore
+from db.fingerprints import make_fingerprint
+
+class FakeCursor:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+class FakeConnection:
+    def cursor(self):
+        return FakeCursor()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+class PoisonedStore(FakeDocumentStore):
+    """Fails any write that includes a document named poison.pdf"""
+
+    def run_with_connection(self, fn, retries=0):
+        return fn(FakeConnection())
+
+    def write_document(self, cursor, document_data, file_name, fingerprint=None):
+        if file_name == "poison.pdf":
+            raise ValueError("value too long for type character varying(255)")
+        return super().store_in_database(None, document_data, file_name, fingerprint)
+
+    def store_documents(self, db_connection, documents):
+        if any(file_name == "poison.pdf" for _, file_name, _ in documents):
+            raise ValueError("value too long for type character varying(255)")
+        return super().store_documents(db_connection, documents)
+
+def parsed_job(file_name):
+    return {
+        "bucket": "b",
+        "file_name": file_name,
+        "fingerprint": make_fingerprint("b", file_name, 1),
+        "parsed_data": {
+            "full_text": f"Full text of {file_name}",
+            "course_info": {"instructor": "Smith"},
+            "comments": [{"question": "What did you like?", "comment_number": 1, "text": "The labs"}],
+            "ratings": [],
+        },
+    }
+
+@pytest.fixture
+def store(monkeypatch):
+    store = PoisonedStore()
+    uploaded = []
+    monkeypatch.setattr(stages, "run_with_connection", store.run_with_connection)
+    # The real single-document path, so its error handling is what's tested
+    monkeypatch.setattr(db_insert, "write_document", store.write_document)
+    monkeypatch.setattr(stages, "store_documents", store.store_documents)
+    monkeypatch.setattr(stages, "mark_embedded", store.mark_embedded)
+    monkeypatch.setattr(stages, "upload_chunks", lambda chunks, replaced=(): uploaded.extend(chunks) or True)
+    store.uploaded = uploaded
+    return store
+
+def test_poisoned_batch_fails_only_the_bad_document(store):
+    jobs = [parsed_job("a.pdf"), parsed_job("poison.pdf"), parsed_job("b.pdf")]
+
+    results = stages.run_batch(jobs)
+
+    failed = [(job["file_name"], error) for job, error in results if error is not None]
+    assert len(results) == 3
+    assert len(failed) == 1
+    assert failed[0][0] == "poison.pdf"
+    assert "too long" in str(failed[0][1])
+    # The others were stored, embedded and marked done
+    assert {doc["full_text"] for doc in store.documents.values()} == {"Full text of a.pdf", "Full text of b.pdf"}
+    assert {chunk["id"].split("_")[0] for chunk in store.uploaded} == {str(jobs[0]["document_id"]), str(jobs[2]["document_id"])}
+    assert len(store.embedded) == 2
+
+def test_clean_batch_is_written_together(store):
+    jobs = [parsed_job("a.pdf"), parsed_job("b.pdf")]
+
+    results = stages.run_batch(jobs)
+
+    assert [error for _, error in results] == [None, None]
+    assert all(job["document_id"] for job in jobs)
+    assert len(store.embedded) == 2
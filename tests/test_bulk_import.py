@@ -0,0 +1,96 @@
+"""Bulk import reruns: whatever failed the first time is imported the second"""
+import json
+
+import pytest
+
+import pipeline.bulk_import as bulk_import
+import pipeline.stages as stages
+from benchmarks.fakes import FakeGCS, FakeDocumentStore
+from benchmarks.synthetic_pdf import generate_corpus
+
+@pytest.fixture
+def services(monkeypatch):
+    gcs = FakeGCS(dict(generate_corpus(3, comments_per_question=2)))
+    store = FakeDocumentStore()
+    uploads = {"fail": True, "chunks": [], "replaced": set()}
+
+    def upload_chunks(chunks, replaced=()):
+        uploads["replaced"].update(replaced)
+        if uploads["fail"]:
+            return False
+        uploads["chunks"].extend(chunks)
+        return True
+
+    monkeypatch.setattr(bulk_import, "list_objects", gcs.list_objects)
+    monkeypatch.setattr(bulk_import, "PDF_DOWNLOAD_MODE", "memory")
+    monkeypatch.setattr(stages, "PDF_DOWNLOAD_MODE", "memory")
+    monkeypatch.setattr(stages, "PARSE_WORKER_MODE", "inline")
+    monkeypatch.setattr(stages, "download_pdf_bytes", gcs.download_pdf_bytes)
+    monkeypatch.setattr(stages, "get_object_fingerprint", gcs.get_object_fingerprint)
+    monkeypatch.setattr(stages, "run_with_connection", store.run_with_connection)
+    monkeypatch.setattr(stages, "store_in_database", store.store_in_database)
+    monkeypatch.setattr(stages, "store_documents", store.store_documents)
+    monkeypatch.setattr(stages, "is_already_ingested", store.is_already_ingested)
+    monkeypatch.setattr(stages, "mark_embedded", store.mark_embedded)
+    monkeypatch.setattr(stages, "upload_chunks", upload_chunks)
+    return gcs, store, uploads
+
+def manifest_statuses(path):
+    with open(path) as f:
+        return [json.loads(line)["status"] for line in f]
+
+@pytest.mark.parametrize("batched", [False, True])
+def test_rerun_after_embed_failure_uploads_the_vectors(services, tmp_path, batched):
+    gcs, store, uploads = services
+    manifest = str(tmp_path / "manifest.jsonl")
+
+    # Rows are written, but every vector upload fails
+    assert not bulk_import.bulk_import("bucket", manifest_path=manifest, batched=batched)
+    assert len(store.documents) == 3
+    assert manifest_statuses(manifest) == ["failed"] * 3
+    # First versions: nothing to clean up, so no stale-chunk listing
+    assert uploads["replaced"] == set()
+
+    uploads["fail"] = False
+    assert bulk_import.bulk_import("bucket", manifest_path=manifest, batched=batched)
+    assert manifest_statuses(manifest)[3:] == ["ok"] * 3
+    # Same documents, replaced in place, now with their vectors
+    assert len(store.documents) == 3
+    assert {chunk["document_id"] for chunk in uploads["chunks"]} == set(store.documents)
+    assert uploads["replaced"] == set(store.documents)
+
+    # A third run has nothing left to do
+    assert bulk_import.bulk_import("bucket", manifest_path=manifest, batched=batched)
+    assert len(manifest_statuses(manifest)) == 6
+
+def test_prefixed_object_names_keep_their_filename_metadata(services, tmp_path):
+    gcs, store, uploads = services
+    uploads["fail"] = False
+    name, pdf_bytes = next(iter(generate_corpus(1, comments_per_question=2)))
+    gcs.put(f"reports/2025/{name}", pdf_bytes)
+    for other in list(gcs.objects):
+        if not other.startswith("reports/"):
+            del gcs.objects[other]
+
+    assert bulk_import.bulk_import("bucket", prefix="reports/", manifest_path=str(tmp_path / "manifest.jsonl"))
+    (document,) = store.documents.values()
+    last_name, first_name, instructor_id, term, course_code, _ = name.split("_")
+    semester, year = term.split("-")
+    assert document["course_info"]["instructor_last_name"] == last_name
+    assert document["course_info"]["instructor_first_name"] == first_name
+    assert document["course_info"]["instructor_id"] == instructor_id
+    assert document["course_info"]["semester"] == semester
+    assert document["course_info"]["year"] == year
+    assert document["course_info"]["course_code"] == course_code
+
+def test_pending_objects_stream_from_the_listing(monkeypatch):
+    name, _ = next(iter(generate_corpus(1)))
+
+    def list_objects(bucket, prefix=None):
+        yield "reports/notes.txt", 1, None
+        yield f"reports/{name}", 2, None
+        raise AssertionError("listed past the first pending report")
+
+    monkeypatch.setattr(bulk_import, "list_objects", list_objects)
+    pending = bulk_import.list_pending("bucket", "reports/", {})
+    assert next(pending)["file"] == f"reports/{name}"
@@ -0,0 +1,33 @@
+"""Single-text embedding with a model other than the configured one"""
+import pytest
+
+import embedding.embedder as embedder
+from embedding.embedder import FakeEmbeddingBackend, get_openai_embedding, set_embedding_backend
+
+@pytest.fixture
+def fake_backend(monkeypatch):
+    monkeypatch.setattr(embedder, "get_embedding_cache", lambda: None)
+    backend = FakeEmbeddingBackend(model="text-embedding-3-small", dimension=32)
+    set_embedding_backend(backend)
+    yield backend
+    set_embedding_backend(None)
+
+def test_other_model_stays_on_the_configured_backend(fake_backend, monkeypatch):
+    def no_openai(*args, **kwargs):
+        raise AssertionError("built an OpenAI backend while the fake one is configured")
+
+    monkeypatch.setattr(embedder, "OpenAIEmbeddingBackend", no_openai)
+    vector = get_openai_embedding("great labs", model="text-embedding-3-large")
+    assert len(vector) == 32
+
+def test_backend_without_model_switching_raises(fake_backend):
+    class FixedBackend:
+        model = "text-embedding-3-small"
+
+        def embed_batch(self, texts):
+            return [[1.0] for _ in texts]
+
+    set_embedding_backend(FixedBackend())
+    with pytest.raises(ValueError):
+        get_openai_embedding("great labs", model="text-embedding-3-large")
+    assert get_openai_embedding("great labs") == [1.0]
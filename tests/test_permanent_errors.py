@@ -0,0 +1,36 @@
+"""Which failures skip the retry topics: matched on the error's type, never its message"""
+import multiprocessing
+
+import parser.worker_pool as worker_pool
+from benchmarks.synthetic_pdf import generate_corpus
+from parser.pdf_text_extractor import DocumentTooLargeError
+from parser.worker_pool import ParseWorkerError
+from pipeline.retry import is_permanent
+
+def run_in_worker(monkeypatch, task):
+    """One task through the worker loop, in this process, over a real pipe"""
+    # The worker's memory limit would apply to the test process itself
+    monkeypatch.setattr(worker_pool, "PARSE_WORKER_MEMORY_LIMIT_MB", 0)
+    parent, child = multiprocessing.Pipe()
+    parent.send(task)
+    parent.send(None)
+    worker_pool._worker_main(child)
+    return parent.recv()
+
+def test_worker_reports_the_original_error_type(monkeypatch):
+    monkeypatch.setattr(worker_pool, "PDF_MAX_TEXT_CHARS", 10)
+    file_name, pdf_bytes = next(iter(generate_corpus(1)))
+    status, (error_type, message) = run_in_worker(monkeypatch, {"pdf_bytes": pdf_bytes, "pdf_path": None, "file_name": file_name})
+
+    assert status == "error"
+    assert error_type == "DocumentTooLargeError"
+    assert is_permanent(ParseWorkerError(message, error_type))
+
+def test_permanent_errors_are_matched_by_type():
+    assert is_permanent(DocumentTooLargeError("too big"))
+    assert is_permanent(ParseWorkerError("too big", "DocumentTooLargeError"))
+
+def test_messages_naming_a_permanent_error_stay_retryable():
+    assert not is_permanent(RuntimeError("upstream raised DocumentTooLargeError, retrying"))
+    assert not is_permanent(ParseWorkerError("Traceback ... DocumentTooLargeError ...", "MemoryError"))
+    assert not is_permanent(ParseWorkerError("parse worker died while processing DocumentTooLargeError.pdf"))
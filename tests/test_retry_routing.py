@@ -0,0 +1,179 @@
+"""
+Failed messages through the consumer loop, against the in-process fake broker:
+retry topics, the dead-letter topic, delayed redelivery and offset commits.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+
+import kafka_pdf_consumer
+from benchmarks.fakes import FakeKafkaBroker, FakeKafkaConsumer, FakeKafkaProducer, FakeTopicPartition
+from pipeline.retry import FailureRouter, DelayedPartitions, retry_topics, read_headers
+from pipeline.retry import ATTEMPT_HEADER, NOT_BEFORE_HEADER, ERROR_HEADER, ERROR_TYPE_HEADER
+from pipeline.retry import ORIGINAL_TOPIC_HEADER, ORIGINAL_PARTITION_HEADER, ORIGINAL_OFFSET_HEADER
+
+TOPIC = "pdf-uploads"
+DLQ = "pdf-uploads.dlq"
+
+class FailingProducer(FakeKafkaProducer):
+    def send(self, topic, value=None, key=None, headers=None, partition=None):
+        raise ConnectionError("broker unavailable")
+
+def make_app(broker, delays=(0.0, 0.0), producer=None):
+    consumer = FakeKafkaConsumer(TOPIC, broker=broker)
+    consumer.subscribe([TOPIC] + retry_topics(TOPIC, delays))
+    app = kafka_pdf_consumer.ConsumerApp()
+    app.consumer = consumer
+    app.delayed = DelayedPartitions(consumer)
+    app.router = FailureRouter(producer or FakeKafkaProducer(broker), base_topic=TOPIC, delays=delays, dlq_topic=DLQ)
+    return app
+
+@contextmanager
+def running(app, timeout=10.0):
+    """Run the poll loop on a thread for the duration of the block"""
+    thread = threading.Thread(target=app.run, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        app.stop()
+        thread.join(timeout)
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.01)
+
+def messages(broker, topic):
+    return [m for tp, log in broker.logs.items() if tp.topic == topic for m in log]
+
+def headers_of(message):
+    return {key: value.decode("utf-8") for key, value in message.headers}
+
+@pytest.fixture(autouse=True)
+def no_metrics(monkeypatch):
+    monkeypatch.setattr(kafka_pdf_consumer, "METRICS_PORT", 0)
+
+def test_failing_message_moves_through_retry_topics_to_dlq(monkeypatch):
+    calls = []
+
+    def run_job(job, progress=None):
+        calls.append(job["retry"]["attempt"])
+        raise RuntimeError("parse exploded")
+
+    monkeypatch.setattr(kafka_pdf_consumer, "run_job", run_job)
+    broker = FakeKafkaBroker(partitions=1)
+    broker.append(TOPIC, b'{"bucket": "b", "file": "report.pdf"}')
+    app = make_app(broker)
+
+    with running(app):
+        wait_for(lambda: messages(broker, DLQ) and app.consumer.drained())
+
+    assert calls == [0, 1, 2]
+    retry_1, = messages(broker, f"{TOPIC}.retry.1")
+    retry_2, = messages(broker, f"{TOPIC}.retry.2")
+    dead, = messages(broker, DLQ)
+    for attempt, message in enumerate((retry_1, retry_2, dead), 1):
+        headers = headers_of(message)
+        assert headers[ATTEMPT_HEADER] == str(attempt)
+        assert headers[ERROR_HEADER] == "parse exploded"
+        assert headers[ERROR_TYPE_HEADER] == "RuntimeError"
+        # Always the position the message first arrived at, not the previous retry topic
+        assert headers[ORIGINAL_TOPIC_HEADER] == TOPIC
+        assert headers[ORIGINAL_PARTITION_HEADER] == "0"
+        assert headers[ORIGINAL_OFFSET_HEADER] == "0"
+        assert message.value == retry_1.value
+    assert float(headers_of(dead)[NOT_BEFORE_HEADER]) == 0
+    # Every copy was handed on, so every topic's offset moved past it
+    assert app.consumer.committed[FakeTopicPartition(TOPIC, 0)] == 1
+    assert app.consumer.committed[FakeTopicPartition(f"{TOPIC}.retry.1", 0)] == 1
+    assert app.consumer.committed[FakeTopicPartition(f"{TOPIC}.retry.2", 0)] == 1
+
+def test_not_before_holds_the_partition_until_due(monkeypatch):
+    handled = []
+    monkeypatch.setattr(kafka_pdf_consumer, "run_job", lambda job, progress=None: handled.append(time.time()))
+    broker = FakeKafkaBroker(partitions=1)
+    due = time.time() + 0.5
+    broker.append(
+        f"{TOPIC}.retry.1", b'{"bucket": "b", "file": "report.pdf"}',
+        headers=[(ATTEMPT_HEADER, b"1"), (NOT_BEFORE_HEADER, str(due).encode())]
+    )
+    app = make_app(broker)
+    retry_tp = FakeTopicPartition(f"{TOPIC}.retry.1", 0)
+
+    with running(app):
+        wait_for(lambda: retry_tp in app.consumer.paused())
+        assert handled == []
+        # Rewound to the held message so it is fetched again once due
+        assert app.consumer.position(retry_tp) == 0
+        assert retry_tp not in app.consumer.committed
+
+        wait_for(lambda: handled and app.consumer.drained())
+    assert handled[0] >= due
+    assert app.consumer.committed[retry_tp] == 1
+
+def test_failed_routing_leaves_the_offset_uncommitted(monkeypatch):
+    def run_job(job, progress=None):
+        if job["file_name"] == "bad.pdf":
+            raise RuntimeError("boom")
+
+    monkeypatch.setattr(kafka_pdf_consumer, "run_job", run_job)
+    broker = FakeKafkaBroker(partitions=1)
+    broker.append(TOPIC, b'{"bucket": "b", "file": "bad.pdf"}')
+    broker.append(TOPIC, b'{"bucket": "b", "file": "good.pdf"}')
+    app = make_app(broker, producer=FailingProducer(broker))
+    tp = FakeTopicPartition(TOPIC, 0)
+
+    with running(app):
+        wait_for(lambda: app.consumer.position(tp) == 2 and app.completed.empty())
+
+    # good.pdf finished, but the commit can't pass bad.pdf, which was neither processed nor handed on
+    assert tp not in app.consumer.committed
+    # Both stay tracked: good.pdf can't be committed past bad.pdf
+    assert app.tracker.in_flight() == 2
+    assert messages(broker, DLQ) == [] and messages(broker, f"{TOPIC}.retry.1") == []
+
+def test_read_headers_defaults_for_first_delivery():
+    assert read_headers([]) == {
+        "attempt": 0, "not_before": 0.0, "original_topic": None,
+        "original_partition": None, "original_offset": None, "error": None,
+    }
+
+def test_lag_is_reported_per_topic_and_partition():
+    broker = FakeKafkaBroker(partitions=1)
+    for _ in range(3):
+        broker.append(TOPIC, b'{"bucket": "b", "file": "report.pdf"}')
+    broker.append(f"{TOPIC}.retry.1", b'{"bucket": "b", "file": "report.pdf"}')
+    app = make_app(broker)
+
+    app.update_consumer_metrics()
+
+    # Partition 0 of the retry topic must not overwrite partition 0 of the main topic
+    lag = kafka_pdf_consumer.KAFKA_LAG
+    assert lag._values[(TOPIC, "0")] == 3
+    assert lag._values[(f"{TOPIC}.retry.1", "0")] == 1
+    assert lag._values[(f"{TOPIC}.retry.2", "0")] == 0
+    assert 'trace_consumer_kafka_lag_messages{topic="pdf-uploads",partition="0"} 3' in lag.render()
+
+def test_replay_leaves_out_positions_the_dlq_record_lacks():
+    from pipeline.replay_dlq import replay
+
+    broker = FakeKafkaBroker(partitions=1)
+    broker.append(DLQ, b'{"file": "a.pdf"}', headers=[(ERROR_HEADER, b"boom"), (ORIGINAL_TOPIC_HEADER, TOPIC.encode())])
+    broker.append(DLQ, b'{"file": "b.pdf"}', headers=[
+        (ERROR_HEADER, b"boom"), (ORIGINAL_TOPIC_HEADER, TOPIC.encode()),
+        (ORIGINAL_PARTITION_HEADER, b"0"), (ORIGINAL_OFFSET_HEADER, b"7"),
+    ])
+    consumer = FakeKafkaConsumer(DLQ, broker=broker, value_deserializer=lambda raw: raw)
+    consumer.subscribe([DLQ])
+
+    assert replay(consumer, FakeKafkaProducer(broker), idle_timeout_ms=10) == 2
+    bare, positioned = messages(broker, TOPIC)
+    assert ORIGINAL_PARTITION_HEADER not in headers_of(bare)
+    assert ORIGINAL_OFFSET_HEADER not in headers_of(bare)
+    assert read_headers(bare.headers)["original_partition"] is None
+    assert headers_of(positioned)[ORIGINAL_PARTITION_HEADER] == "0"
+    assert headers_of(positioned)[ORIGINAL_OFFSET_HEADER] == "7"
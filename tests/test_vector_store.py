@@ -0,0 +1,56 @@
+"""Replacing a document's chunks in both vector store backends"""
+import pytest
+
+import embedding.pinecone_uploader as pinecone_uploader
+from benchmarks.fakes import FakePinecone
+from embedding.chunker import chunk_document_data
+from embedding.embedder import FakeEmbeddingBackend, set_embedding_backend
+from embedding.local_vector_store import LocalVectorStore
+from embedding.profile import EmbeddingProfile
+
+def document(document_id, comment_count):
+    return {
+        "document_id": document_id,
+        "document_name": "report.pdf",
+        "full_text": "Course evaluation",
+        "comments": [
+            {"question": "What did you like?", "comment_number": n, "text": "The weekly labs were great. " * 40}
+            for n in range(comment_count)
+        ],
+        "ratings": [],
+        "professor": "Smith",
+    }
+
+@pytest.fixture(params=["local", "pinecone"])
+def store(request, tmp_path, monkeypatch):
+    set_embedding_backend(FakeEmbeddingBackend(dimension=64))
+    if request.param == "local":
+        store = LocalVectorStore(str(tmp_path), dimension=64)
+    else:
+        FakePinecone.reset()
+        FakePinecone.indexes["test"] = 64
+        monkeypatch.setattr(pinecone_uploader, "Pinecone", FakePinecone)
+        store = pinecone_uploader.PineconeUploader("test", "key", "us-east-1", profile=EmbeddingProfile("test", 64))
+    yield store
+    store.close()
+    set_embedding_backend(None)
+
+def test_rechunking_into_fewer_parts_deletes_the_surplus(store):
+    long_version = chunk_document_data(document(7, 40))
+    neighbour = chunk_document_data(document(70, 40))
+    assert store.upload_chunks(long_version) and store.upload_chunks(neighbour)
+
+    short_version = chunk_document_data(document(7, 2))
+    assert len(short_version) < len(long_version)
+    assert store.upload_chunks(short_version, replaced={7})
+
+    assert sorted(store.list_document_ids(7)) == sorted(chunk["id"] for chunk in short_version)
+    # Document 70's ids share the "7" digit but not the "7_" prefix
+    assert sorted(store.list_document_ids(70)) == sorted(chunk["id"] for chunk in neighbour)
+
+def test_new_documents_are_not_listed_for_stale_chunks(store, monkeypatch):
+    def list_document_ids(document_id):
+        raise AssertionError("listed a document that replaced nothing")
+
+    monkeypatch.setattr(store, "list_document_ids", list_document_ids)
+    assert store.upload_chunks(chunk_document_data(document(8, 3)))